@@ -1,6 +1,8 @@
 import argparse
 import os
 from utils import crop_geotiff, dividir_treino_teste_geotiff
+from instrumentation import Metricas, adicionar_argumentos
+from grade import adicionar_argumentos_vazios
 
 
 def main():
@@ -36,6 +38,38 @@ def main():
         help="Porcentagem de sobreposição entre tiles (0.0–0.9). Padrão = 0.2."
     )
 
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Número de processos usados no tiling (cada um abre o GeoTIFF uma única vez). Padrão = 1."
+    )
+
+    parser.add_argument(
+        "--completar-bordas",
+        action="store_true",
+        help="Gera tiles com padding nas bordas direita/inferior para cobrir todo o raster."
+    )
+
+    adicionar_argumentos_vazios(
+        parser,
+        "Não grava tiles com fração de pixels válidos (nodata/alfa) abaixo de --fracao-valida-minima."
+    )
+
+    parser.add_argument(
+        "--retomar",
+        action="store_true",
+        help="Registra os tiles gravados em um diário na pasta de saída e, ao rodar de novo, pula os já concluídos."
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Guarda o hash dos pixels de cada tile e, quando o ortomosaico for atualizado, só regrava os tiles que mudaram."
+    )
+
+    adicionar_argumentos(parser)
+
     # Modo de treino/teste
     parser.add_argument(
         "--train",
@@ -57,11 +91,17 @@ def main():
     tile_size = args.tile_size
     overlap = args.overlap
     train_mode = args.train
+    workers = args.workers
+    completar_bordas = args.completar_bordas
+    fracao_valida_minima = args.fracao_valida_minima if args.pular_vazios else None
+    retomar = args.retomar
+    incremental = args.incremental
 
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"Arquivo de entrada não encontrado: {input_path}")
 
     os.makedirs(output_dir, exist_ok=True)
+    metricas = Metricas("tiling", args.metricas_log, args.metricas_prometheus)
 
     if train_mode:
         # Faz a divisão entre treino e teste
@@ -70,23 +110,34 @@ def main():
         train_path = os.path.join(output_dir, "train.tif")
         test_path = os.path.join(output_dir, "test.tif")
 
-        dividir_treino_teste_geotiff(input_path, train_path, test_path, eixo=train_mode)
+        # Ao retomar, reaproveita a divisão anterior (se for mais nova que a entrada): regravá-la
+        # mudaria a impressão digital de train.tif/test.tif e invalidaria o diário dos tiles
+        if retomar and all(os.path.exists(p) and os.path.getmtime(p) >= os.path.getmtime(input_path)
+                           for p in (train_path, test_path)):
+            print("⏩ Reaproveitando a divisão treino/teste de uma execução anterior.")
+        else:
+            dividir_treino_teste_geotiff(input_path, train_path, test_path, eixo=train_mode)
 
         # Gera tiles para ambos
         print("🧩 Gerando tiles da base de treino...")
-        crop_geotiff(train_path, os.path.join(output_dir, "tiles_train"), tile_size, overlap)
+        crop_geotiff(train_path, os.path.join(output_dir, "tiles_train"), tile_size, overlap, workers, completar_bordas, metricas,
+                     fracao_valida_minima, retomar, incremental)
 
         print("🧩 Gerando tiles da base de teste...")
-        crop_geotiff(test_path, os.path.join(output_dir, "tiles_test"), tile_size, overlap)
+        crop_geotiff(test_path, os.path.join(output_dir, "tiles_test"), tile_size, overlap, workers, completar_bordas, metricas,
+                     fracao_valida_minima, retomar, incremental)
 
         print("✅ Processo concluído: treino e teste gerados em", output_dir)
 
     else:
         # Apenas gera tiles da imagem inteira
         print(f"✂️ Gerando tiles do GeoTIFF completo: {input_path}")
-        crop_geotiff(input_path, output_dir, tile_size, overlap)
+        crop_geotiff(input_path, output_dir, tile_size, overlap, workers, completar_bordas, metricas,
+                     fracao_valida_minima, retomar, incremental)
         print(f"✅ Tiles salvos em: {output_dir}")
 
+    metricas.finalizar()
+
 
 
 if __name__ == "__main__":
@@ -1,5 +1,8 @@
 import os
+import csv
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import rasterio
 from rasterio.windows import Window
 from rasterio.merge import merge
@@ -7,8 +10,16 @@ from rasterio.enums import Resampling
 from rasterio.transform import from_origin
 from rasterio.errors import NotGeoreferencedWarning
 
+from instrumentation import Metricas
+from grade import fracao_valida, posicoes_grade
+from diario import NOME_DIARIO, NOME_INDICE, Diario, IndiceConteudo, escrever_atomico, hash_conteudo, impressao_digital
 
 
+
+MANIFESTO_NOME = "manifest.csv"
+MANIFESTO_CAMPOS = ["arquivo", "x", "y", "largura", "altura", "largura_valida", "altura_valida",
+                    "a", "b", "c", "d", "e", "f", "largura_raster", "altura_raster"]
+
 # Suprime avisos de arquivos sem georreferência — serão tratados manualmente
 warnings.filterwarnings("ignore", category=NotGeoreferencedWarning)
 
@@ -51,7 +62,96 @@ def list_tif_files(directory):
         
 # ============================================================
 
-def crop_geotiff(input_tif, output_dir, tile_size=1024, overlap=0.2):
+def _escrever_tile(src, x, y, tile_size, output_dir, crs, transform, metricas, anteriores=None):
+    """
+    Lê a janela (x, y) do dataset aberto e grava o tile GeoTIFF correspondente.
+    Retorna o hash dos pixels do tile. Se `anteriores` (janela -> hash de uma execução
+    anterior) tiver o mesmo hash e o tile existir, o arquivo não é regravado.
+    """
+    window = Window(x, y, tile_size, tile_size)
+
+    # Tiles de borda ultrapassam o raster: a leitura fora dos limites é preenchida com zeros
+    with metricas.medir("leitura", tile=f"{x}_{y}"):
+        if x + tile_size > src.width or y + tile_size > src.height:
+            tile_data = src.read(window=window, boundless=True, fill_value=0)
+        else:
+            tile_data = src.read(window=window)
+    metricas.contar("bytes_lidos", tile_data.nbytes)
+
+    conteudo = hash_conteudo(tile_data)
+    tile_path = os.path.join(output_dir, f"tile_{x}_{y}.tif")
+    if anteriores is not None and anteriores.get(f"{x}_{y}") == conteudo and os.path.exists(tile_path):
+        # Mantém o arquivo (e a data de modificação): estágios seguintes com --retomar reaproveitam a máscara
+        metricas.contar("tiles_inalterados")
+        return conteudo
+
+    profile = src.profile.copy()
+    profile.update({
+        "height": tile_size,
+        "width": tile_size,
+        "transform": rasterio.windows.transform(window, transform),
+        "crs": crs
+    })
+
+    def escrever(path):
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(tile_data)
+
+    with metricas.medir("escrita", tile=f"{x}_{y}"):
+        escrever_atomico(tile_path, escrever)
+    metricas.contar("bytes_escritos", os.path.getsize(tile_path))
+    metricas.contar("tiles")
+    return conteudo
+
+
+# Estado de cada processo do pool: o GeoTIFF de entrada é aberto uma única vez por worker
+_worker = {}
+
+
+def _iniciar_worker(input_tif, output_dir, tile_size, anteriores=None):
+    src = rasterio.open(input_tif)
+    crs, transform = ensure_georeference(src)
+    _worker.update(src=src, crs=crs, transform=transform, output_dir=output_dir, tile_size=tile_size,
+                   anteriores=anteriores)
+
+
+def _processar_linhas(coords):
+    """
+    Grava uma partição (lista de coordenadas x, y) do grid usando o dataset do worker.
+    Retorna o número de tiles, o resumo das métricas e os hashes dos tiles da partição.
+    """
+    metricas = Metricas("tiling")
+    hashes = {}
+    for x, y in coords:
+        hashes[f"{x}_{y}"] = _escrever_tile(_worker["src"], x, y, _worker["tile_size"], _worker["output_dir"],
+                                            _worker["crs"], _worker["transform"], metricas, _worker["anteriores"])
+    return len(coords), metricas.resumo(), hashes
+
+
+def escrever_manifesto(manifest_path, coords, tile_size, width, height, transform):
+    """
+    Grava o manifesto CSV dos tiles: arquivo, janela no raster, região válida
+    (sem padding), o transform de cada tile e o tamanho do raster de entrada. O tamanho
+    vai em todas as linhas porque tiles pulados (fracao_valida_minima) não entram no
+    manifesto e os restantes podem não chegar às bordas direita/inferior.
+    """
+    def escrever(path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(MANIFESTO_CAMPOS)
+            for x, y in coords:
+                t = rasterio.windows.transform(Window(x, y, tile_size, tile_size), transform)
+                writer.writerow([
+                    f"tile_{x}_{y}.tif", x, y, tile_size, tile_size,
+                    min(tile_size, width - x), min(tile_size, height - y),
+                    t.a, t.b, t.c, t.d, t.e, t.f, width, height
+                ])
+
+    escrever_atomico(manifest_path, escrever)
+
+
+def crop_geotiff(input_tif, output_dir, tile_size=1024, overlap=0.2, workers=1, completar_bordas=False, metricas=None,
+                 fracao_valida_minima=None, retomar=False, incremental=False):
     """
     Divide um arquivo GeoTIFF em tiles menores, mantendo georreferência.
     Caso o arquivo não seja georreferenciado, aplica CRS/transform fictícios.
@@ -61,48 +161,128 @@ def crop_geotiff(input_tif, output_dir, tile_size=1024, overlap=0.2):
     - output_dir: pasta onde os tiles serão salvos
     - tile_size: tamanho (em pixels) de cada tile
     - overlap: porcentagem de sobreposição entre tiles (0.0–0.9)
+    - workers: número de processos; com mais de 1, as linhas do grid são divididas
+      entre processos, cada um abrindo o GeoTIFF de entrada uma única vez
+    - completar_bordas: gera tiles com padding nas bordas direita/inferior, para
+      que nenhuma faixa do raster fique de fora
+    - metricas: instância de Metricas (instrumentation.py) que recebe os tempos de
+      leitura/escrita e os contadores; com workers > 1, os resumos dos processos são mesclados
+    - fracao_valida_minima: se informado, tiles com fração de pixels válidos (máscara de
+      nodata/alfa do raster) abaixo desse valor não são gravados nem entram no manifesto
+    - retomar: registra os tiles gravados no diário (.diario.jsonl) da pasta de saída e
+      pula os que uma execução anterior com os mesmos parâmetros e a mesma entrada já gravou
+    - incremental: grava o hash dos pixels de cada tile em um índice (indice_tiles.json) na
+      pasta de saída; quando o ortomosaico é atualizado, tiles com o mesmo conteúdo não são
+      regravados (mantêm a data de modificação, e a inferência com --retomar reaproveita a máscara)
+
+    Um manifesto (manifest.csv) com a janela, a região válida e o transform de
+    cada tile e o tamanho do raster é salvo junto com os tiles.
     """
     os.makedirs(output_dir, exist_ok=True)
+    metricas = metricas or Metricas("tiling")
 
     with rasterio.open(input_tif) as src:
         crs, transform = ensure_georeference(src)
         w, h = src.width, src.height
 
         stride = int(tile_size * (1 - overlap))
-        count = 0
-
-        for y in range(0, h - tile_size + 1, stride):
-            for x in range(0, w - tile_size + 1, stride):
-                window = Window(x, y, tile_size, tile_size)
-                tile_data = src.read(window=window)
-
-                profile = src.profile.copy()
-                profile.update({
-                    "height": tile_size,
-                    "width": tile_size,
-                    "transform": rasterio.windows.transform(window, transform),
-                    "crs": crs
-                })
-
-                tile_path = os.path.join(output_dir, f"tile_{x}_{y}.tif")
-                with rasterio.open(tile_path, "w", **profile) as dst:
-                    dst.write(tile_data)
-
-                count += 1
+        xs = posicoes_grade(w, tile_size, stride, completar_bordas=completar_bordas)
+        ys = posicoes_grade(h, tile_size, stride, completar_bordas=completar_bordas)
+        linhas = [[(x, y) for x in xs] for y in ys]
+
+        if fracao_valida_minima is not None:
+            total = sum(len(coords) for coords in linhas)
+            linhas = [[(x, y) for x, y in coords
+                       if fracao_valida(src, Window(x, y, tile_size, tile_size)) >= fracao_valida_minima]
+                      for coords in linhas]
+            linhas = [coords for coords in linhas if coords]
+            pulados = total - sum(len(coords) for coords in linhas)
+            metricas.contar("tiles_pulados", pulados)
+            print(f"⏭️ {pulados} de {total} tiles sem dados (nodata/alfa) não serão gravados.")
+
+    todos = [c for coords in linhas for c in coords]
+    indice, anteriores, hashes = None, None, {}
+    if incremental:
+        with rasterio.open(input_tif) as src:
+            parametros = {"tile_size": tile_size, "overlap": overlap, "completar_bordas": completar_bordas,
+                          "largura": w, "altura": h, "transform": list(transform)[:6], "crs": str(crs),
+                          "perfil": [src.count, src.dtypes[0], src.nodata]}
+        indice = IndiceConteudo(os.path.join(output_dir, NOME_INDICE), parametros)
+        anteriores = indice.anteriores
+        inalterados_antes = metricas.contadores.get("tiles_inalterados", 0)
+
+    diario = None
+    if retomar:
+        entrada = impressao_digital(input_tif)
+        parametros = {"entrada": os.path.abspath(input_tif), "tile_size": tile_size, "overlap": overlap,
+                      "completar_bordas": completar_bordas, "fracao_valida_minima": fracao_valida_minima}
+        diario = Diario(os.path.join(output_dir, NOME_DIARIO), parametros)
+
+        linhas = [[(x, y) for x, y in coords
+                   if not diario.concluido(f"{x}_{y}", entrada, os.path.join(output_dir, f"tile_{x}_{y}.tif"))]
+                  for coords in linhas]
+        linhas = [coords for coords in linhas if coords]
+        retomados = len(todos) - sum(len(coords) for coords in linhas)
+        if retomados:
+            metricas.contar("tiles_retomados", retomados)
+            print(f"⏩ {retomados} tiles já gravados em uma execução anterior (diário), retomando...")
+
+    def registrar(coords):
+        if diario:
+            for x, y in coords:
+                diario.registrar(f"{x}_{y}", entrada)
+
+    count = 0
+    try:
+        if workers <= 1:
+            with rasterio.open(input_tif) as src:
+                for coords in linhas:
+                    for x, y in coords:
+                        hashes[f"{x}_{y}"] = _escrever_tile(src, x, y, tile_size, output_dir, crs, transform,
+                                                            metricas, anteriores)
+                        registrar([(x, y)])
+                        count += 1
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker,
+                                     initargs=(input_tif, output_dir, tile_size, anteriores)) as pool:
+                for coords, (n, resumo, parcial) in zip(linhas, pool.map(_processar_linhas, linhas)):
+                    registrar(coords)
+                    count += n
+                    hashes.update(parcial)
+                    metricas.mesclar(resumo)
+    finally:
+        if diario:
+            diario.fechar()
+
+    if indice:
+        # Tiles pulados pelo diário mantêm o hash registrado anteriormente
+        indice.salvar({f"{x}_{y}": hashes.get(f"{x}_{y}", anteriores.get(f"{x}_{y}")) for x, y in todos})
+        inalterados = metricas.contadores.get("tiles_inalterados", 0) - inalterados_antes
+        print(f"♻️ {inalterados} tiles com o mesmo conteúdo da execução anterior não foram regravados.")
+
+    manifest_path = os.path.join(output_dir, MANIFESTO_NOME)
+    escrever_manifesto(manifest_path, todos, tile_size, w, h, transform)
 
     print(f"✅ {count} tiles gerados em {output_dir}")
 
 
 
-def reconstruir_tif_segmentado(tiles_dir, output_path):
+def reconstruir_tif_segmentado(tiles_dir, output_path, janelado=False):
     """
     Reconstrói um mosaico GeoTIFF a partir de tiles segmentados.
     Se os tiles não tiverem CRS/transform válidos, aplica valores fictícios.
+
+    Com janelado=True o GeoTIFF de saída (tiled, comprimido) é criado antes e cada
+    tile é combinado (máximo) na sua janela, mantendo apenas um tile em memória.
     """
     tile_files = list_tif_files(tiles_dir)
     if not tile_files:
         raise ValueError("Nenhum tile encontrado no diretório especificado!")
 
+    if janelado:
+        reconstruir_tif_janelado(tile_files, output_path)
+        return
+
     print(f"🧩 Encontrados {len(tile_files)} tiles segmentados. Iniciando merge...")
 
     src_files_to_mosaic = []
@@ -135,6 +315,55 @@ def reconstruir_tif_segmentado(tiles_dir, output_path):
     print(f"✅ Mosaico reconstruído salvo em: {output_path}")
 
 
+def reconstruir_tif_janelado(tile_files, output_path):
+    """
+    Reconstrói o mosaico escrevendo tile a tile em janelas do GeoTIFF de saída,
+    com o mesmo critério de combinação (máximo) usado no merge em memória.
+    """
+    print(f"🧩 Encontrados {len(tile_files)} tiles segmentados. Iniciando reconstrução janelada...")
+
+    # 1ª passada: apenas cabeçalhos, para calcular a extensão total do mosaico
+    left = bottom = float("inf")
+    right = top = float("-inf")
+    for fp in tile_files:
+        with rasterio.open(fp) as src:
+            b = src.bounds
+            left, bottom = min(left, b.left), min(bottom, b.bottom)
+            right, top = max(right, b.right), max(top, b.top)
+
+    with rasterio.open(tile_files[0]) as src:
+        crs, transform0 = ensure_georeference(src)
+        out_meta = src.meta.copy()
+
+    xres, yres = transform0.a, -transform0.e
+    out_transform = from_origin(left, top, xres, yres)
+
+    out_meta.update({
+        "driver": "GTiff",
+        "height": int(round((top - bottom) / yres)),
+        "width": int(round((right - left) / xres)),
+        "transform": out_transform,
+        "crs": crs,
+        "compress": "lzw",
+        "tiled": True,
+        "blockxsize": 256,
+        "blockysize": 256
+    })
+
+    # 2ª passada: cada tile é combinado na sua janela do mosaico
+    with rasterio.open(output_path, "w+", **out_meta) as dest:
+        for fp in tile_files:
+            with rasterio.open(fp) as src:
+                window = rasterio.windows.from_bounds(*src.bounds, transform=out_transform)
+                window = window.round_offsets().round_lengths()
+                tile = src.read()
+
+            atual = dest.read(window=window)
+            dest.write(np.maximum(atual, tile), window=window)
+
+    print(f"✅ Mosaico reconstruído salvo em: {output_path}")
+
+
 def dividir_treino_teste_geotiff(input_tif, output_train, output_test, eixo="vertical"):
     """
     Divide um GeoTIFF em duas partes (treino e teste),
@@ -174,8 +403,12 @@ def dividir_treino_teste_geotiff(input_tif, output_train, output_test, eixo="ver
             })
 
             data = src.read(window=window)
-            with rasterio.open(output_path, "w", **meta) as dst:
-                dst.write(data)
+
+            def escrever(path):
+                with rasterio.open(path, "w", **meta) as dst:
+                    dst.write(data)
+
+            escrever_atomico(output_path, escrever)
             print(f"✅ {nome} salvo em: {output_path}")
 
     print("🧩 Divisão concluída — arquivos prontos para gerar tiles.")
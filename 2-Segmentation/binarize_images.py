@@ -1,5 +1,6 @@
 import argparse
 from utils import GLICalculator, ThresholdMaskGenerator, GLIMaskPipeline
+from instrumentation import Metricas, adicionar_argumentos
 
 def main():
     parser = argparse.ArgumentParser(
@@ -9,14 +10,25 @@ def main():
     parser.add_argument("--input", required=True, help="Diretório contendo as imagens de entrada")
     parser.add_argument("--output", default="output_gli", help="Diretório para salvar as máscaras")
     parser.add_argument("--limiar", type=int, default=150, help="Valor de threshold (0–255) para segmentação")
+    parser.add_argument(
+        "--normalizacao",
+        choices=GLICalculator.NORMALIZACOES,
+        default="tile",
+        help="Mapeamento do GLI para 0–255: min/max por tile, faixa fixa [-1, 1] ou min/max global (duas passadas)"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Número de processos para gerar as máscaras em paralelo")
+    parser.add_argument("--retomar", action="store_true", help="Registra as máscaras geradas em um diário e, ao rodar de novo, pula as já concluídas")
+    adicionar_argumentos(parser)
 
     args = parser.parse_args()
 
-    processor = GLICalculator()
+    processor = GLICalculator(normalizacao=args.normalizacao)
     mask_generator = ThresholdMaskGenerator(threshold_value=args.limiar)
-    pipeline = GLIMaskPipeline(processor, mask_generator)
+    metricas = Metricas("gli", args.metricas_log, args.metricas_prometheus)
+    pipeline = GLIMaskPipeline(processor, mask_generator, metricas)
 
-    pipeline.run(args.input, args.output)
+    pipeline.run(args.input, args.output, workers=args.workers, retomar=args.retomar)
+    metricas.finalizar()
 
 
 if __name__ == "__main__":
@@ -1,7 +1,13 @@
 import cv2
 import numpy as np
 import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from instrumentation import Metricas
+from diario import NOME_DIARIO, Diario, escrever_atomico, impressao_digital
 
 # Interfaces
 
@@ -11,6 +17,19 @@ class ImageProcessor(ABC):
     def process(self, image: np.ndarray) -> np.ndarray:
         pass
 
+    def process_batch(self, images: np.ndarray) -> np.ndarray:
+        """Processa um lote (N, H, W, C). Por padrão, imagem a imagem."""
+        return np.stack([self.process(img) for img in images])
+
+    @property
+    def precisa_ajuste(self) -> bool:
+        """Indica se o processador precisa de uma passada prévia (ajustar) sobre os dados."""
+        return False
+
+    def ajustar(self, images: Iterable[np.ndarray]) -> None:
+        """Passada prévia opcional sobre todas as imagens (ex.: estatísticas globais)."""
+        pass
+
 
 class MaskGenerator(ABC):
     """Interface base para geradores de máscara."""
@@ -22,16 +41,85 @@ class MaskGenerator(ABC):
 # Implementação do calculo de GLI e geração de máscara
 
 class GLICalculator(ImageProcessor):
-    """Calcula o índice GLI (Green Leaf Index) a partir de uma imagem RGB."""
+    """
+    Calcula o índice GLI (Green Leaf Index) a partir de uma imagem RGB.
+
+    O GLI é calculado a partir de somas inteiras dos canais e mapeado para 0–255
+    conforme a normalização escolhida:
+    - "tile": min/max de cada imagem (comportamento original; o limiar muda de
+      significado a cada tile). Calculado em float64 com cv2.normalize, exatamente
+      como antes, para que as máscaras já geradas sejam reproduzidas pixel a pixel;
+    - "fixa": faixa fixa do GLI (padrão [-1, 1]), igual para todos os tiles;
+    - "global": min/max de todas as imagens, calculado numa primeira passada (ajustar).
+    Os modos "fixa" e "global" são calculados em float32.
+    """
+
+    NORMALIZACOES = ("tile", "fixa", "global")
+
+    def __init__(self, normalizacao: str = "tile", faixa: Optional[Tuple[float, float]] = None):
+        if normalizacao not in self.NORMALIZACOES:
+            raise ValueError(f"Normalização inválida: {normalizacao}. Use uma de {self.NORMALIZACOES}.")
+
+        self.normalizacao = normalizacao
+        if faixa is None and normalizacao == "fixa":
+            faixa = (-1.0, 1.0)
+        self.faixa = faixa
+
+    @staticmethod
+    def indice(images: np.ndarray, dtype=np.float32) -> np.ndarray:
+        """GLI (em float32 ou float64) para imagens (..., H, W, 3) RGB uint8."""
+        img = images.astype(np.int16)
+        rb = img[..., 0] + img[..., 2]
+        g2 = img[..., 1] * 2
+
+        gli = (g2 - rb).astype(dtype)
+        den = (g2 + rb).astype(dtype)
+        den += dtype(1e-6)
+        gli /= den
+        return gli
+
+    @property
+    def precisa_ajuste(self) -> bool:
+        return self.normalizacao == "global" and self.faixa is None
+
+    def ajustar(self, images: Iterable[np.ndarray]) -> None:
+        """Primeira passada (em streaming) para obter o min/max global do GLI."""
+        lo, hi = np.inf, -np.inf
+        for img in images:
+            gli = self.indice(img)
+            lo, hi = min(lo, float(gli.min())), max(hi, float(gli.max()))
+
+        if lo > hi:
+            raise ValueError("Nenhuma imagem fornecida para o ajuste da faixa global do GLI.")
+        self.faixa = (lo, hi)
 
     def process(self, image: np.ndarray) -> np.ndarray:
         if image is None or len(image.shape) < 3:
             raise ValueError("Imagem inválida — é necessário um array RGB.")
 
-        R, G, B = image[:, :, 0].astype(float), image[:, :, 1].astype(float), image[:, :, 2].astype(float)
-        GLI = (2 * G - R - B) / (2 * G + R + B + 1e-6)
-        GLI_norm = cv2.normalize(GLI, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-        return GLI_norm
+        return self.process_batch(image[np.newaxis])[0]
+
+    def process_batch(self, images: np.ndarray) -> np.ndarray:
+        """Processa um lote (N, H, W, 3) RGB de uma vez. Retorna (N, H, W) uint8."""
+        if images.ndim != 4 or images.shape[-1] < 3:
+            raise ValueError("Lote inválido — é necessário um array (N, H, W, 3).")
+
+        if self.normalizacao == "tile":
+            # Mesmas operações da versão original (float64 + cv2.normalize): em float32, ~1% dos
+            # pixels mudariam 1 nível de cinza e poderiam cruzar o limiar
+            gli = self.indice(images[..., :3], np.float64)
+            return np.stack([cv2.normalize(g, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8) for g in gli])
+
+        if self.faixa is None:
+            raise ValueError("Faixa global do GLI não calculada — chame ajustar() antes.")
+        gli = self.indice(images[..., :3])
+        lo, hi = np.float32(self.faixa[0]), np.float32(self.faixa[1])
+
+        escala = np.where(hi > lo, np.float32(255) / np.maximum(hi - lo, np.float32(1e-12)), np.float32(0))
+        gli -= lo
+        gli *= escala
+        np.clip(gli, 0, 255, out=gli)
+        return gli.astype(np.uint8)
 
 
 class ThresholdMaskGenerator(MaskGenerator):
@@ -50,11 +138,78 @@ class ThresholdMaskGenerator(MaskGenerator):
 class GLIMaskPipeline:
     """Gerencia o fluxo completo de processamento GLI → Máscara."""
 
-    def __init__(self, processor: ImageProcessor, mask_generator: MaskGenerator):
+    def __init__(self, processor: ImageProcessor, mask_generator: MaskGenerator, metricas: Optional[Metricas] = None):
         self.processor = processor
         self.mask_generator = mask_generator
+        self.metricas = metricas or Metricas("gli")
+
+    @staticmethod
+    def _ler_imagens(input_dir: str, arquivos: List[str]) -> Iterator[np.ndarray]:
+        """Decodifica as imagens em RGB, uma por vez."""
+        for nome in arquivos:
+            img = cv2.imread(os.path.join(input_dir, nome))
+            if img is not None:
+                yield cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+    def gerar_mascara(self, image: np.ndarray) -> np.ndarray:
+        """GLI → máscara para uma imagem RGB já decodificada."""
+        with self.metricas.medir("gli"):
+            gli = self.processor.process(image)
+        with self.metricas.medir("limiar"):
+            return self.mask_generator.generate(gli)
 
-    def run(self, input_dir: str, output_dir: str = "output_gli") -> None:
+    def stream(self, images: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        """
+        Gera as máscaras de um iterável de imagens RGB (ex.: janelas lidas de um raster),
+        sem passar pelo disco. Yields uma máscara por imagem, na mesma ordem.
+        """
+        if self.processor.precisa_ajuste:
+            raise ValueError("O processador precisa de ajuste prévio (ajustar) antes do modo streaming.")
+
+        for image in images:
+            yield self.gerar_mascara(image)
+
+    @staticmethod
+    def caminho_mascara(output_dir: str, nome: str) -> str:
+        return os.path.join(output_dir, f"{os.path.splitext(nome)[0]}_mask.png")
+
+    def parametros(self) -> dict:
+        """Parâmetros que determinam as máscaras (registrados no diário do job)."""
+        return {type(obj).__name__: vars(obj) for obj in (self.processor, self.mask_generator)}
+
+    def processar_arquivo(self, input_dir: str, output_dir: str, nome: str) -> Optional[str]:
+        """Lê, segmenta e salva a máscara de um arquivo. Retorna o caminho salvo ou None se falhar a leitura."""
+        # Leitura dos bytes e decodificação separadas, para medir I/O e cv2 independentemente
+        with self.metricas.medir("leitura", tile=nome):
+            dados = np.fromfile(os.path.join(input_dir, nome), dtype=np.uint8)
+        self.metricas.contar("bytes_lidos", dados.nbytes)
+
+        with self.metricas.medir("decodificacao", tile=nome):
+            img = cv2.imdecode(dados, cv2.IMREAD_COLOR)
+            if img is None:
+                return None
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+        mask = self.gerar_mascara(img)
+
+        with self.metricas.medir("codificacao", tile=nome):
+            _, png = cv2.imencode(".png", mask)
+
+        mask_path = self.caminho_mascara(output_dir, nome)
+        with self.metricas.medir("escrita", tile=nome):
+            escrever_atomico(mask_path, png.tofile)
+        self.metricas.contar("bytes_escritos", png.nbytes)
+        self.metricas.contar("tiles")
+        return mask_path
+
+    def run(self, input_dir: str, output_dir: str = "output_gli", workers: int = 1, chunksize: int = 16,
+            retomar: bool = False) -> None:
+        """
+        Processa todas as imagens do diretório. Com workers > 1, a lista de arquivos é
+        dividida em blocos de `chunksize` imagens, distribuídos entre processos.
+        Com retomar=True, as máscaras gravadas são registradas no diário (.diario.jsonl)
+        da pasta de saída e as já concluídas por uma execução anterior são puladas.
+        """
         os.makedirs(output_dir, exist_ok=True)
 
         valid_ext = (".tif", ".tiff", ".jpg", ".jpeg", ".png")
@@ -66,21 +221,73 @@ class GLIMaskPipeline:
 
         print(f"🧩 {len(arquivos)} imagens encontradas. Iniciando processamento...")
 
-        for nome in arquivos:
-            caminho = os.path.join(input_dir, nome)
-            img = cv2.imread(caminho)
-            if img is None:
-                print(f"⚠️ Erro ao ler {nome}, pulando...")
-                continue
+        blocos = [arquivos[i:i + chunksize] for i in range(0, len(arquivos), chunksize)]
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        diario = None
 
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            gli = self.processor.process(img_rgb)
-            mask = self.mask_generator.generate(gli)
+        try:
+            # A faixa global é calculada antes de abrir o diário: ela faz parte dos parâmetros
+            if self.processor.precisa_ajuste:
+                print("📊 Primeira passada: calculando a faixa global do GLI...")
+                if pool:
+                    faixas = [f for f in pool.map(_faixa_parcial, repeat(self.processor), repeat(input_dir), blocos) if f]
+                    if not faixas:
+                        raise ValueError("Nenhuma imagem pôde ser lida para o ajuste da faixa global do GLI.")
+                    self.processor.faixa = (min(f[0] for f in faixas), max(f[1] for f in faixas))
+                else:
+                    self.processor.ajustar(self._ler_imagens(input_dir, arquivos))
 
-            nome_base = os.path.splitext(nome)[0]
-            mask_path = os.path.join(output_dir, f"{nome_base}_mask.png")
-            cv2.imwrite(mask_path, mask)
+            entradas = {}
+            if retomar:
+                diario = Diario(os.path.join(output_dir, NOME_DIARIO), self.parametros())
+                entradas = {nome: impressao_digital(os.path.join(input_dir, nome)) for nome in arquivos}
+                pendentes = [nome for nome in arquivos
+                             if not diario.concluido(nome, entradas[nome], self.caminho_mascara(output_dir, nome))]
+                if len(pendentes) < len(arquivos):
+                    self.metricas.contar("tiles_retomados", len(arquivos) - len(pendentes))
+                    print(f"⏩ {len(arquivos) - len(pendentes)} máscaras já geradas em uma execução anterior (diário), retomando...")
+                arquivos = pendentes
+                blocos = [arquivos[i:i + chunksize] for i in range(0, len(arquivos), chunksize)]
 
-            print(f"✅ {nome} → máscara salva em {mask_path}")
+            if pool:
+                resultados = pool.map(_processar_bloco, repeat(self), repeat(input_dir), repeat(output_dir), blocos)
+                for bloco, resumo in resultados:
+                    self.metricas.mesclar(resumo)
+                    for nome, mask_path in bloco:
+                        self._relatar(nome, mask_path, diario, entradas)
+            else:
+                for nome in arquivos:
+                    self._relatar(nome, self.processar_arquivo(input_dir, output_dir, nome), diario, entradas)
+        finally:
+            if pool:
+                pool.shutdown()
+            if diario:
+                diario.fechar()
 
         print(f"\n🎯 Concluído! Máscaras salvas em: {os.path.abspath(output_dir)}")
+
+    @staticmethod
+    def _relatar(nome: str, mask_path: Optional[str], diario: Optional[Diario] = None, entradas: Optional[dict] = None) -> None:
+        if mask_path is None:
+            print(f"⚠️ Erro ao ler {nome}, pulando...")
+        else:
+            if diario:
+                diario.registrar(nome, entradas[nome])
+            print(f"✅ {nome} → máscara salva em {mask_path}")
+
+
+# Funções executadas nos processos do pool (precisam ser de nível de módulo)
+
+def _processar_bloco(pipeline: GLIMaskPipeline, input_dir: str, output_dir: str, nomes: List[str]):
+    """Processa um bloco de arquivos. A cópia do pipeline no processo traz métricas vazias; o resumo volta junto."""
+    resultados = [(nome, pipeline.processar_arquivo(input_dir, output_dir, nome)) for nome in nomes]
+    return resultados, pipeline.metricas.resumo()
+
+
+def _faixa_parcial(processor: ImageProcessor, input_dir: str, nomes: List[str]):
+    """Min/max do GLI em um bloco de arquivos (primeira passada da normalização global)."""
+    imagens = list(GLIMaskPipeline._ler_imagens(input_dir, nomes))
+    if not imagens:
+        return None
+    processor.ajustar(imagens)
+    return processor.faixa
@@ -0,0 +1,89 @@
+import torch
+
+
+# ============================================================
+# Recortes e aumento de dados em lote
+# Comentários
+# As operações trabalham sobre o batch inteiro (B, C, H, W) já convertido para float,
+# sem laços por amostra: vários recortes aleatórios são extraídos de cada tile lido
+# do disco e as augmentations (flips, brilho/contraste) são sorteadas por amostra e
+# aplicadas com máscaras booleanas sobre o tensor.
+# ============================================================
+
+def recortes_aleatorios(imgs, masks, crop_size, n_recortes=4, generator=None):
+    """
+    Extrai n_recortes recortes aleatórios (crop_size x crop_size) de cada tile do batch.
+
+    Args:
+        imgs (Tensor): Imagens (B, C, H, W).
+        masks (Tensor): Máscaras (B, 1, H, W).
+        crop_size (int): Lado do recorte, em pixels.
+        n_recortes (int): Recortes sorteados por tile.
+        generator (torch.Generator, opcional): Gerador para sorteios reprodutíveis.
+
+    Returns:
+        (imgs, masks) com shape (B * n_recortes, C, crop_size, crop_size).
+    """
+    b, _, h, w = imgs.shape
+    if crop_size > h or crop_size > w:
+        raise ValueError(f"❌ Recorte de {crop_size}px maior que o tile ({h}x{w}).")
+
+    device = imgs.device
+    n = b * n_recortes
+    oy = torch.randint(0, h - crop_size + 1, (n,), generator=generator).to(device)
+    ox = torch.randint(0, w - crop_size + 1, (n,), generator=generator).to(device)
+
+    idx_b = torch.arange(b, device=device).repeat_interleave(n_recortes)[:, None, None, None]
+    passo = torch.arange(crop_size, device=device)
+    rows = (oy[:, None] + passo)[:, None, :, None]
+    cols = (ox[:, None] + passo)[:, None, None, :]
+
+    def recortar(t):
+        canais = torch.arange(t.shape[1], device=device)[None, :, None, None]
+        return t[idx_b, canais, rows, cols]
+
+    return recortar(imgs), recortar(masks)
+
+
+def recortes_fixos(imgs, masks, crop_size):
+    """
+    Divide cada tile em recortes fixos, sem sobreposição (grade a partir do canto superior
+    esquerdo). Usado na validação, para que a métrica seja determinística entre épocas.
+    """
+    def grade(t):
+        b, c = t.shape[:2]
+        t = t.unfold(2, crop_size, crop_size).unfold(3, crop_size, crop_size)  # B, C, nh, nw, k, k
+        return t.permute(0, 2, 3, 1, 4, 5).reshape(-1, c, crop_size, crop_size)
+
+    return grade(imgs), grade(masks)
+
+
+def aumentar_lote(imgs, masks, p_hflip=0.5, p_vflip=0.3, p_brilho=0.2, limite_brilho=0.2, limite_contraste=0.2,
+                  generator=None):
+    """
+    Aplica flips horizontais/verticais e brilho/contraste aleatórios, sorteados por amostra,
+    a um batch float (B, C, H, W) em [0, 1]. As máscaras recebem apenas as transformações geométricas.
+    """
+    b = imgs.shape[0]
+    device = imgs.device
+
+    def sortear(p):
+        return (torch.rand(b, generator=generator) < p).to(device)[:, None, None, None]
+
+    hflip = sortear(p_hflip)
+    imgs = torch.where(hflip, imgs.flip(-1), imgs)
+    masks = torch.where(hflip, masks.flip(-1), masks)
+
+    vflip = sortear(p_vflip)
+    imgs = torch.where(vflip, imgs.flip(-2), imgs)
+    masks = torch.where(vflip, masks.flip(-2), masks)
+
+    # Brilho/contraste: img * alpha + beta, com alpha em [1 - lc, 1 + lc] e beta em [-lb, lb]
+    aplica = sortear(p_brilho)
+    alpha = 1 + (torch.rand(b, generator=generator) * 2 - 1) * limite_contraste
+    beta = (torch.rand(b, generator=generator) * 2 - 1) * limite_brilho
+    alpha = torch.where(aplica, alpha.to(device)[:, None, None, None], torch.ones((), device=device))
+    beta = torch.where(aplica, beta.to(device)[:, None, None, None], torch.zeros((), device=device))
+    imgs = (imgs * alpha + beta).clamp_(0.0, 1.0)
+
+    return imgs, masks
@@ -0,0 +1,65 @@
+import torch
+
+from model import UNet
+
+
+# ============================================================
+# Backends de inferência
+# Comentários
+# O BatchInferenceEngine só precisa de um objeto chamável que receba um tensor
+# (N, 3, H, W) float e devolva (N, 1, H, W). Assim o mesmo engine roda o modelo
+# eager (state dict + classe UNet), um artefato TorchScript ou uma sessão ONNX Runtime.
+# ============================================================
+
+BACKENDS = ("eager", "torchscript", "onnx")
+
+
+def carregar_modelo(modelpath, device):
+    """Instancia a U-Net e carrega os pesos treinados em modo de avaliação."""
+    model = UNet().to(device)
+    model.load_state_dict(torch.load(modelpath, map_location=device))
+    model.eval()
+    return model
+
+
+class OnnxRuntimeModel:
+    """Sessão ONNX Runtime (CPU) com a mesma interface de chamada de um nn.Module."""
+
+    def __init__(self, onnx_path, threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as exc:
+            raise ImportError("❌ O backend 'onnx' requer o pacote onnxruntime (pip install onnxruntime).") from exc
+
+        opcoes = ort.SessionOptions()
+        if threads:
+            opcoes.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(onnx_path, sess_options=opcoes, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        saida = self.session.run(None, {self.input_name: batch.detach().cpu().contiguous().numpy()})[0]
+        return torch.from_numpy(saida)
+
+    def eval(self):
+        return self
+
+
+def carregar_backend(backend, modelpath, device):
+    """
+    Carrega o modelo para o backend escolhido:
+    - "eager": state dict (.pth) na classe UNet;
+    - "torchscript": artefato .pt gerado por export_model.py;
+    - "onnx": artefato .onnx gerado por export_model.py, executado no ONNX Runtime (CPU).
+    """
+    if backend == "eager":
+        return carregar_modelo(modelpath, device)
+    if backend == "torchscript":
+        return torch.jit.load(modelpath, map_location=device).eval()
+    if backend == "onnx":
+        if device.type != "cpu":
+            raise ValueError("❌ O backend 'onnx' roda apenas em CPU.")
+        return OnnxRuntimeModel(modelpath)
+
+    raise ValueError(f"Backend inválido: {backend}. Use um de {BACKENDS}.")
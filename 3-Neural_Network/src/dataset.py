@@ -1,11 +1,13 @@
 import os
+import json
+import hashlib
 import cv2
 import numpy as np
 import torch
 from torch.utils.data import Dataset
 
 class PlantSegmentationDataset(Dataset):
-    def __init__(self, images_dir, masks_dir, transform=None, mask_suffix="_mask"):
+    def __init__(self, images_dir, masks_dir, transform=None, mask_suffix="_mask", cache_dir=None):
         """
         Dataset de segmentação de plantas.
 
@@ -14,11 +16,16 @@ class PlantSegmentationDataset(Dataset):
             masks_dir (str): Caminho das máscaras correspondentes.
             transform (albumentations.Compose, opcional): Transformações de aumento de dados.
             mask_suffix (str): Sufixo usado nos arquivos de máscara (ex: "_mask").
+            cache_dir (str, opcional): Diretório do cache de tiles decodificados. Se informado,
+                imagens e máscaras são decodificadas uma única vez para arquivos uint8 mapeados
+                em memória, reaproveitados entre execuções (invalidados pelo mtime dos arquivos).
+                Nesse modo os itens são tensores uint8 — use preparar_lote() no batch.
         """
         self.images_dir = images_dir
         self.masks_dir = masks_dir
         self.transform = transform
         self.mask_suffix = mask_suffix
+        self.cache_dir = cache_dir
 
         self.valid_exts = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
 
@@ -31,32 +38,127 @@ class PlantSegmentationDataset(Dataset):
         if not self.images:
             raise ValueError(f"❌ Nenhuma imagem válida encontrada em: {images_dir}")
 
+        self._cache_imgs = None
+        self._cache_masks = None
+        if cache_dir:
+            self._preparar_cache()
+
     def __len__(self):
         return len(self.images)
 
-    def __getitem__(self, idx):
-        img_name = self.images[idx]
-        img_path = os.path.join(self.images_dir, img_name)
-
+    def _mask_path(self, img_name):
         # Cria o nome da máscara com sufixo
         base, ext = os.path.splitext(img_name)
         mask_name = f"{base}{self.mask_suffix}.png"  # força extensão .png
-        mask_path = os.path.join(self.masks_dir, mask_name)
+        return os.path.join(self.masks_dir, mask_name)
+
+    def _ler_par(self, img_name):
+        """Decodifica a imagem (RGB uint8) e a máscara binária (0/1 uint8) de um tile."""
+        img_path = os.path.join(self.images_dir, img_name)
 
         # --- Carrega imagem RGB ---
         image = cv2.imread(img_path)
         if image is None:
             raise ValueError(f"❌ Erro ao ler imagem: {img_path}")
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        image = image.astype(np.float32) / 255.0
 
         # --- Carrega máscara ---
-        mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+        mask = cv2.imread(self._mask_path(img_name), cv2.IMREAD_GRAYSCALE)
         if mask is None:
             print(f"[⚠️ Aviso] Máscara não encontrada para {img_name}. Criando máscara vazia.")
             mask = np.zeros(image.shape[:2], dtype=np.uint8)
 
-        mask = (mask > 127).astype(np.float32)  # binariza (0 ou 1)
+        mask = (mask > 127).astype(np.uint8)  # binariza (0 ou 1)
+        return image, mask
+
+    # ------------------------------------------------------------
+    # Cache de tiles decodificados
+    # ------------------------------------------------------------
+
+    def _cache_paths(self):
+        chave = f"{os.path.abspath(self.images_dir)}|{os.path.abspath(self.masks_dir)}|{self.mask_suffix}"
+        prefixo = os.path.join(self.cache_dir, hashlib.sha1(chave.encode()).hexdigest()[:16])
+        return f"{prefixo}_imagens.npy", f"{prefixo}_mascaras.npy", f"{prefixo}.json"
+
+    def _assinatura(self):
+        """Nome e mtime de cada imagem e máscara — qualquer alteração invalida o cache."""
+        assinatura = []
+        for img_name in self.images:
+            mask_path = self._mask_path(img_name)
+            assinatura.append([
+                img_name,
+                os.path.getmtime(os.path.join(self.images_dir, img_name)),
+                os.path.getmtime(mask_path) if os.path.exists(mask_path) else None
+            ])
+        return assinatura
+
+    def _preparar_cache(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        imgs_path, masks_path, meta_path = self._cache_paths()
+        assinatura = self._assinatura()
+
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["arquivos"] == assinatura and os.path.exists(imgs_path) and os.path.exists(masks_path):
+                self._shape = tuple(meta["shape"])
+                print(f"📦 Cache de tiles reaproveitado: {meta_path}")
+                return
+
+        print(f"📦 Construindo cache de {len(self.images)} tiles em {self.cache_dir}...")
+
+        # Remove os metadados antes de reescrever: cache incompleto nunca é considerado válido
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        image, mask = self._ler_par(self.images[0])
+        h, w = mask.shape
+        self._shape = (len(self.images), h, w)
+
+        imgs = np.lib.format.open_memmap(imgs_path, mode="w+", dtype=np.uint8, shape=(*self._shape, 3))
+        masks = np.lib.format.open_memmap(masks_path, mode="w+", dtype=np.uint8, shape=self._shape)
+
+        for idx, img_name in enumerate(self.images):
+            if idx > 0:
+                image, mask = self._ler_par(img_name)
+            if mask.shape != (h, w):
+                raise ValueError(f"❌ O cache exige tiles do mesmo tamanho: {img_name} tem {mask.shape}, esperado {(h, w)}.")
+            imgs[idx] = image
+            masks[idx] = mask
+
+        imgs.flush()
+        masks.flush()
+        del imgs, masks
+
+        with open(meta_path, "w") as f:
+            json.dump({"shape": list(self._shape), "arquivos": assinatura}, f)
+
+    def _abrir_cache(self):
+        # Aberto sob demanda: cada worker do DataLoader mapeia os arquivos por conta própria
+        if self._cache_imgs is None:
+            imgs_path, masks_path, _ = self._cache_paths()
+            self._cache_imgs = np.load(imgs_path, mmap_mode="r")
+            self._cache_masks = np.load(masks_path, mmap_mode="r")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_cache_imgs"] = None
+        state["_cache_masks"] = None
+        return state
+
+    def __getitem__(self, idx):
+        if self.cache_dir:
+            self._abrir_cache()
+            image, mask = np.array(self._cache_imgs[idx]), np.array(self._cache_masks[idx])
+
+            if not self.transform:
+                # Mantém uint8; a conversão para float é feita no batch (preparar_lote)
+                return torch.from_numpy(image).permute(2, 0, 1), torch.from_numpy(mask).unsqueeze(0)
+        else:
+            image, mask = self._ler_par(self.images[idx])
+
+        image = image.astype(np.float32) / 255.0
+        mask = mask.astype(np.float32)
 
         # --- Transforma (Albumentations) ---
         if self.transform:
@@ -70,3 +172,15 @@ class PlantSegmentationDataset(Dataset):
             mask = torch.tensor(mask).unsqueeze(0)        # 1, H, W
 
         return image, mask
+
+
+def preparar_lote(imgs, masks):
+    """
+    Converte um batch vindo do cache (uint8) para float32: imagens em [0, 1] e máscaras 0/1.
+    Batches já em float são devolvidos sem alteração.
+    """
+    if imgs.dtype == torch.uint8:
+        imgs = imgs.float().div_(255.0)
+    if masks.dtype == torch.uint8:
+        masks = masks.float()
+    return imgs, masks
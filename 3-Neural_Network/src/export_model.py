@@ -0,0 +1,81 @@
+import os
+import argparse
+import torch
+
+from backends import carregar_modelo, OnnxRuntimeModel
+
+
+# ============================================================
+# Exportação da U-Net para TorchScript e ONNX
+# Comentários
+# Os artefatos dispensam a classe UNet em Python na inferência (backends
+# "torchscript" e "onnx" do model_inference.py). Batch, altura e largura são
+# dinâmicos. Após exportar, a saída de cada artefato é comparada à do modelo eager.
+# ============================================================
+
+def exportar_torchscript(model, output_path):
+    """Compila o modelo com torch.jit.script e salva o artefato .pt."""
+    scripted = torch.jit.script(model)
+    scripted.save(output_path)
+    return output_path
+
+
+def exportar_onnx(model, output_path, tile_size=256, opset=17):
+    """Exporta o modelo para ONNX com batch e dimensões espaciais dinâmicas."""
+    exemplo = torch.rand(1, 3, tile_size, tile_size)
+    eixos = {0: "batch", 2: "altura", 3: "largura"}
+
+    torch.onnx.export(
+        model, (exemplo,), output_path,
+        input_names=["imagem"],
+        output_names=["probabilidade"],
+        dynamic_axes={"imagem": eixos, "probabilidade": eixos},
+        opset_version=opset,
+        dynamo=False
+    )
+    return output_path
+
+
+def comparar_saidas(model, exportado, nome, tile_size=256, tolerancia=1e-4):
+    """Compara a saída do artefato exportado com a do modelo eager em um lote aleatório."""
+    entrada = torch.rand(2, 3, tile_size, tile_size)
+    with torch.no_grad():
+        diff = (model(entrada) - exportado(entrada)).abs().max().item()
+
+    print(f"🔎 {nome}: diferença máxima para o modelo eager = {diff:.2e}")
+    if diff > tolerancia:
+        raise RuntimeError(f"❌ Saída do artefato {nome} diverge do modelo eager ({diff:.2e} > {tolerancia}).")
+
+
+def exportar(args):
+    device = torch.device("cpu")
+    model = carregar_modelo(args.modelpath, device)
+
+    if not args.sem_fundir_bn:
+        model.fundir_batchnorm()
+
+    os.makedirs(args.output, exist_ok=True)
+    base = os.path.splitext(os.path.basename(args.modelpath))[0]
+
+    ts_path = exportar_torchscript(model, os.path.join(args.output, f"{base}.pt"))
+    comparar_saidas(model, torch.jit.load(ts_path), "TorchScript", args.tile_size)
+    print(f"✅ TorchScript salvo em: {ts_path}")
+
+    onnx_path = exportar_onnx(model, os.path.join(args.output, f"{base}.onnx"), args.tile_size, args.opset)
+    try:
+        comparar_saidas(model, OnnxRuntimeModel(onnx_path), "ONNX", args.tile_size)
+    except ImportError:
+        print("⚠️ onnxruntime não instalado — verificação do artefato ONNX pulada.")
+    print(f"✅ ONNX salvo em: {onnx_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta a U-Net treinada para TorchScript e ONNX")
+    parser.add_argument("--modelpath", required=True, help="Caminho do modelo treinado (.pth)")
+    parser.add_argument("--output", default="runs/export", help="Diretório de saída dos artefatos")
+    parser.add_argument("--tile-size", type=int, default=256, help="Tamanho do tile de exemplo usado na exportação/verificação")
+    parser.add_argument("--opset", type=int, default=17, help="Versão do opset ONNX")
+    parser.add_argument("--sem-fundir-bn", action="store_true", help="Não funde BatchNorm nas convoluções antes de exportar")
+
+    args = parser.parse_args()
+    exportar(args)
@@ -0,0 +1,143 @@
+import queue
+import threading
+import numpy as np
+import torch
+
+from instrumentation import Metricas
+
+
+# ============================================================
+# Motor de inferência em lotes
+# Comentários
+# Os tiles são agrupados em lotes de tamanho configurável. Uma thread em segundo
+# plano lê/decodifica o próximo lote enquanto o lote atual passa pela U-Net,
+# e as máscaras são devolvidas na mesma ordem de entrada.
+# ============================================================
+
+_FIM = object()
+
+
+class BatchInferenceEngine:
+    """Executa a U-Net sobre lotes de tiles com pré-carregamento em segundo plano."""
+
+    def __init__(self, model, device, batch_size=8, threshold=0.59, prefetch=2, bf16=False, channels_last=False,
+                 metricas=None):
+        """
+        Args:
+            model (nn.Module): U-Net carregada e em modo de avaliação.
+            device (torch.device): Dispositivo de inferência.
+            batch_size (int): Número de tiles por forward pass.
+            threshold (float): Limiar de binarização da predição.
+            prefetch (int): Quantos lotes podem ficar prontos na fila à frente do modelo.
+            bf16 (bool): Executa o forward pass em autocast bfloat16.
+            channels_last (bool): Usa o formato de memória channels_last (NHWC) no modelo e nos lotes.
+            metricas (Metricas, opcional): Recebe os tempos das etapas "forward" e "limiar".
+        """
+        if batch_size < 1:
+            raise ValueError("O parâmetro 'batch_size' deve ser >= 1.")
+
+        self.model = model
+        self.device = device
+        self.batch_size = batch_size
+        self.threshold = threshold
+        self.prefetch = max(1, prefetch)
+        self.bf16 = bf16
+        self.channels_last = channels_last
+        self.metricas = metricas or Metricas("inferencia")
+
+        if channels_last:
+            self.model = model.to(memory_format=torch.channels_last)
+
+    def _forward(self, tiles: np.ndarray) -> torch.Tensor:
+        """Executa a U-Net em um lote (N, H, W, 3) RGB uint8 e retorna as probabilidades (N, H, W)."""
+        batch = torch.from_numpy(tiles).to(self.device)
+        batch = batch.permute(0, 3, 1, 2).float().div_(255.0)
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+
+        with self.metricas.medir("forward", tiles=len(tiles)), torch.no_grad(), \
+                torch.autocast(device_type=self.device.type, dtype=torch.bfloat16, enabled=self.bf16):
+            prob = torch.sigmoid(self.model(batch)).squeeze(1).float()
+            if self.device.type == "cuda":
+                torch.cuda.synchronize()  # o tempo do forward inclui a execução assíncrona na GPU
+
+        self.metricas.contar("tiles", len(tiles))
+        return prob
+
+    def predict_batch(self, tiles: np.ndarray) -> np.ndarray:
+        """
+        Segmenta um lote (N, H, W, 3) RGB uint8.
+        Retorna as máscaras (N, H, W) uint8 com valores 0/255.
+        """
+        prob = self._forward(tiles)
+        with self.metricas.medir("limiar", tiles=len(tiles)):
+            return (prob > self.threshold).to(torch.uint8).mul_(255).cpu().numpy()
+
+    def predict_batch_proba(self, tiles: np.ndarray) -> np.ndarray:
+        """Probabilidades (N, H, W) float32 de um lote, sem binarizar."""
+        return self._forward(tiles).float().cpu().numpy()
+
+    def _agrupar(self, itens):
+        """Agrupa (chave, tile) em lotes de tiles com o mesmo tamanho."""
+        chaves, tiles = [], []
+
+        for chave, tile in itens:
+            if tiles and (len(tiles) == self.batch_size or tile.shape != tiles[0].shape):
+                yield chaves, np.stack(tiles)
+                chaves, tiles = [], []
+
+            chaves.append(chave)
+            tiles.append(tile)
+
+        if tiles:
+            yield chaves, np.stack(tiles)
+
+    @staticmethod
+    def _enfileirar(fila, item, parar):
+        """Coloca um item na fila sem bloquear para sempre caso o consumidor tenha parado."""
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produtor(self, itens, fila, parar):
+        try:
+            for lote in self._agrupar(itens):
+                if not self._enfileirar(fila, lote, parar):
+                    return
+            self._enfileirar(fila, _FIM, parar)
+        except BaseException as exc:  # repassa o erro para a thread principal
+            self._enfileirar(fila, exc, parar)
+
+    def run(self, itens, probabilidades=False):
+        """
+        Segmenta um iterável de (chave, tile RGB uint8).
+
+        A leitura/decodificação dos tiles (o próprio iterável) roda numa thread em
+        segundo plano. Yields (chave, máscara) na mesma ordem da entrada — ou
+        (chave, probabilidades float32) se probabilidades=True.
+        """
+        predict = self.predict_batch_proba if probabilidades else self.predict_batch
+
+        fila = queue.Queue(maxsize=self.prefetch)
+        parar = threading.Event()
+        produtor = threading.Thread(target=self._produtor, args=(itens, fila, parar), daemon=True)
+        produtor.start()
+
+        try:
+            while True:
+                lote = fila.get()
+                if lote is _FIM:
+                    break
+                if isinstance(lote, BaseException):
+                    raise lote
+
+                chaves, tiles = lote
+                for chave, pred in zip(chaves, predict(tiles)):
+                    yield chave, pred
+        finally:
+            parar.set()
+            produtor.join()
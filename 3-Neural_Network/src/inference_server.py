@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+import rasterio
+import torch
+from rasterio.windows import Window
+
+from backends import BACKENDS, carregar_backend
+from inference_engine import BatchInferenceEngine
+from instrumentation import Metricas, adicionar_argumentos
+from segment_orthomosaic import ler_tiles
+
+
+# ============================================================
+# Servidor HTTP de inferência com lotes dinâmicos
+# Comentários
+# A U-Net fica carregada em um único processo. Cada requisição (um tile codificado
+# ou uma janela de um raster local) é decodificada na thread da conexão e entra em
+# uma fila; uma thread única junta os pedidos que chegam dentro de uma janela de
+# espera (ou até o lote máximo) e executa um forward por lote no BatchInferenceEngine.
+# Sob carga concorrente, os pedidos dividem o mesmo forward; com um pedido isolado,
+# a latência extra é no máximo a espera máxima.
+#
+# Rotas:
+# - POST /segmentar          corpo = imagem codificada (PNG/JPEG/TIFF) → máscara PNG
+# - POST /segmentar-janela   JSON {"raster", "x", "y", "largura", "altura"} → máscara PNG
+#                            (somente rasters dentro de --raiz-rasters)
+# - GET  /saude              JSON com a configuração e o resumo das métricas
+# ============================================================
+
+_FIM = object()
+
+
+class AgrupadorDinamico:
+    """Junta pedidos concorrentes em lotes dinâmicos e os executa no engine."""
+
+    def __init__(self, engine, lote_max=8, espera_max_ms=10.0, metricas=None):
+        """
+        Args:
+            engine (BatchInferenceEngine): Engine com o modelo carregado.
+            lote_max (int): Número máximo de tiles por forward pass.
+            espera_max_ms (float): Quanto o primeiro pedido de um lote espera por outros.
+            metricas (Metricas, opcional): Recebe os tempos de "espera" (fila) e os contadores de lotes.
+        """
+        self.engine = engine
+        self.lote_max = max(1, lote_max)
+        self.espera_max = espera_max_ms / 1000
+        self.metricas = metricas or engine.metricas
+        self.fila = queue.Queue()
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+
+    def segmentar(self, tile, timeout=None):
+        """
+        Segmenta um tile (H, W, 3) RGB uint8. Bloqueia até o lote do pedido ser executado.
+        Retorna (máscara 0/255 uint8, número de tiles no lote).
+        """
+        futuro = Future()
+        self.fila.put((time.perf_counter(), tile, futuro))
+        return futuro.result(timeout)
+
+    def fechar(self):
+        self.fila.put(_FIM)
+        self._thread.join()
+
+    def _coletar(self):
+        """Espera o primeiro pedido e junta os que chegarem até o prazo dele ou até lote_max."""
+        primeiro = self.fila.get()
+        if primeiro is _FIM:
+            return None
+
+        lote = [primeiro]
+        prazo = primeiro[0] + self.espera_max
+        while len(lote) < self.lote_max:
+            restante = prazo - time.perf_counter()
+            if restante <= 0:
+                break
+            try:
+                pedido = self.fila.get(timeout=restante)
+            except queue.Empty:
+                break
+            if pedido is _FIM:
+                self.fila.put(_FIM)  # encerra depois de executar o lote atual
+                break
+            lote.append(pedido)
+        return lote
+
+    def _executar(self):
+        while True:
+            lote = self._coletar()
+            if lote is None:
+                return
+
+            agora = time.perf_counter()
+            self.metricas.contar("lotes")
+            self.metricas.contar("pedidos", len(lote))
+            self.metricas.contar("espera_ms_total", round(sum(agora - chegada for chegada, _, _ in lote) * 1000))
+
+            # O forward exige tiles do mesmo tamanho: pedidos de tamanhos diferentes viram lotes separados
+            grupos = {}
+            for _, tile, futuro in lote:
+                grupos.setdefault(tile.shape, []).append((tile, futuro))
+
+            for itens in grupos.values():
+                try:
+                    mascaras = self.engine.predict_batch(np.stack([tile for tile, _ in itens]))
+                except Exception as exc:
+                    for _, futuro in itens:
+                        futuro.set_exception(exc)
+                    continue
+                for (_, futuro), mascara in zip(itens, mascaras):
+                    futuro.set_result((mascara, len(itens)))
+
+
+class ErroRequisicao(Exception):
+    """Erro do cliente: vira uma resposta HTTP com o status informado."""
+
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class ServidorInferencia(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, endereco, agrupador, raiz_rasters=None, tamanho_max=4096, corpo_max=64 * 2**20, verboso=False):
+        super().__init__(endereco, ManipuladorInferencia)
+        self.agrupador = agrupador
+        self.raiz_rasters = os.path.realpath(raiz_rasters) if raiz_rasters else None
+        self.tamanho_max = tamanho_max
+        self.corpo_max = corpo_max
+        self.verboso = verboso
+
+
+class ManipuladorInferencia(BaseHTTPRequestHandler):
+    server_version = "SegmentacaoUNet/1.0"
+
+    def do_GET(self):
+        if self.path != "/saude":
+            return self._erro(404, f"Rota desconhecida: {self.path}")
+
+        agrupador = self.server.agrupador
+        estado = {
+            "status": "ok",
+            "dispositivo": str(agrupador.engine.device),
+            "threshold": agrupador.engine.threshold,
+            "lote_max": agrupador.lote_max,
+            "espera_max_ms": agrupador.espera_max * 1000,
+            "pedidos_na_fila": agrupador.fila.qsize(),
+            "metricas": agrupador.metricas.resumo(),
+        }
+        self._responder(200, json.dumps(estado).encode(), "application/json")
+
+    def do_POST(self):
+        rotas = {"/segmentar": self._tile_do_corpo, "/segmentar-janela": self._tile_da_janela}
+        if self.path not in rotas:
+            return self._erro(404, f"Rota desconhecida: {self.path}")
+
+        try:
+            tile = rotas[self.path](self._ler_corpo())
+            if max(tile.shape[:2]) > self.server.tamanho_max:
+                raise ErroRequisicao(413, f"Tile maior que o máximo de {self.server.tamanho_max} pixels.")
+
+            mascara, tamanho_lote = self.server.agrupador.segmentar(tile)
+            _, png = cv2.imencode(".png", mascara)
+        except ErroRequisicao as exc:
+            return self._erro(exc.status, str(exc))
+        except Exception as exc:
+            return self._erro(500, f"Falha na inferência: {exc}")
+
+        self._responder(200, png.tobytes(), "image/png", {"X-Tamanho-Lote": str(tamanho_lote)})
+
+    def _ler_corpo(self):
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        if tamanho <= 0:
+            raise ErroRequisicao(400, "Corpo da requisição vazio.")
+        if tamanho > self.server.corpo_max:
+            raise ErroRequisicao(413, f"Corpo maior que o máximo de {self.server.corpo_max} bytes.")
+        return self.rfile.read(tamanho)
+
+    def _tile_do_corpo(self, corpo):
+        """Decodifica um tile enviado no corpo (PNG/JPEG/TIFF) em RGB uint8."""
+        img = cv2.imdecode(np.frombuffer(corpo, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ErroRequisicao(400, "Não foi possível decodificar a imagem enviada.")
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+    def _tile_da_janela(self, corpo):
+        """Lê a janela pedida de um raster dentro de --raiz-rasters (fora do raster, preenchida com zeros)."""
+        if not self.server.raiz_rasters:
+            raise ErroRequisicao(403, "Leitura de rasters desativada (inicie o servidor com --raiz-rasters).")
+        try:
+            pedido = json.loads(corpo)
+            raster = pedido["raster"]
+            janela = Window(int(pedido["x"]), int(pedido["y"]), int(pedido["largura"]), int(pedido["altura"]))
+        except (ValueError, KeyError, TypeError) as exc:
+            raise ErroRequisicao(400, f"JSON inválido: esperado raster, x, y, largura e altura ({exc}).")
+
+        raiz = self.server.raiz_rasters
+        caminho = os.path.realpath(os.path.join(raiz, raster))
+        if os.path.commonpath([raiz, caminho]) != raiz:
+            raise ErroRequisicao(403, "O raster precisa estar dentro de --raiz-rasters.")
+        if not os.path.isfile(caminho):
+            raise ErroRequisicao(404, f"Raster não encontrado: {raster}")
+        if janela.width <= 0 or janela.height <= 0 or max(janela.width, janela.height) > self.server.tamanho_max:
+            raise ErroRequisicao(413, f"Janela inválida ou maior que o máximo de {self.server.tamanho_max} pixels.")
+
+        # Cada requisição abre o raster: datasets do Rasterio não devem ser compartilhados entre threads
+        with rasterio.open(caminho) as src:
+            try:
+                _, tile = next(ler_tiles(src, metricas=self.server.agrupador.metricas, janelas=[janela]))
+            except ValueError as exc:
+                raise ErroRequisicao(400, str(exc))
+        return tile
+
+    def _responder(self, status, corpo, tipo, cabecalhos=None):
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _erro(self, status, mensagem):
+        self._responder(status, json.dumps({"erro": mensagem}).encode(), "application/json")
+
+    def log_message(self, formato, *args):
+        if self.server.verboso:
+            super().log_message(formato, *args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor HTTP local de inferência da U-Net com lotes dinâmicos")
+    parser.add_argument("--modelpath", required=True, help="Caminho do modelo treinado (.pth, ou artefato .pt/.onnx conforme o backend)")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Execução do modelo: eager (.pth), torchscript (.pt) ou onnx (.onnx, ONNX Runtime CPU)")
+    parser.add_argument("--host", default="127.0.0.1", help="Endereço de escuta. Padrão = 127.0.0.1 (somente local).")
+    parser.add_argument("--porta", type=int, default=8080, help="Porta HTTP")
+    parser.add_argument("--threshold", type=float, default=0.59, help="Limiar para binarização das máscaras")
+    parser.add_argument("--lote-max", type=int, default=8, help="Número máximo de tiles por forward pass")
+    parser.add_argument("--espera-max-ms", type=float, default=10.0, help="Quanto um pedido espera por outros para formar um lote (ms)")
+    parser.add_argument("--tamanho-max", type=int, default=4096, help="Maior largura/altura aceita para um tile ou janela")
+    parser.add_argument("--raiz-rasters", default=None, help="Pasta dos rasters acessíveis por /segmentar-janela (desativado se omitido)")
+    parser.add_argument("--verboso", action="store_true", help="Registra cada requisição no stderr")
+    adicionar_argumentos(parser)
+
+    args = parser.parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() and args.backend != "onnx" else "cpu")
+
+    model = carregar_backend(args.backend, args.modelpath, device)
+    metricas = Metricas("servidor", args.metricas_log, args.metricas_prometheus)
+    engine = BatchInferenceEngine(model, device, batch_size=args.lote_max, threshold=args.threshold, metricas=metricas)
+    agrupador = AgrupadorDinamico(engine, args.lote_max, args.espera_max_ms, metricas)
+    servidor = ServidorInferencia((args.host, args.porta), agrupador, args.raiz_rasters, args.tamanho_max, verboso=args.verboso)
+
+    print(f"🚀 Servidor de inferência em http://{args.host}:{args.porta} ({device}, lote máx. {args.lote_max}, espera máx. {args.espera_max_ms} ms)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Encerrando...")
+    finally:
+        servidor.server_close()
+        agrupador.fechar()
+        metricas.finalizar()
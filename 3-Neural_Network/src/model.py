@@ -1,6 +1,24 @@
 import torch
 import torch.nn as nn
 
+def fundir_conv_bn(conv, bn):
+    """
+    Retorna uma Conv2d equivalente a conv seguida de bn (em modo de avaliação):
+    W' = W * gamma / sqrt(var + eps)  e  b' = (b - média) * gamma / sqrt(var + eps) + beta.
+    """
+    fused = nn.Conv2d(conv.in_channels, conv.out_channels, conv.kernel_size,
+                      stride=conv.stride, padding=conv.padding, dilation=conv.dilation,
+                      groups=conv.groups, bias=True).to(conv.weight.device)
+
+    with torch.no_grad():
+        escala = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+        fused.weight.copy_(conv.weight * escala.reshape(-1, 1, 1, 1))
+        bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+        fused.bias.copy_((bias - bn.running_mean) * escala + bn.bias)
+
+    return fused
+
+
 class DoubleConv(nn.Module):
     def __init__(self, in_channels, out_channels):
         super().__init__()
@@ -16,6 +34,14 @@ class DoubleConv(nn.Module):
     def forward(self, x):
         return self.block(x)
 
+    def fundir_batchnorm(self):
+        """Incorpora cada BatchNorm na Conv2d anterior (somente para inferência)."""
+        conv1, bn1, relu1, conv2, bn2, relu2 = self.block
+        self.block = nn.Sequential(
+            fundir_conv_bn(conv1, bn1), relu1,
+            fundir_conv_bn(conv2, bn2), relu2
+        )
+
 
 class UNet(nn.Module):
     def __init__(self, in_channels=3, out_channels=1):
@@ -43,3 +69,12 @@ class UNet(nn.Module):
         x = self.up(x)
         x = self.dec1(torch.cat([x, x1], dim=1))
         return torch.sigmoid(self.outc(x))
+
+    def fundir_batchnorm(self):
+        """Funde BatchNorm + Conv2d em todos os blocos. O modelo deve estar em eval()."""
+        if self.training:
+            raise RuntimeError("A fusão de BatchNorm só é válida em modo de avaliação (model.eval()).")
+        for module in self.modules():
+            if isinstance(module, DoubleConv):
+                module.fundir_batchnorm()
+        return self
@@ -4,12 +4,19 @@ import torch
 import numpy as np
 from tqdm import tqdm
 import argparse
-from model import UNet
-
-
-def predict_image(model, device, img_path, threshold=0.59):
-    img = cv2.imread(img_path, cv2.IMREAD_COLOR)
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+from backends import BACKENDS, carregar_backend
+from inference_engine import BatchInferenceEngine
+from instrumentation import Metricas, adicionar_argumentos
+from diario import NOME_DIARIO, Diario, escrever_atomico, impressao_digital
+import triagem as triagem_tiles
+from optimize import amostra_tiles, criar_engine_otimizado, verificar_paridade
+
+
+def predict_array(model, device, img, threshold=0.59):
+    """
+    Segmenta um tile já decodificado (H, W, 3) em RGB uint8.
+    Retorna a máscara binária (0/255) em uint8.
+    """
     img = img.astype(np.float32) / 255.0
     img_t = torch.from_numpy(img).permute(2, 0, 1).unsqueeze(0).to(device)
 
@@ -21,38 +28,152 @@ def predict_image(model, device, img_path, threshold=0.59):
     return mask
 
 
+def predict_image(model, device, img_path, threshold=0.59):
+    img = cv2.imread(img_path, cv2.IMREAD_COLOR)
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return predict_array(model, device, img, threshold)
+
+
+def ler_imagens(directory, img_names, metricas=None):
+    """Decodifica as imagens em RGB uint8. Yields (nome, imagem)."""
+    metricas = metricas or Metricas("inferencia")
+    for img_name in img_names:
+        # Leitura dos bytes e decodificação separadas, para medir I/O e cv2 independentemente
+        with metricas.medir("leitura", tile=img_name):
+            dados = np.fromfile(os.path.join(directory, img_name), dtype=np.uint8)
+        metricas.contar("bytes_lidos", dados.nbytes)
+
+        with metricas.medir("decodificacao", tile=img_name):
+            img = cv2.imdecode(dados, cv2.IMREAD_COLOR)
+            if img is not None:
+                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+        if img is None:
+            print(f"⚠️ Erro ao ler {img_name}, pulando...")
+            continue
+        yield img_name, img
+
+
+def salvar_mascara(path, mask, metricas):
+    """Codifica a máscara no formato da extensão do arquivo e grava no disco (escrita atômica)."""
+    with metricas.medir("codificacao", tile=os.path.basename(path)):
+        _, dados = cv2.imencode(os.path.splitext(path)[1], mask)
+    with metricas.medir("escrita", tile=os.path.basename(path)):
+        escrever_atomico(path, dados.tofile)
+    metricas.contar("bytes_escritos", dados.nbytes)
+
+
+def separar_vazios(imagens, triagem, output_dir, metricas, ao_pular=None):
+    """
+    Grava a máscara constante 0 dos tiles considerados vazios pela triagem e repassa
+    apenas os demais (nome, imagem) para a inferência.
+    """
+    for img_name, img in imagens:
+        with metricas.medir("triagem", tile=img_name):
+            vazio = triagem.vazio_tile(img)
+
+        if not vazio:
+            yield img_name, img
+            continue
+
+        salvar_mascara(os.path.join(output_dir, img_name), np.zeros(img.shape[:2], dtype=np.uint8), metricas)
+        metricas.contar("tiles_pulados")
+        if ao_pular:
+            ao_pular(img_name)
+
+
+def abrir_diario(args, img_names):
+    """
+    Diário do job na pasta de saída. Os parâmetros incluem a impressão digital do modelo:
+    trocar o modelo, o limiar ou a triagem invalida as máscaras registradas.
+    """
+    parametros = {
+        "modelo": os.path.abspath(args.modelpath), "modelo_entrada": impressao_digital(args.modelpath),
+        "backend": args.backend, "threshold": args.threshold,
+        "bf16": args.bf16, "channels_last": args.channels_last, "fundir_bn": args.fundir_bn,
+        "triagem": [args.fracao_valida_minima, args.gli_limiar, args.fracao_vegetacao_minima] if args.pular_vazios else None,
+    }
+    entradas = {n: impressao_digital(os.path.join(args.rgb, n)) for n in img_names}
+    return Diario(os.path.join(args.output, NOME_DIARIO), parametros), entradas
+
+
 def infer(args):
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = UNet().to(device)
+    device = torch.device("cuda" if torch.cuda.is_available() and args.backend != "onnx" else "cpu")
 
     print(f"Rodando inferência em {device}")
-    print(f"Modelo: {args.modelpath}")
+    print(f"Modelo: {args.modelpath} ({args.backend})")
     print(f"Input: {args.rgb}")
     print(f"Output: {args.output}")
 
-    model.load_state_dict(torch.load(args.modelpath, map_location=device))
-    model.eval()
+    model = carregar_backend(args.backend, args.modelpath, device)
+    metricas = Metricas("inferencia", args.metricas_log, args.metricas_prometheus)
 
     os.makedirs(args.output, exist_ok=True)
 
-    for img_name in tqdm(os.listdir(args.rgb), desc="Inferindo imagens de teste"):
-        if not img_name.lower().endswith(('.jpg', '.png', '.tif')):
-            continue
-
-        img_path = os.path.join(args.rgb, img_name)
-        mask = predict_image(model, device, img_path)
-
-        save_path = os.path.join(args.output, img_name)
-        cv2.imwrite(save_path, mask)
+    img_names = sorted(f for f in os.listdir(args.rgb) if f.lower().endswith(('.jpg', '.png', '.tif')))
+    diario, entradas = abrir_diario(args, img_names) if args.retomar else (None, {})
+    if args.bf16 or args.channels_last or args.fundir_bn:
+        engine = criar_engine_otimizado(model, device, args.batch_size, args.threshold,
+                                        bf16=args.bf16, channels_last=args.channels_last, fundir_bn=args.fundir_bn,
+                                        metricas=metricas)
+        amostra = amostra_tiles(ler_imagens(args.rgb, img_names), args.batch_size)
+        verificar_paridade(model, engine, amostra, args.iou_minimo)
+    else:
+        engine = BatchInferenceEngine(model, device, batch_size=args.batch_size, threshold=args.threshold, metricas=metricas)
+
+    if diario:
+        pendentes = [n for n in img_names if not diario.concluido(n, entradas[n], os.path.join(args.output, n))]
+        if len(pendentes) < len(img_names):
+            metricas.contar("tiles_retomados", len(img_names) - len(pendentes))
+            print(f"⏩ {len(img_names) - len(pendentes)} máscaras já geradas em uma execução anterior (diário), retomando...")
+        img_names = pendentes
+
+    barra = tqdm(total=len(img_names), desc="Inferindo imagens de teste")
+
+    def concluir(img_name):
+        if diario:
+            diario.registrar(img_name, entradas[img_name])
+        barra.update()
+
+    imagens = ler_imagens(args.rgb, img_names, metricas)
+    triagem = triagem_tiles.criar_triagem(args)
+    if triagem:
+        imagens = separar_vazios(imagens, triagem, args.output, metricas, ao_pular=concluir)
+
+    try:
+        for img_name, mask in engine.run(imagens):
+            salvar_mascara(os.path.join(args.output, img_name), mask, metricas)
+            concluir(img_name)
+    finally:
+        barra.close()
+        if diario:
+            diario.fechar()
+
+    if triagem:
+        print(f"⏭️ {metricas.contadores.get('tiles_pulados', 0)} tiles vazios receberam máscara 0 sem passar pela U-Net.")
+
+    metricas.finalizar()
 
     print(f"✅ Inferência concluída! Máscaras salvas em: {args.output}")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Inferência com U-Net treinada")
-    parser.add_argument("--modelpath",default="runs/unet_best.pth", required=True, help="Caminho do modelo treinado (.pth)")
+    parser.add_argument("--modelpath",default="runs/unet_best.pth", required=True, help="Caminho do modelo treinado (.pth, ou artefato .pt/.onnx conforme o backend)")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Execução do modelo: eager (.pth), torchscript (.pt) ou onnx (.onnx, ONNX Runtime CPU)")
     parser.add_argument("--rgb", required=True, help="Diretório com imagens para inferência")
     parser.add_argument("--output", required=True, help="Diretório de saída para salvar as máscaras")
+    parser.add_argument("--batch-size", type=int, default=8, help="Número de tiles por forward pass")
+    parser.add_argument("--threshold", type=float, default=0.59, help="Limiar para binarização das máscaras")
+    parser.add_argument("--bf16", action="store_true", help="Executa a U-Net em autocast bfloat16")
+    parser.add_argument("--channels-last", action="store_true", help="Usa o formato de memória channels_last (NHWC)")
+    parser.add_argument("--fundir-bn", action="store_true", help="Funde as camadas BatchNorm nas convoluções anteriores")
+    parser.add_argument("--iou-minimo", type=float, default=0.98, help="IoU mínimo entre as máscaras do modo otimizado e do float32")
+    parser.add_argument("--retomar", action="store_true", help="Registra as máscaras geradas em um diário e, ao rodar de novo, pula as já concluídas")
+    adicionar_argumentos(parser)
+    triagem_tiles.adicionar_argumentos(parser)
 
     args = parser.parse_args()
+    if args.backend != "eager" and (args.bf16 or args.channels_last or args.fundir_bn):
+        parser.error("--bf16, --channels-last e --fundir-bn só se aplicam ao backend eager.")
     infer(args)
@@ -0,0 +1,73 @@
+import copy
+import numpy as np
+
+from inference_engine import BatchInferenceEngine
+
+
+# ============================================================
+# Modo de inferência otimizado para CPU
+# Comentários
+# BatchNorm fundido nas convoluções, autocast bfloat16 e formato channels_last.
+# Como bf16 altera levemente as probabilidades, as máscaras do modelo otimizado
+# são comparadas às do float32 (IoU) antes de processar o restante dos tiles.
+# ============================================================
+
+def iou_mascaras(a, b):
+    """IoU entre duas máscaras (ou lotes de máscaras) binárias. Duas máscaras vazias têm IoU 1."""
+    a, b = a > 0, b > 0
+    uniao = np.logical_or(a, b).sum()
+    if uniao == 0:
+        return 1.0
+    return float(np.logical_and(a, b).sum() / uniao)
+
+
+def amostra_tiles(itens, n):
+    """Empilha os primeiros n tiles (do mesmo tamanho) de um iterável de (chave, tile)."""
+    tiles = []
+    for _, tile in itens:
+        if tiles and tile.shape != tiles[0].shape:
+            continue
+        tiles.append(tile)
+        if len(tiles) == n:
+            break
+
+    if not tiles:
+        raise ValueError("❌ Nenhum tile disponível para a verificação de paridade.")
+    return np.stack(tiles)
+
+
+def criar_engine_otimizado(model, device, batch_size=8, threshold=0.59, bf16=False, channels_last=False,
+                           fundir_bn=False, metricas=None):
+    """
+    Cria um BatchInferenceEngine sobre uma cópia do modelo com as otimizações escolhidas.
+    O modelo original (float32) não é alterado e pode ser usado como referência.
+    """
+    otimizado = copy.deepcopy(model).eval()
+    if fundir_bn:
+        otimizado.fundir_batchnorm()
+
+    return BatchInferenceEngine(otimizado, device, batch_size=batch_size, threshold=threshold,
+                                bf16=bf16, channels_last=channels_last, metricas=metricas)
+
+
+def verificar_paridade(model, engine, tiles, iou_minimo=0.98):
+    """
+    Compara as máscaras do engine otimizado com as do modelo float32 original.
+
+    Args:
+        model (nn.Module): Modelo float32 de referência.
+        engine (BatchInferenceEngine): Engine otimizado.
+        tiles (np.ndarray): Amostra (N, H, W, 3) RGB uint8.
+        iou_minimo (float): IoU mínimo aceito entre as máscaras.
+
+    Returns:
+        float: IoU obtido. Lança RuntimeError se ficar abaixo do mínimo.
+    """
+    referencia = BatchInferenceEngine(model, engine.device, batch_size=engine.batch_size, threshold=engine.threshold)
+
+    iou = iou_mascaras(referencia.predict_batch(tiles), engine.predict_batch(tiles))
+    print(f"🔎 Paridade com float32 em {len(tiles)} tiles: IoU={iou:.4f} (mínimo {iou_minimo})")
+
+    if iou < iou_minimo:
+        raise RuntimeError(f"❌ Máscaras do modo otimizado divergem do float32 (IoU {iou:.4f} < {iou_minimo}).")
+    return iou
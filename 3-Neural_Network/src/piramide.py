@@ -0,0 +1,149 @@
+import math
+import numpy as np
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from instrumentation import Metricas
+
+
+# ============================================================
+# Inferência em pirâmide (grosso → fino)
+# Comentários
+# Primeiro a U-Net roda sobre o ortomosaico reduzido por um fator (leitura com
+# out_shape: o GDAL usa as overviews, quando existem), gerando um mapa de
+# probabilidades grosso. Depois, cada tile da grade em resolução cheia só passa
+# pela U-Net se a sua área no mapa grosso tiver pixels incertos (probabilidade
+# perto do limiar) ou uma borda entre vegetação e fundo. Os demais tiles são
+# homogêneos e recebem a probabilidade média do mapa grosso como valor constante.
+#
+# O UNet.forward já termina em sigmoide e o BatchInferenceEngine aplica outra por
+# cima (como a inferência original, em que o limiar 0.59 foi calibrado), então as
+# saídas do engine ficam em [0.5, 0.731]. A incerteza é medida na probabilidade do
+# próprio modelo (0–1), desfazendo a segunda sigmoide; o limiar é convertido da
+# mesma forma e o valor dos tiles homogêneos volta para a escala do engine.
+# ============================================================
+
+def probabilidade_modelo(prob_engine):
+    """Desfaz a sigmoide aplicada pelo engine: logit(p) = log(p / (1 - p)), limitado a [0, 1]."""
+    p = np.clip(prob_engine, 1e-6, 1 - 1e-6)
+    return np.clip(np.log(p / (1 - p)), 0.0, 1.0)
+
+
+def probabilidade_engine(prob_modelo):
+    """Probabilidade do modelo (0–1) na escala das saídas do engine (sigmoide)."""
+    return 1 / (1 + np.exp(-prob_modelo))
+
+
+class RefinamentoPiramide:
+    """Passada grossa sobre o ortomosaico reduzido e decisão de quais tiles refinar."""
+
+    def __init__(self, fator=4, margem=0.15, fracao_incerta=0.01):
+        """
+        Args:
+            fator (int): Redução de resolução da passada grossa (4 → 1/16 dos pixels).
+            margem (float): Probabilidades do modelo em limiar ± margem contam como incertas.
+            fracao_incerta (float): Tiles com mais pixels incertos (no mapa grosso) que
+                essa fração são refinados em resolução cheia.
+        """
+        if fator < 2:
+            raise ValueError("O parâmetro 'fator' da pirâmide deve ser >= 2.")
+        self.fator = fator
+        self.margem = margem
+        self.fracao_incerta = fracao_incerta
+
+    def ler_tiles_grossos(self, src, tile_size, metricas=None):
+        """
+        Lê o ortomosaico reduzido em tiles (tile_size x tile_size, sem sobreposição),
+        cada um cobrindo tile_size * fator pixels do raster. Tiles de borda são completados com zeros.
+
+        Yields:
+            ((linha, coluna, altura, largura), tile): posição e tamanho válido no mapa grosso, e os pixels RGB uint8.
+        """
+        metricas = metricas or Metricas("inferencia")
+        passo = tile_size * self.fator
+
+        for y in range(0, src.height, passo):
+            for x in range(0, src.width, passo):
+                w, h = min(passo, src.width - x), min(passo, src.height - y)
+                forma = (math.ceil(h / self.fator), math.ceil(w / self.fator))
+
+                with metricas.medir("leitura_grossa", tile=f"{x}_{y}"):
+                    rgb = src.read(indexes=[1, 2, 3], window=Window(x, y, w, h), out_shape=(3, *forma),
+                                   resampling=Resampling.average)
+                if rgb.dtype != np.uint8:
+                    rgb = np.clip(rgb, 0, 255).astype(np.uint8)
+
+                tile = np.zeros((tile_size, tile_size, 3), dtype=np.uint8)
+                tile[:forma[0], :forma[1]] = np.moveaxis(rgb, 0, -1)
+                yield (y // self.fator, x // self.fator, *forma), tile
+
+    def mapa_grosso(self, engine, src, tile_size, metricas=None):
+        """
+        Executa a U-Net sobre o ortomosaico reduzido. Retorna o mapa de probabilidades do
+        modelo (ceil(H / fator), ceil(W / fator)) em uint8 (0–255), para ocupar 1/4 da memória de float32.
+        """
+        mapa = np.zeros((math.ceil(src.height / self.fator), math.ceil(src.width / self.fator)), dtype=np.uint8)
+
+        for (r, c, h, w), prob in engine.run(self.ler_tiles_grossos(src, tile_size, metricas), probabilidades=True):
+            mapa[r:r + h, c:c + w] = np.round(probabilidade_modelo(prob[:h, :w]) * 255).astype(np.uint8)
+
+        return mapa
+
+    def decidir(self, mapa, window, threshold):
+        """
+        Decide se o tile `window` (resolução cheia) precisa da U-Net. threshold é o limiar do
+        engine. Retorna (refinar, probabilidade): para tiles não refinados, a probabilidade
+        média da área do tile no mapa grosso, na escala do engine.
+        """
+        limiar = float(probabilidade_modelo(threshold))
+        f = self.fator
+        x, y = int(window.col_off), int(window.row_off)
+        r0, r1 = y // f, min(math.ceil((y + window.height) / f), mapa.shape[0])
+        c0, c1 = x // f, min(math.ceil((x + window.width) / f), mapa.shape[1])
+        if r0 >= r1 or c0 >= c1:
+            return True, None
+
+        prob = mapa[r0:r1, c0:c1].astype(np.float32) / 255
+        if (np.abs(prob - limiar) < self.margem).mean() > self.fracao_incerta:
+            return True, None
+
+        # Borda entre vegetação e fundo no tile ou no pixel grosso vizinho: a máscara fina tem detalhes
+        vizinhanca = mapa[max(r0 - 1, 0):r1 + 1, max(c0 - 1, 0):c1 + 1].astype(np.float32) / 255 > limiar
+        if vizinhanca.any() and not vizinhanca.all():
+            return True, None
+
+        return False, float(probabilidade_engine(prob.mean()))
+
+
+def intercalar(janelas, decisoes, resultados, tile_size, binario=False):
+    """
+    Junta, na ordem das janelas, os resultados da U-Net dos tiles refinados (na mesma ordem)
+    com o valor constante dos tiles homogêneos — probabilidade float32 ou, com binario=True,
+    a máscara (0/255 uint8) já definida pelo lado do limiar em que o tile está.
+
+    Args:
+        decisoes (list): (refinar, valor) de cada janela; valor é a probabilidade ou a máscara constante.
+    """
+    resultados = iter(resultados)
+    dtype = np.uint8 if binario else np.float32
+
+    for window, (refinar, valor) in zip(janelas, decisoes):
+        if refinar:
+            yield next(resultados)
+        else:
+            yield window, np.full((tile_size, tile_size), valor, dtype=dtype)
+
+
+def adicionar_argumentos(parser):
+    """Adiciona --piramide e os parâmetros do refinamento a um ArgumentParser."""
+    parser.add_argument("--piramide", type=int, default=None, metavar="FATOR",
+                        help="Passada grossa com o ortomosaico reduzido por FATOR; só tiles incertos ou de borda rodam em resolução cheia")
+    parser.add_argument("--margem-incerteza", type=float, default=0.15, help="Probabilidades do modelo (0–1, sem a sigmoide do engine) em limiar ± margem contam como incertas no mapa grosso")
+    parser.add_argument("--fracao-incerta", type=float, default=0.01, help="Fração de pixels incertos (no mapa grosso) a partir da qual o tile é refinado")
+
+
+def criar_piramide(args):
+    """RefinamentoPiramide a partir dos argumentos da linha de comando, ou None sem --piramide."""
+    if not args.piramide:
+        return None
+    return RefinamentoPiramide(args.piramide, args.margem_incerteza, args.fracao_incerta)
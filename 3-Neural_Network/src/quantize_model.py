@@ -0,0 +1,142 @@
+import os
+import copy
+import json
+import time
+import argparse
+import torch
+from torch.utils.data import DataLoader, Subset
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+from backends import carregar_modelo
+from dataset import PlantSegmentationDataset, preparar_lote
+
+
+# ============================================================
+# Quantização estática int8 (pós-treino) da U-Net para CPU
+# Comentários
+# O modelo é preparado com FX graph mode (fusão Conv+BN+ReLU e observadores),
+# calibrado em uma amostra de tiles do PlantSegmentationDataset e convertido para
+# int8. O artefato é salvo em TorchScript e pode ser usado com --backend torchscript.
+# Em um conjunto fixo de tiles (disjunto da calibração), são reportados o IoU de cada
+# modelo contra o groundtruth, a diferença entre eles e o throughput (tiles/s).
+# ============================================================
+
+def calibrar(prepared, loader):
+    """Passa os tiles de calibração pelo modelo preparado para coletar as faixas de ativação."""
+    with torch.no_grad():
+        for imgs, _ in loader:
+            imgs, _ = preparar_lote(imgs, imgs)
+            prepared(imgs)
+
+
+def quantizar(model, calib_loader, backend="x86"):
+    """Retorna uma cópia int8 do modelo (float, em eval), calibrada com calib_loader."""
+    torch.backends.quantized.engine = backend
+
+    exemplo, _ = next(iter(calib_loader))
+    exemplo, _ = preparar_lote(exemplo[:1], exemplo[:1])
+
+    prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(backend), (exemplo,))
+    calibrar(prepared, calib_loader)
+    return convert_fx(prepared)
+
+
+def avaliar(model, loader, threshold=0.59):
+    """
+    IoU global contra o groundtruth e throughput do modelo em um conjunto fixo.
+    Também devolve as máscaras preditas, para comparar modelos entre si.
+    """
+    intersecao = uniao = 0
+    tiles, tempo = 0, 0.0
+    mascaras = []
+
+    with torch.no_grad():
+        for imgs, masks in loader:
+            imgs, masks = preparar_lote(imgs, masks)
+
+            inicio = time.perf_counter()
+            pred = torch.sigmoid(model(imgs)) > threshold
+            tempo += time.perf_counter() - inicio
+
+            alvo = masks > 0.5
+            intersecao += (pred & alvo).sum().item()
+            uniao += (pred | alvo).sum().item()
+            tiles += imgs.shape[0]
+            mascaras.append(pred)
+
+    return {
+        "iou": intersecao / uniao if uniao else 1.0,
+        "tiles_por_segundo": tiles / tempo if tempo else 0.0,
+    }, torch.cat(mascaras)
+
+
+def quantize(args):
+    torch.manual_seed(args.seed)
+    device = torch.device("cpu")
+    model = carregar_modelo(args.modelpath, device)
+
+    dataset = PlantSegmentationDataset(args.rgb, args.groundtruth, transform=None, cache_dir=args.cache_dir)
+    n_calib, n_aval = args.amostras_calibracao, args.amostras_avaliacao
+    if n_calib + n_aval > len(dataset):
+        raise ValueError(f"❌ O dataset tem {len(dataset)} tiles; são necessários {n_calib + n_aval} (calibração + avaliação).")
+
+    indices = torch.randperm(len(dataset)).tolist()
+    calib_loader = DataLoader(Subset(dataset, indices[:n_calib]), batch_size=args.batch_size)
+    aval_loader = DataLoader(Subset(dataset, indices[n_calib:n_calib + n_aval]), batch_size=args.batch_size)
+
+    print(f"⚙️ Calibrando com {n_calib} tiles ({args.backend_quant})...")
+    quantizado = quantizar(model, calib_loader, args.backend_quant)
+
+    print(f"📏 Avaliando em {n_aval} tiles...")
+    metricas_fp32, mascaras_fp32 = avaliar(model, aval_loader, args.threshold)
+    metricas_int8, mascaras_int8 = avaliar(quantizado, aval_loader, args.threshold)
+
+    concordancia = (mascaras_fp32 & mascaras_int8).sum().item() / max((mascaras_fp32 | mascaras_int8).sum().item(), 1)
+    relatorio = {
+        "modelo": args.modelpath,
+        "backend_quantizacao": args.backend_quant,
+        "amostras_calibracao": n_calib,
+        "amostras_avaliacao": n_aval,
+        "float32": metricas_fp32,
+        "int8": metricas_int8,
+        "delta_iou": metricas_int8["iou"] - metricas_fp32["iou"],
+        "iou_int8_vs_float32": concordancia,
+        "speedup": metricas_int8["tiles_por_segundo"] / max(metricas_fp32["tiles_por_segundo"], 1e-12),
+    }
+
+    os.makedirs(args.output, exist_ok=True)
+    base = os.path.splitext(os.path.basename(args.modelpath))[0]
+
+    exemplo, _ = next(iter(aval_loader))
+    exemplo, _ = preparar_lote(exemplo[:1], exemplo[:1])
+    model_path = os.path.join(args.output, f"{base}_int8.pt")
+    torch.jit.trace(quantizado, (exemplo,)).save(model_path)
+
+    relatorio_path = os.path.join(args.output, f"{base}_int8.json")
+    with open(relatorio_path, "w") as f:
+        json.dump(relatorio, f, indent=2)
+
+    print(f"📘 IoU float32={metricas_fp32['iou']:.4f} | int8={metricas_int8['iou']:.4f} | Δ={relatorio['delta_iou']:+.4f}")
+    print(f"📘 Throughput float32={metricas_fp32['tiles_por_segundo']:.2f} tiles/s | "
+          f"int8={metricas_int8['tiles_por_segundo']:.2f} tiles/s ({relatorio['speedup']:.2f}x)")
+    print(f"✅ Modelo int8 salvo em: {model_path} (use --backend torchscript)")
+    print(f"✅ Relatório salvo em: {relatorio_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantização estática int8 da U-Net para inferência em CPU")
+    parser.add_argument("--modelpath", required=True, help="Caminho do modelo treinado (.pth)")
+    parser.add_argument("--rgb", required=True, help="Diretório com tiles RGB (calibração e avaliação)")
+    parser.add_argument("--groundtruth", required=True, help="Diretório com as máscaras correspondentes")
+    parser.add_argument("--output", default="runs/quantized", help="Diretório de saída do modelo int8 e do relatório")
+    parser.add_argument("--amostras-calibracao", type=int, default=32, help="Número de tiles usados na calibração")
+    parser.add_argument("--amostras-avaliacao", type=int, default=32, help="Número de tiles do conjunto fixo de avaliação/benchmark")
+    parser.add_argument("--batch-size", type=int, default=4, help="Tamanho do batch")
+    parser.add_argument("--threshold", type=float, default=0.59, help="Limiar para binarização das máscaras")
+    parser.add_argument("--backend-quant", choices=["x86", "fbgemm", "qnnpack"], default="x86", help="Backend de quantização do PyTorch")
+    parser.add_argument("--seed", type=int, default=0, help="Semente da seleção dos tiles de calibração/avaliação")
+    parser.add_argument("--cache-dir", default=None, help="Diretório do cache de tiles decodificados")
+
+    args = parser.parse_args()
+    quantize(args)
@@ -0,0 +1,243 @@
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import rasterio
+import torch
+
+from backends import BACKENDS, carregar_backend
+from diario import NOME_DIARIO, Diario, escrever_atomico, impressao_digital
+from inference_engine import BatchInferenceEngine
+from instrumentation import Metricas, adicionar_argumentos
+import triagem as triagem_tiles
+from segment_orthomosaic import segmentar_ortomosaico
+
+
+# ============================================================
+# Segmentação em lote de vários ortomosaicos
+# Comentários
+# Um pool de processos de longa duração carrega o modelo uma única vez por worker
+# (no initializer) e recebe um ortomosaico por vez. Dentro de cada job, as etapas
+# se sobrepõem como no segment_orthomosaic.py: a leitura dos tiles roda numa thread
+# do BatchInferenceEngine enquanto a U-Net processa o lote anterior, e a máscara é
+# escrita (reconstruída) janela a janela. Entre jobs, vários ortomosaicos ficam em
+# andamento ao mesmo tempo, limitados por um orçamento de memória: cada worker custa
+# a memória base (PyTorch + modelo) e cada job em andamento, a estimativa dos seus
+# lotes, ativações da U-Net e faixa do acumulador.
+# ============================================================
+
+# Medidos com a UNet deste repositório em float32 (eager, CPU): RSS de um processo
+# com PyTorch, Rasterio e o modelo carregado, e pico de memória do forward por pixel
+MEMORIA_BASE_WORKER = 600 * 2**20
+BYTES_POR_PIXEL_FORWARD = 3000
+
+
+def estimar_memoria_job(largura, tile_size=1024, batch_size=8, mesclagem="cosseno", prefetch=2):
+    """
+    Estimativa (bytes) da memória de um job além da memória base do worker:
+    lotes de tiles em voo (fila do engine + lote atual), ativações do forward e,
+    no modo cosseno, a faixa de soma/peso do acumulador (2 x tile_size x largura float32).
+    """
+    pixels_lote = batch_size * tile_size ** 2
+    lotes = (prefetch + 2) * pixels_lote * 3
+    forward = pixels_lote * BYTES_POR_PIXEL_FORWARD
+    faixa = 2 * tile_size * largura * 4 if mesclagem == "cosseno" else 0
+    return lotes + forward + faixa
+
+
+# Estado de cada processo do pool: o modelo é carregado uma única vez por worker
+_worker = {}
+
+
+def _iniciar_worker(backend, modelpath, threads):
+    torch.set_num_threads(threads)
+    device = torch.device("cuda" if torch.cuda.is_available() and backend != "onnx" else "cpu")
+    _worker.update(model=carregar_backend(backend, modelpath, device), device=device)
+
+
+def _segmentar_job(input_tif, output_tif, parametros, triagem):
+    """
+    Segmenta um ortomosaico com o modelo do worker (escrita atômica do GeoTIFF de saída).
+    Retorna o tempo do job e o resumo das métricas.
+    """
+    metricas = Metricas("inferencia")
+    engine = BatchInferenceEngine(_worker["model"], _worker["device"], batch_size=parametros["batch_size"],
+                                  threshold=parametros["threshold"], metricas=metricas)
+
+    inicio = time.perf_counter()
+    escrever_atomico(output_tif, lambda temporario: segmentar_ortomosaico(
+        _worker["model"], _worker["device"], input_tif, temporario, parametros["tile_size"], parametros["overlap"],
+        mesclagem=parametros["mesclagem"], completar_bordas=parametros["completar_bordas"],
+        engine=engine, metricas=metricas, triagem=triagem))
+    return time.perf_counter() - inicio, metricas.resumo()
+
+
+def caminho_saida(output_dir, input_tif):
+    return os.path.join(output_dir, f"{os.path.splitext(os.path.basename(input_tif))[0]}_mascara.tif")
+
+
+def ajustar_workers(workers, maior_job, memoria_max):
+    """Reduz o número de workers até que todos (ociosos) e o maior job caibam no orçamento."""
+    while workers > 1 and workers * MEMORIA_BASE_WORKER + maior_job > memoria_max:
+        workers -= 1
+    return workers
+
+
+def segmentar_lote(inputs, output_dir, modelpath, backend="eager", workers=2, memoria_max=None, threads=None,
+                   parametros=None, triagem=None, metricas=None, retomar=False):
+    """
+    Segmenta uma lista de ortomosaicos em um pool de workers que carregam o modelo uma vez.
+
+    Args:
+        inputs (list[str]): GeoTIFFs RGB de entrada.
+        output_dir (str): Pasta das máscaras ({nome}_mascara.tif).
+        modelpath (str): Modelo (.pth, ou artefato .pt/.onnx conforme o backend).
+        backend (str): "eager", "torchscript" ou "onnx".
+        workers (int): Número máximo de processos (cada um com uma cópia do modelo).
+        memoria_max (int, opcional): Orçamento de memória em bytes. Jobs só começam se a
+            memória base dos workers mais as estimativas dos jobs em andamento couberem nele.
+        threads (int, opcional): Threads do PyTorch por worker. Padrão = núcleos / workers.
+        parametros (dict): tile_size, overlap, threshold, batch_size, mesclagem e completar_bordas.
+        triagem (TriagemTiles, opcional): Triagem de tiles vazios, aplicada em cada job.
+        metricas (Metricas, opcional): Recebe os resumos das métricas de todos os jobs.
+        retomar (bool): Registra os ortomosaicos concluídos no diário da pasta de saída e
+            pula os já segmentados (mesma entrada e mesmos parâmetros) em uma nova execução.
+    """
+    saidas = [caminho_saida(output_dir, i) for i in inputs]
+    if len(set(saidas)) < len(saidas):
+        raise ValueError("❌ Há ortomosaicos com o mesmo nome de arquivo: as máscaras teriam o mesmo caminho de saída.")
+
+    os.makedirs(output_dir, exist_ok=True)
+    metricas = metricas or Metricas("inferencia")
+
+    estimativas = {}
+    for input_tif in inputs:
+        with rasterio.open(input_tif) as src:
+            estimativas[input_tif] = estimar_memoria_job(src.width, parametros["tile_size"], parametros["batch_size"],
+                                                         parametros["mesclagem"])
+
+    diario = None
+    entradas = {input_tif: impressao_digital(input_tif) for input_tif in inputs}
+    if retomar:
+        diario = Diario(os.path.join(output_dir, NOME_DIARIO),
+                        {"modelo": os.path.abspath(modelpath), "modelo_entrada": impressao_digital(modelpath),
+                         "backend": backend, **parametros,
+                         "triagem": vars(triagem) if triagem else None})
+        pendentes = [i for i in inputs if not diario.concluido(i, entradas[i], caminho_saida(output_dir, i))]
+        if len(pendentes) < len(inputs):
+            print(f"⏩ {len(inputs) - len(pendentes)} ortomosaicos já segmentados em uma execução anterior (diário).")
+        inputs = pendentes
+
+    if not inputs:
+        print("✅ Nada a fazer: todos os ortomosaicos já foram segmentados.")
+        return []
+
+    if memoria_max:
+        maior_job = max(estimativas[i] for i in inputs)
+        ajustado = ajustar_workers(min(workers, len(inputs)), maior_job, memoria_max)
+        if ajustado < min(workers, len(inputs)):
+            print(f"⚠️ Orçamento de memória: usando {ajustado} workers em vez de {workers}.")
+        workers = ajustado
+    workers = max(1, min(workers, len(inputs)))
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    memoria_livre = (memoria_max - workers * MEMORIA_BASE_WORKER) if memoria_max else float("inf")
+
+    print(f"🧩 {len(inputs)} ortomosaicos | {workers} workers x {threads} threads | modelo: {modelpath} ({backend})")
+
+    fila = list(inputs)
+    em_andamento = {}
+    falhas = []
+    inicio = time.perf_counter()
+    # spawn: processos novos, sem herdar o estado de threads do PyTorch do processo principal
+    contexto = multiprocessing.get_context("spawn")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=contexto, initializer=_iniciar_worker,
+                                 initargs=(backend, modelpath, threads)) as pool:
+            while fila or em_andamento:
+                # Primeiro encaixe: na ordem da fila, inicia os jobs que cabem no orçamento restante;
+                # um job maior que o orçamento inteiro roda sozinho
+                for input_tif in list(fila):
+                    if len(em_andamento) >= workers:
+                        break
+                    if estimativas[input_tif] > memoria_livre and em_andamento:
+                        continue
+                    fila.remove(input_tif)
+                    memoria_livre -= estimativas[input_tif]
+                    futuro = pool.submit(_segmentar_job, input_tif, caminho_saida(output_dir, input_tif), parametros, triagem)
+                    em_andamento[futuro] = input_tif
+
+                concluidos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    input_tif = em_andamento.pop(futuro)
+                    memoria_livre += estimativas[input_tif]
+                    try:
+                        duracao, resumo = futuro.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as exc:  # um ortomosaico com problema não interrompe o lote
+                        falhas.append(input_tif)
+                        metricas.contar("ortomosaicos_com_erro")
+                        print(f"❌ {os.path.basename(input_tif)}: {exc}")
+                        continue
+                    metricas.mesclar(resumo)
+                    metricas.contar("ortomosaicos")
+                    if diario:
+                        diario.registrar(input_tif, entradas[input_tif])
+                    print(f"✅ {os.path.basename(input_tif)} segmentado em {duracao:.1f}s → {caminho_saida(output_dir, input_tif)}")
+    finally:
+        if diario:
+            diario.fechar()
+
+    print(f"🎯 Lote concluído em {time.perf_counter() - inicio:.1f}s. Máscaras salvas em: {output_dir}")
+    if falhas:
+        print(f"⚠️ {len(falhas)} ortomosaicos falharam: {', '.join(falhas)}")
+    return falhas
+
+
+def ler_lista(path):
+    """Lista de ortomosaicos de um arquivo texto (um caminho por linha; linhas vazias e # são ignoradas)."""
+    with open(path) as f:
+        return [linha.strip() for linha in f if linha.strip() and not linha.lstrip().startswith("#")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Segmentação em lote de vários ortomosaicos com um pool de workers que carregam o modelo uma vez")
+    parser.add_argument("--modelpath", required=True, help="Caminho do modelo treinado (.pth, ou artefato .pt/.onnx conforme o backend)")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Execução do modelo: eager (.pth), torchscript (.pt) ou onnx (.onnx, ONNX Runtime CPU)")
+    parser.add_argument("--inputs", nargs="+", default=[], help="GeoTIFFs RGB de entrada")
+    parser.add_argument("--lista", default=None, help="Arquivo texto com um GeoTIFF de entrada por linha")
+    parser.add_argument("--output-dir", required=True, help="Pasta das máscaras segmentadas ({nome}_mascara.tif)")
+    parser.add_argument("--workers", type=int, default=2, help="Número de processos; cada um carrega o modelo uma única vez")
+    parser.add_argument("--memoria-max", type=float, default=None, help="Orçamento de memória em GB para os workers e os jobs em andamento")
+    parser.add_argument("--threads-por-worker", type=int, default=None, help="Threads do PyTorch por worker. Padrão = núcleos / workers.")
+    parser.add_argument("--tile-size", type=int, default=1024, help="Tamanho (em pixels) de cada tile. Padrão = 1024.")
+    parser.add_argument("--overlap", type=float, default=0.2, help="Sobreposição entre tiles (0.0–0.9). Padrão = 0.2.")
+    parser.add_argument("--threshold", type=float, default=0.59, help="Limiar para binarização das máscaras")
+    parser.add_argument("--batch-size", type=int, default=8, help="Número de tiles por forward pass")
+    parser.add_argument("--mesclagem", choices=["cosseno", "nenhuma"], default="cosseno",
+                        help="Como combinar tiles sobrepostos: média ponderada das probabilidades (cosseno) ou sobrescrita (nenhuma)")
+    parser.add_argument("--completar-bordas", action=argparse.BooleanOptionalAction, default=True,
+                        help="Segmenta também as bordas que não cabem em um tile inteiro (tiles com padding). Padrão = ativado.")
+    parser.add_argument("--retomar", action="store_true", help="Registra os ortomosaicos concluídos em um diário e, ao rodar de novo, pula os já segmentados")
+    adicionar_argumentos(parser)
+    triagem_tiles.adicionar_argumentos(parser)
+
+    args = parser.parse_args()
+    inputs = args.inputs + (ler_lista(args.lista) if args.lista else [])
+    if not inputs:
+        parser.error("Informe os ortomosaicos com --inputs e/ou --lista.")
+    faltando = [i for i in inputs if not os.path.exists(i)]
+    if faltando:
+        raise FileNotFoundError(f"Arquivos de entrada não encontrados: {', '.join(faltando)}")
+
+    metricas = Metricas("inferencia", args.metricas_log, args.metricas_prometheus)
+    parametros = {"tile_size": args.tile_size, "overlap": args.overlap, "threshold": args.threshold,
+                  "batch_size": args.batch_size, "mesclagem": args.mesclagem, "completar_bordas": args.completar_bordas}
+
+    segmentar_lote(inputs, args.output_dir, args.modelpath, args.backend, args.workers,
+                   args.memoria_max * 2**30 if args.memoria_max else None, args.threads_por_worker,
+                   parametros, triagem_tiles.criar_triagem(args), metricas, args.retomar)
+    metricas.finalizar()
@@ -0,0 +1,299 @@
+import os
+import argparse
+import numpy as np
+import rasterio
+import torch
+from rasterio.windows import Window
+from tqdm import tqdm
+
+from backends import BACKENDS, carregar_backend
+from inference_engine import BatchInferenceEngine
+from instrumentation import Metricas, adicionar_argumentos
+import triagem as triagem_tiles
+import piramide as piramide_tiles
+from diario import IndiceConteudo, hash_conteudo, impressao_digital
+from grade import posicoes_grade
+from mosaic import AcumuladorSobreposicao, RemendoMosaico, intersecao
+from optimize import amostra_tiles, criar_engine_otimizado, verificar_paridade
+
+
+# ============================================================
+# Pipeline em streaming: ortomosaico → tiles → U-Net → mosaico
+# Comentários
+# O raster de entrada é aberto uma única vez e os tiles são lidos como janelas,
+# sem gravar arquivos intermediários. Cada máscara é escrita diretamente na sua
+# janela do GeoTIFF de saída.
+# ============================================================
+
+def gerar_janelas(width, height, tile_size=1024, overlap=0.2, completar_bordas=True):
+    """
+    Gera as janelas (Window) do grid de tiles, na mesma ordem usada por crop_geotiff().
+    Janelas de borda podem ultrapassar o raster quando completar_bordas=True.
+    """
+    stride = int(tile_size * (1 - overlap))
+
+    for y in posicoes_grade(height, tile_size, stride, completar_bordas=completar_bordas):
+        for x in posicoes_grade(width, tile_size, stride, completar_bordas=completar_bordas):
+            yield Window(x, y, tile_size, tile_size)
+
+
+def recortar_janela(window, width, height):
+    """Janela limitada à área válida do raster (remove o padding dos tiles de borda)."""
+    return Window(window.col_off, window.row_off,
+                  min(window.width, width - window.col_off),
+                  min(window.height, height - window.row_off))
+
+
+def ler_tiles(src, tile_size=1024, overlap=0.2, completar_bordas=True, metricas=None, janelas=None):
+    """
+    Lê os tiles de um dataset Rasterio aberto como arrays RGB (H, W, 3) uint8.
+    Tiles de borda são completados com zeros até tile_size. Se `janelas` for informado,
+    lê apenas essas janelas (ex.: as que passaram pela triagem de tiles vazios).
+
+    Yields:
+        (window, tile): janela do tile no raster e os pixels correspondentes.
+    """
+    if src.count < 3:
+        raise ValueError("❌ O ortomosaico precisa ter ao menos 3 bandas (RGB).")
+    metricas = metricas or Metricas("inferencia")
+
+    if janelas is None:
+        janelas = gerar_janelas(src.width, src.height, tile_size, overlap, completar_bordas)
+
+    for window in janelas:
+        borda = window.col_off + window.width > src.width or window.row_off + window.height > src.height
+        with metricas.medir("leitura", tile=f"{window.col_off}_{window.row_off}"):
+            tile = src.read(indexes=[1, 2, 3], window=window, boundless=borda, fill_value=0)
+        metricas.contar("bytes_lidos", tile.nbytes)
+        tile = np.moveaxis(tile, 0, -1)  # (C,H,W) -> (H,W,C)
+
+        if tile.dtype != np.uint8:
+            tile = np.clip(tile, 0, 255).astype(np.uint8)
+
+        yield window, np.ascontiguousarray(tile)
+
+
+def perfil_mascara(src):
+    """Perfil do GeoTIFF de saída: uma banda uint8, mesma grade espacial da entrada."""
+    return {
+        "driver": "GTiff",
+        "width": src.width,
+        "height": src.height,
+        "count": 1,
+        "dtype": "uint8",
+        "crs": src.crs,
+        "transform": src.transform,
+        "tiled": True,
+        "blockxsize": 256,
+        "blockysize": 256,
+        "compress": "lzw",
+    }
+
+
+def caminho_indice(output_tif):
+    """Índice de hashes das janelas, gravado ao lado do mosaico de saída."""
+    return f"{os.path.splitext(output_tif)[0]}_indice.json"
+
+
+def chave_janela(window):
+    return f"{int(window.col_off)}_{int(window.row_off)}"
+
+
+def remendar_ortomosaico(engine, src, output_tif, janelas, alteradas, tile_size, overlap, mesclagem="cosseno",
+                         completar_bordas=True, metricas=None, triagem=None):
+    """
+    Segmenta de novo apenas as regiões das janelas alteradas e as reescreve no mosaico
+    existente. Os tiles vizinhos que se sobrepõem a elas também passam pela U-Net, para
+    que a combinação nas regiões reescritas seja idêntica à de uma execução completa.
+    """
+    metricas = metricas or engine.metricas
+    regioes = [recortar_janela(w, src.width, src.height) for w in alteradas]
+
+    with rasterio.open(output_tif, "r+") as dst:
+        remendo = RemendoMosaico(dst, regioes, tile_size, engine.threshold, mesclagem, metricas=metricas)
+        candidatas = [w for w in janelas if any(intersecao(w, r) for r in regioes)]
+        if triagem:
+            with metricas.medir("triagem", tiles=len(candidatas)):
+                candidatas = [w for w in candidatas if not triagem.vazia_janela(src, w)]
+        candidatas = remendo.preparar(candidatas)
+
+        tiles = ler_tiles(src, tile_size, overlap, completar_bordas, metricas, candidatas)
+        resultados = engine.run(tiles, probabilidades=mesclagem == "cosseno")
+        for window, pred in tqdm(resultados, total=len(candidatas), desc="Atualizando mosaico"):
+            remendo.adicionar(window, pred)
+        remendo.finalizar()
+
+    return len(candidatas)
+
+
+def segmentar_ortomosaico(model, device, input_tif, output_tif, tile_size=1024, overlap=0.2, threshold=0.59, batch_size=8,
+                          mesclagem="cosseno", completar_bordas=True, engine=None, metricas=None, triagem=None,
+                          piramide=None, incremental=False, id_modelo=None):
+    """
+    Segmenta um ortomosaico completo sem gerar tiles em disco.
+
+    Args:
+        model (nn.Module): U-Net carregada e em modo de avaliação.
+        device (torch.device): Dispositivo de inferência.
+        input_tif (str): GeoTIFF RGB de entrada.
+        output_tif (str): GeoTIFF de saída com a máscara (0/255).
+        tile_size (int): Tamanho (em pixels) de cada tile.
+        overlap (float): Sobreposição entre tiles (0.0–0.9).
+        threshold (float): Limiar de binarização da predição.
+        batch_size (int): Número de tiles por forward pass.
+        mesclagem (str): "cosseno" soma as probabilidades dos tiles sobrepostos com pesos
+            e binariza no final; "nenhuma" sobrescreve cada janela com a máscara do tile.
+        completar_bordas (bool): Segmenta também as faixas direita/inferior que não cabem
+            em um tile inteiro (tiles com padding).
+        engine (BatchInferenceEngine, opcional): Engine já configurado (ex.: modo otimizado);
+            substitui model/threshold/batch_size.
+        metricas (Metricas, opcional): Recebe os tempos de leitura, forward, limiar e escrita.
+            Padrão = as métricas do engine.
+        triagem (TriagemTiles, opcional): Tiles considerados vazios (nodata ou sem vegetação,
+            em baixa resolução) não são lidos nem segmentados; a máscara deles fica 0.
+        piramide (RefinamentoPiramide, opcional): Passada grossa no ortomosaico reduzido; só os
+            tiles com probabilidade incerta ou borda entre classes passam pela U-Net em resolução cheia.
+        incremental (bool): Grava o hash dos pixels de cada janela ao lado da saída. Se o índice e
+            o mosaico de uma execução anterior existirem (com os mesmos parâmetros), só as janelas
+            cujo conteúdo mudou são segmentadas de novo e reescritas no mosaico existente.
+        id_modelo (dict, opcional): Identificação do modelo (caminho, impressão digital...), gravada
+            nos parâmetros do índice: trocar o modelo invalida o índice.
+    """
+    if mesclagem not in ("cosseno", "nenhuma"):
+        raise ValueError("O parâmetro 'mesclagem' deve ser 'cosseno' ou 'nenhuma'.")
+    if incremental and piramide:
+        raise ValueError("O modo incremental não pode ser combinado com a inferência em pirâmide.")
+
+    if engine is None:
+        engine = BatchInferenceEngine(model, device, batch_size=batch_size, threshold=threshold, metricas=metricas)
+    metricas = metricas or engine.metricas
+
+    with rasterio.open(input_tif) as src:
+        janelas = list(gerar_janelas(src.width, src.height, tile_size, overlap, completar_bordas))
+        total = len(janelas)
+
+        indice = None
+        if incremental:
+            indice = IndiceConteudo(caminho_indice(output_tif), {
+                "tile_size": tile_size, "overlap": overlap, "mesclagem": mesclagem, "completar_bordas": completar_bordas,
+                "threshold": engine.threshold, "largura": src.width, "altura": src.height,
+                "transform": list(src.transform)[:6], "crs": str(src.crs),
+                "triagem": vars(triagem) if triagem else None, "modelo": id_modelo,
+            })
+            with metricas.medir("hash", tiles=total):
+                hashes = {chave_janela(w): hash_conteudo(tile)
+                          for w, tile in ler_tiles(src, tile_size, overlap, completar_bordas, metricas, janelas)}
+
+            if indice.anteriores and os.path.exists(output_tif):
+                alteradas = [w for w in janelas if not indice.inalterada(chave_janela(w), hashes[chave_janela(w)])]
+                metricas.contar("tiles_inalterados", total - len(alteradas))
+                print(f"♻️ {total - len(alteradas)} de {total} janelas sem alteração desde a última execução.")
+                if alteradas:
+                    n = remendar_ortomosaico(engine, src, output_tif, janelas, alteradas, tile_size, overlap,
+                                             mesclagem, completar_bordas, metricas, triagem)
+                    print(f"✅ {len(alteradas)} janelas alteradas ({n} tiles segmentados). Mosaico atualizado: {output_tif}")
+                # O índice só é atualizado depois do mosaico: uma atualização interrompida é refeita por inteiro
+                indice.salvar(hashes)
+                return
+
+            # Execução completa: um índice antigo não pode valer para um mosaico reescrito pela metade
+            if os.path.exists(indice.path):
+                os.remove(indice.path)
+
+        if triagem:
+            with metricas.medir("triagem", tiles=total):
+                janelas = [w for w in janelas if not triagem.vazia_janela(src, w)]
+            metricas.contar("tiles_pulados", total - len(janelas))
+            print(f"⏭️ {total - len(janelas)} de {total} tiles vazios: máscara 0 sem passar pela U-Net.")
+
+        refinar = janelas
+        if piramide:
+            with metricas.medir("passada_grossa", fator=piramide.fator):
+                mapa = piramide.mapa_grosso(engine, src, tile_size, metricas)
+            decisoes = [piramide.decidir(mapa, w, engine.threshold) for w in janelas]
+            if mesclagem == "nenhuma":
+                decisoes = [(r, None if r else (255 if p > engine.threshold else 0)) for r, p in decisoes]
+            refinar = [w for w, (r, _) in zip(janelas, decisoes) if r]
+            metricas.contar("tiles_refinados", len(refinar))
+            metricas.contar("tiles_homogeneos", len(janelas) - len(refinar))
+            print(f"🔍 Pirâmide (1/{piramide.fator}): {len(refinar)} de {len(janelas)} tiles refinados em resolução cheia.")
+
+        with rasterio.open(output_tif, "w", **perfil_mascara(src)) as dst:
+            # A saída começa zerada: tiles pulados não precisam ser escritos, e no modo
+            # cosseno só os tiles segmentados entram na média das regiões sobrepostas
+            tiles = ler_tiles(src, tile_size, overlap, completar_bordas, metricas, refinar)
+            resultados = engine.run(tiles, probabilidades=mesclagem == "cosseno")
+            if piramide:
+                resultados = piramide_tiles.intercalar(janelas, decisoes, resultados, tile_size, binario=mesclagem == "nenhuma")
+
+            if mesclagem == "cosseno":
+                acumulador = AcumuladorSobreposicao(dst, tile_size, engine.threshold, metricas=metricas)
+                for window, prob in tqdm(resultados, total=len(janelas), desc="Segmentando ortomosaico"):
+                    acumulador.adicionar(window, prob)
+                acumulador.finalizar()
+            else:
+                for window, mask in tqdm(resultados, total=len(janelas), desc="Segmentando ortomosaico"):
+                    valida = recortar_janela(window, dst.width, dst.height)
+                    with metricas.medir("escrita", tile=f"{window.col_off}_{window.row_off}"):
+                        dst.write(mask[:int(valida.height), :int(valida.width)], 1, window=valida)
+
+        if indice:
+            indice.salvar(hashes)
+
+    print(f"✅ {len(refinar)} tiles segmentados. Mosaico salvo em: {output_tif}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Segmentação de um ortomosaico completo com a U-Net, sem tiles intermediários")
+    parser.add_argument("--modelpath", required=True, help="Caminho do modelo treinado (.pth, ou artefato .pt/.onnx conforme o backend)")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Execução do modelo: eager (.pth), torchscript (.pt) ou onnx (.onnx, ONNX Runtime CPU)")
+    parser.add_argument("--input", required=True, help="GeoTIFF RGB de entrada")
+    parser.add_argument("--output", required=True, help="GeoTIFF de saída com a máscara segmentada")
+    parser.add_argument("--tile-size", type=int, default=1024, help="Tamanho (em pixels) de cada tile. Padrão = 1024.")
+    parser.add_argument("--overlap", type=float, default=0.2, help="Sobreposição entre tiles (0.0–0.9). Padrão = 0.2.")
+    parser.add_argument("--threshold", type=float, default=0.59, help="Limiar para binarização das máscaras")
+    parser.add_argument("--batch-size", type=int, default=8, help="Número de tiles por forward pass")
+    parser.add_argument("--mesclagem", choices=["cosseno", "nenhuma"], default="cosseno",
+                        help="Como combinar tiles sobrepostos: média ponderada das probabilidades (cosseno) ou sobrescrita (nenhuma)")
+    parser.add_argument("--bf16", action="store_true", help="Executa a U-Net em autocast bfloat16")
+    parser.add_argument("--channels-last", action="store_true", help="Usa o formato de memória channels_last (NHWC)")
+    parser.add_argument("--fundir-bn", action="store_true", help="Funde as camadas BatchNorm nas convoluções anteriores")
+    parser.add_argument("--iou-minimo", type=float, default=0.98, help="IoU mínimo entre as máscaras do modo otimizado e do float32")
+    parser.add_argument("--completar-bordas", action=argparse.BooleanOptionalAction, default=True,
+                        help="Segmenta também as bordas que não cabem em um tile inteiro (tiles com padding). Padrão = ativado.")
+    adicionar_argumentos(parser)
+    parser.add_argument("--incremental", action="store_true",
+                        help="Guarda o hash de cada janela ao lado da saída e, ao rodar de novo, só segmenta e reescreve as janelas que mudaram")
+    triagem_tiles.adicionar_argumentos(parser)
+    piramide_tiles.adicionar_argumentos(parser)
+
+    args = parser.parse_args()
+    if args.backend != "eager" and (args.bf16 or args.channels_last or args.fundir_bn):
+        parser.error("--bf16, --channels-last e --fundir-bn só se aplicam ao backend eager.")
+    if args.incremental and args.piramide:
+        parser.error("--incremental não pode ser combinado com --piramide.")
+
+    if not os.path.exists(args.input):
+        raise FileNotFoundError(f"Arquivo de entrada não encontrado: {args.input}")
+
+    device = torch.device("cuda" if torch.cuda.is_available() and args.backend != "onnx" else "cpu")
+    print(f"Rodando inferência em {device}")
+
+    model = carregar_backend(args.backend, args.modelpath, device)
+    metricas = Metricas("inferencia", args.metricas_log, args.metricas_prometheus)
+
+    engine = None
+    if args.bf16 or args.channels_last or args.fundir_bn:
+        engine = criar_engine_otimizado(model, device, args.batch_size, args.threshold,
+                                        bf16=args.bf16, channels_last=args.channels_last, fundir_bn=args.fundir_bn,
+                                        metricas=metricas)
+        with rasterio.open(args.input) as src:
+            amostra = amostra_tiles(ler_tiles(src, args.tile_size, args.overlap, args.completar_bordas), args.batch_size)
+        verificar_paridade(model, engine, amostra, args.iou_minimo)
+
+    segmentar_ortomosaico(model, device, args.input, args.output, args.tile_size, args.overlap, args.threshold, args.batch_size,
+                          args.mesclagem, args.completar_bordas, engine, metricas, triagem_tiles.criar_triagem(args),
+                          piramide_tiles.criar_piramide(args), args.incremental,
+                          {"modelo": os.path.abspath(args.modelpath), "entrada": impressao_digital(args.modelpath),
+                           "backend": args.backend, "otimizacoes": [args.bf16, args.channels_last, args.fundir_bn]})
+    metricas.finalizar()
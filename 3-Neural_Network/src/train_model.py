@@ -5,18 +5,36 @@ import torch.nn as nn
 import torch.optim as optim
 from torch.utils.data import DataLoader, random_split
 from tqdm import tqdm
-import albumentations as A
-from albumentations.pytorch import ToTensorV2
 
-from dataset import PlantSegmentationDataset
+from dataset import PlantSegmentationDataset, preparar_lote
+from augmentation import recortes_aleatorios, recortes_fixos, aumentar_lote
 from model import UNet
 
 
-def iou_score(pred, target, threshold=0.5):
+def contagens_iou(pred, target, threshold=0.5):
+    """Interseção e união (em pixels) do lote, para somar entre lotes e calcular o IoU do conjunto."""
     pred = (pred > threshold).float()
     intersection = (pred * target).sum()
     union = pred.sum() + target.sum() - intersection
-    return (intersection + 1e-6) / (union + 1e-6)
+    return intersection, union
+
+
+def criar_loaders(train_dataset, val_dataset, args, device, generator=None):
+    """DataLoaders de treino/validação com workers, prefetch e pinned memory configuráveis."""
+    loader_kwargs = {
+        "batch_size": args.batch_size,
+        "num_workers": args.num_workers,
+        "pin_memory": device.type == "cuda",
+    }
+    if args.num_workers > 0:
+        loader_kwargs.update({
+            "prefetch_factor": args.prefetch_factor,
+            "persistent_workers": args.persistent_workers,
+        })
+
+    train_loader = DataLoader(train_dataset, shuffle=True, generator=generator, **loader_kwargs)
+    val_loader = DataLoader(val_dataset, shuffle=False, **loader_kwargs)
+    return train_loader, val_loader
 
 
 def train(args):
@@ -27,23 +45,27 @@ def train(args):
     print(f"Máscaras: {args.groundtruth}")
     print(f"Saída: {args.modelpath}")
 
-    # Transformações
-    train_transform = A.Compose([
-        A.HorizontalFlip(p=0.5),
-        A.VerticalFlip(p=0.3),
-        A.RandomBrightnessContrast(p=0.2),
-        A.RandomCrop(512, 512),
-        ToTensorV2(),
-    ])
+    # Transformações: aplicadas em lote, sobre o tensor (ver augmentation.py)
+    if args.crop_size:
+        print(f"Recortes: {args.crops_per_tile} x {args.crop_size}px por tile (validação em grade fixa)")
+    if args.augmentacao:
+        print("Augmentação: flips e brilho/contraste aleatórios")
 
     # Dataset e DataLoaders
-    dataset = PlantSegmentationDataset(args.rgb, args.groundtruth, transform=None)
+    generator = torch.Generator().manual_seed(args.seed) if args.seed is not None else None
+
+    dataset = PlantSegmentationDataset(args.rgb, args.groundtruth, transform=None, cache_dir=args.cache_dir)
     val_size = int(0.1 * len(dataset))
+    if val_size == 0:
+        raise ValueError(f"❌ Conjunto de validação vazio: {len(dataset)} tiles (10% vão para a validação; são necessários pelo menos 10).")
     train_size = len(dataset) - val_size
-    train_dataset, val_dataset = random_split(dataset, [train_size, val_size])
+    if generator is not None:
+        train_dataset, val_dataset = random_split(dataset, [train_size, val_size], generator=generator)
+    else:
+        train_dataset, val_dataset = random_split(dataset, [train_size, val_size])
 
-    train_loader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False)
+    train_loader, val_loader = criar_loaders(train_dataset, val_dataset, args, device, generator)
+    non_blocking = device.type == "cuda"
 
     # Modelo
     model = UNet().to(device)
@@ -57,7 +79,12 @@ def train(args):
         total_loss = 0
 
         for imgs, masks in tqdm(train_loader, desc=f"Epoch {epoch}/{args.epochs} [Train]"):
-            imgs, masks = imgs.to(device), masks.to(device)
+            imgs, masks = preparar_lote(imgs.to(device, non_blocking=non_blocking), masks.to(device, non_blocking=non_blocking))
+            if args.crop_size:
+                imgs, masks = recortes_aleatorios(imgs, masks, args.crop_size, args.crops_per_tile, generator)
+            if args.augmentacao:
+                imgs, masks = aumentar_lote(imgs, masks, generator=generator)
+
             preds = model(imgs)
             loss = criterion(preds, masks)
 
@@ -71,14 +98,20 @@ def train(args):
 
         # Validação
         model.eval()
-        val_iou = 0
+        val_intersection, val_union = 0.0, 0.0
         with torch.no_grad():
             for imgs, masks in val_loader:
-                imgs, masks = imgs.to(device), masks.to(device)
+                imgs, masks = preparar_lote(imgs.to(device, non_blocking=non_blocking), masks.to(device, non_blocking=non_blocking))
+                if args.crop_size:
+                    imgs, masks = recortes_fixos(imgs, masks, args.crop_size)
                 preds = model(imgs)
-                val_iou += iou_score(preds, masks).item()
+                intersection, union = contagens_iou(preds, masks)
+                val_intersection += intersection.item()
+                val_union += union.item()
 
-        avg_iou = val_iou / len(val_loader)
+        # IoU do conjunto de validação inteiro (somas de todos os lotes), e não a média dos
+        # IoUs por lote, que dava a um último lote menor o mesmo peso dos demais
+        avg_iou = (val_intersection + 1e-6) / (val_union + 1e-6)
         print(f"📘 Epoch {epoch}: Train Loss={avg_loss:.4f} | Val IoU={avg_iou:.4f}")
 
         if avg_iou > best_iou:
@@ -97,6 +130,15 @@ if __name__ == "__main__":
     parser.add_argument("--epochs", type=int, default=20, help="Número de épocas de treinamento")
     parser.add_argument("--batch-size", type=int, default=4, help="Tamanho do batch")
     parser.add_argument("--lr", type=float, default=1e-4, help="Taxa de aprendizado")
+    parser.add_argument("--crop-size", type=int, default=None, help="Treina em recortes aleatórios deste tamanho (validação em recortes fixos). Padrão: tile inteiro")
+    parser.add_argument("--crops-per-tile", type=int, default=1,
+                        help="Recortes aleatórios extraídos de cada tile lido (com --crop-size). Cada passo processa batch-size x crops-per-tile recortes")
+    parser.add_argument("--augmentacao", action="store_true", help="Aplica flips e brilho/contraste aleatórios no treino")
+    parser.add_argument("--num-workers", type=int, default=0, help="Processos de carregamento de dados do DataLoader")
+    parser.add_argument("--prefetch-factor", type=int, default=2, help="Batches pré-carregados por worker (requer --num-workers > 0)")
+    parser.add_argument("--persistent-workers", action="store_true", help="Mantém os workers vivos entre épocas (requer --num-workers > 0)")
+    parser.add_argument("--seed", type=int, default=None, help="Semente para a divisão treino/validação e o embaralhamento")
+    parser.add_argument("--cache-dir", default=None, help="Diretório do cache de tiles decodificados (reaproveitado entre execuções)")
 
     args = parser.parse_args()
     train(args)
@@ -0,0 +1,82 @@
+import cv2
+import numpy as np
+from rasterio.enums import Resampling
+
+from grade import FRACAO_VALIDA_MINIMA, adicionar_argumentos_vazios, mascara_valida
+
+
+# ============================================================
+# Triagem de tiles vazios
+# Comentários
+# Antes da U-Net, cada tile passa por uma verificação barata em baixa resolução:
+# - fração de pixels válidos pela máscara do dataset (nodata / banda alfa);
+# - fração de pixels com GLI acima de um limiar, lida em resolução reduzida
+#   (o GDAL usa as overviews do ortomosaico, quando existem).
+# Tiles quase sem pixels válidos ou sem vegetação recebem a máscara constante 0
+# e não passam pelo modelo.
+# ============================================================
+
+class TriagemTiles:
+    """Decide se um tile é vazio (nodata/fundo) e pode pular a inferência."""
+
+    def __init__(self, fracao_valida_minima=FRACAO_VALIDA_MINIMA, gli_limiar=0.1, fracao_vegetacao_minima=0.002, fator=8):
+        """
+        Args:
+            fracao_valida_minima (float): Tiles com menos pixels válidos que isso são vazios.
+            gli_limiar (float): GLI (em [-1, 1]) a partir do qual um pixel conta como vegetação.
+            fracao_vegetacao_minima (float): Tiles com menos pixels de vegetação que isso são vazios.
+            fator (int): Redução de resolução usada na triagem (8 → tile de 1024 lido como 128x128).
+        """
+        self.fracao_valida_minima = fracao_valida_minima
+        self.gli_limiar = gli_limiar
+        self.fracao_vegetacao_minima = fracao_vegetacao_minima
+        self.fator = max(1, fator)
+
+    def fracao_vegetacao(self, rgb, validos=None):
+        """Fração dos pixels (de um array (H, W, 3)) com GLI acima do limiar."""
+        r, g, b = (rgb[..., i].astype(np.float32) for i in range(3))
+        num = 2 * g - r - b
+        den = 2 * g + r + b
+        vegetacao = num > self.gli_limiar * den  # GLI > limiar, sem dividir (den = 0 → não é vegetação)
+        if validos is not None:
+            vegetacao &= validos
+        return float(vegetacao.mean())
+
+    def vazia_janela(self, src, window):
+        """
+        Triagem de uma janela de um dataset Rasterio aberto, lida em resolução reduzida.
+        A parte da janela fora do raster (padding) conta como inválida.
+        """
+        validos, recorte, area = mascara_valida(src, window, self.fator)
+        if validos is None or validos.mean() * area < self.fracao_valida_minima:
+            return True
+
+        rgb = src.read(indexes=[1, 2, 3], window=recorte, out_shape=(3, *validos.shape), resampling=Resampling.average)
+        return self.fracao_vegetacao(np.moveaxis(rgb, 0, -1), validos) * area < self.fracao_vegetacao_minima
+
+    def vazio_tile(self, tile):
+        """
+        Triagem de um tile já decodificado (H, W, 3) RGB uint8, reduzido por média de área
+        (como nas overviews, o ruído de pixels isolados não conta como vegetação).
+        Pixels pretos (0, 0, 0) contam como nodata — bordas de ortomosaicos e padding dos tiles.
+        """
+        h, w = tile.shape[:2]
+        amostra = cv2.resize(tile, (max(1, w // self.fator), max(1, h // self.fator)), interpolation=cv2.INTER_AREA)
+        validos = amostra.any(axis=-1)
+        if validos.mean() < self.fracao_valida_minima:
+            return True
+        return self.fracao_vegetacao(amostra, validos) < self.fracao_vegetacao_minima
+
+
+def adicionar_argumentos(parser):
+    """Adiciona --pular-vazios e os limiares da triagem a um ArgumentParser."""
+    adicionar_argumentos_vazios(parser, "Não executa a U-Net em tiles vazios (nodata/fundo sem vegetação); eles recebem máscara 0")
+    parser.add_argument("--gli-limiar", type=float, default=0.1, help="GLI a partir do qual um pixel conta como vegetação na triagem")
+    parser.add_argument("--fracao-vegetacao-minima", type=float, default=0.002, help="Fração mínima de pixels com GLI acima do limiar para segmentar o tile")
+
+
+def criar_triagem(args):
+    """TriagemTiles a partir dos argumentos da linha de comando, ou None sem --pular-vazios."""
+    if not args.pular_vazios:
+        return None
+    return TriagemTiles(args.fracao_valida_minima, args.gli_limiar, args.fracao_vegetacao_minima)
@@ -0,0 +1,214 @@
+import os
+import csv
+import json
+import argparse
+from contextlib import ExitStack
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from tiling import limiar_mascara, ler_na_grade
+
+
+# ============================================================
+# Métricas de segmentação (IoU, Dice, precisão, revocação)
+# Comentários
+# Os mosaicos de máscaras (referência e predições: GLI, U-Net...) são lidos janela
+# por janela na grade da referência; em cada janela, os pares (referência, predição)
+# de todos os pixels viram um código 0–3 (referência * 2 + predição) e um único
+# np.bincount conta a matriz de confusão. As matrizes são guardadas por tile e somadas
+# no total, então as métricas globais contam pixels de verdade (não são médias de
+# médias) e o pico de memória é de uma janela por raster.
+# ============================================================
+
+class MatrizConfusao:
+    """Matriz de confusão binária (fundo / vegetação) acumulada por contagem vetorizada."""
+
+    def __init__(self, contagens=None):
+        # Índice = referência * 2 + predição → [vn, fp, fn, vp]
+        self.contagens = np.zeros(4, dtype=np.int64) if contagens is None else np.asarray(contagens, dtype=np.int64)
+
+    def adicionar(self, referencia, predicao, validos=None):
+        """
+        Acumula uma janela. referencia e predicao são arrays booleanos do mesmo formato;
+        validos (opcional) exclui pixels da contagem (ex.: nodata da referência).
+        """
+        codigos = referencia.astype(np.uint8) * 2 + predicao
+        if validos is not None:
+            codigos = codigos[validos]
+        self.contagens += np.bincount(codigos.ravel(), minlength=4)
+
+    def __iadd__(self, outra):
+        self.contagens += outra.contagens
+        return self
+
+    def metricas(self):
+        """
+        IoU, Dice, precisão, revocação e acurácia. Uma métrica sem denominador (ex.: IoU de
+        um tile sem vegetação na referência nem na predição) é None.
+        """
+        vn, fp, fn, vp = (int(c) for c in self.contagens)
+        return {
+            "iou": _razao(vp, vp + fp + fn),
+            "dice": _razao(2 * vp, 2 * vp + fp + fn),
+            "precisao": _razao(vp, vp + fp),
+            "revocacao": _razao(vp, vp + fn),
+            "acuracia": _razao(vp + vn, vp + vn + fp + fn),
+            "vp": vp, "fp": fp, "fn": fn, "vn": vn,
+        }
+
+
+def _razao(numerador, denominador):
+    return numerador / denominador if denominador else None
+
+
+def comparacoes(nomes, com_referencia=True, concordancia=True):
+    """
+    Pares (a, b) comparados: ("referencia", nome) para cada predição e, com concordancia=True,
+    cada par de predições (a primeira faz o papel de referência).
+    """
+    pares = [("referencia", nome) for nome in nomes] if com_referencia else []
+    if concordancia:
+        pares += [(a, b) for i, a in enumerate(nomes) for b in nomes[i + 1:]]
+    return pares
+
+
+def chave_comparacao(a, b):
+    return b if a == "referencia" else f"{a}_vs_{b}"
+
+
+def avaliar_janelas(predicoes, referencia=None, tile_size=1024, concordancia=True):
+    """
+    Percorre os mosaicos em tiles de tile_size x tile_size (sem sobreposição) na grade da
+    referência (ou da primeira predição, sem referência). Predições de outro tamanho são
+    lidas por vizinho mais próximo, como na sobreposição.
+
+    Args:
+        predicoes (dict): nome -> caminho do mosaico de máscara (0/255 ou 1 bit).
+        referencia (str, opcional): Mosaico de máscara de referência (ground truth). Pixels
+            com o valor nodata da referência não são contados.
+        concordancia (bool): Também compara as predições entre si.
+
+    Yields:
+        (window, {chave: MatrizConfusao}): matrizes do tile para cada comparação.
+    """
+    nomes = list(predicoes)
+    pares = comparacoes(nomes, referencia is not None, concordancia)
+    if not pares:
+        raise ValueError("Nada a comparar: informe uma referência ou ao menos duas predições.")
+
+    caminhos = ({"referencia": referencia} if referencia else {}) | predicoes
+    with ExitStack() as pilha:
+        fontes = {nome: pilha.enter_context(rasterio.open(caminho)) for nome, caminho in caminhos.items()}
+        limiares = {nome: limiar_mascara(src) for nome, src in fontes.items()}
+        grade = fontes["referencia"] if referencia else fontes[nomes[0]]
+        nodata = fontes["referencia"].nodata if referencia else None
+
+        for y in range(0, grade.height, tile_size):
+            for x in range(0, grade.width, tile_size):
+                window = Window(x, y, min(tile_size, grade.width - x), min(tile_size, grade.height - y))
+                brutos = {nome: ler_na_grade(src, window, grade.width, grade.height) for nome, src in fontes.items()}
+                validos = brutos["referencia"] != nodata if nodata is not None else None
+                binarias = {nome: bruto > limiares[nome] for nome, bruto in brutos.items()}
+
+                matrizes = {}
+                for a, b in pares:
+                    matriz = MatrizConfusao()
+                    matriz.adicionar(binarias[a], binarias[b], validos)
+                    matrizes[chave_comparacao(a, b)] = matriz
+                yield window, matrizes
+
+
+CAMPOS_CSV = ["tile", "x", "y", "largura", "altura", "comparacao", "iou", "dice", "precisao", "revocacao", "acuracia", "vp", "fp", "fn", "vn"]
+
+
+def avaliar(predicoes, referencia=None, tile_size=1024, concordancia=True, saida_csv=None):
+    """
+    Calcula as métricas globais (somando as matrizes de todos os tiles) de cada comparação.
+    Com saida_csv, grava as métricas de cada tile à medida que são calculadas.
+
+    Returns:
+        dict: chave da comparação -> métricas globais, mais "iou_medio_tiles" (média simples
+        do IoU dos tiles em que ele é definido).
+    """
+    totais, soma_iou, n_iou = {}, {}, {}
+    with ExitStack() as pilha:
+        escritor = None
+        if saida_csv:
+            escritor = csv.DictWriter(pilha.enter_context(open(saida_csv, "w", newline="")), fieldnames=CAMPOS_CSV)
+            escritor.writeheader()
+
+        for window, matrizes in avaliar_janelas(predicoes, referencia, tile_size, concordancia):
+            x, y = int(window.col_off), int(window.row_off)
+            for chave, matriz in matrizes.items():
+                totais.setdefault(chave, MatrizConfusao())
+                totais[chave] += matriz
+
+                valores = matriz.metricas()
+                if valores["iou"] is not None:
+                    soma_iou[chave] = soma_iou.get(chave, 0.0) + valores["iou"]
+                    n_iou[chave] = n_iou.get(chave, 0) + 1
+                if escritor:
+                    escritor.writerow({"tile": f"{x}_{y}", "x": x, "y": y, "largura": int(window.width),
+                                       "altura": int(window.height), "comparacao": chave, **valores})
+
+    resultado = {}
+    for chave, matriz in totais.items():
+        resultado[chave] = matriz.metricas()
+        resultado[chave]["iou_medio_tiles"] = soma_iou[chave] / n_iou[chave] if n_iou.get(chave) else None
+    return resultado
+
+
+def imprimir_tabela(resultado):
+    def fmt(valor):
+        return "   —  " if valor is None else f"{valor:.4f}"
+
+    largura = max(len("comparação"), *(len(chave) for chave in resultado))
+    print(f"{'comparação':<{largura}}  IoU     Dice    Precisão Revocação Acurácia")
+    for chave, m in resultado.items():
+        print(f"{chave:<{largura}}  {fmt(m['iou'])}  {fmt(m['dice'])}  {fmt(m['precisao'])}   {fmt(m['revocacao'])}    {fmt(m['acuracia'])}")
+
+
+def ler_predicoes(itens):
+    """Converte a lista de NOME=CAMINHO da linha de comando em um dict (na ordem informada)."""
+    predicoes = {}
+    for item in itens:
+        nome, sep, caminho = item.partition("=")
+        if not sep or not nome or not caminho:
+            raise ValueError(f"Predição inválida '{item}': use NOME=CAMINHO (ex.: unet=mascara_unet.tif).")
+        if nome == "referencia" or nome in predicoes:
+            raise ValueError(f"Nome de predição repetido ou reservado: '{nome}'.")
+        if not os.path.exists(caminho):
+            raise FileNotFoundError(f"Mosaico não encontrado: {caminho}")
+        predicoes[nome] = caminho
+    return predicoes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Métricas de segmentação (IoU, Dice, precisão, revocação) entre mosaicos de máscaras")
+    parser.add_argument("--referencia", default=None, help="Mosaico de máscara de referência (ground truth). Sem ela, só a concordância entre as predições")
+    parser.add_argument("--predicao", action="append", required=True, metavar="NOME=CAMINHO",
+                        help="Mosaico de máscara a avaliar (repita para cada um, ex.: --predicao gli=gli.tif --predicao unet=unet.tif)")
+    parser.add_argument("--tile-size", type=int, default=1024, help="Tamanho dos tiles das métricas por tile (e da janela de leitura)")
+    parser.add_argument("--sem-concordancia", action="store_true", help="Não compara as predições entre si")
+    parser.add_argument("--saida-json", default=None, help="Arquivo JSON com as métricas globais")
+    parser.add_argument("--saida-csv", default=None, help="Arquivo CSV com as métricas de cada tile")
+
+    args = parser.parse_args()
+    try:
+        predicoes = ler_predicoes(args.predicao)
+    except (ValueError, FileNotFoundError) as exc:
+        parser.error(str(exc))
+    if not comparacoes(list(predicoes), args.referencia is not None, not args.sem_concordancia):
+        parser.error("Nada a comparar: informe --referencia ou ao menos duas predições.")
+
+    resultado = avaliar(predicoes, args.referencia, args.tile_size, not args.sem_concordancia, args.saida_csv)
+    imprimir_tabela(resultado)
+
+    if args.saida_json:
+        with open(args.saida_json, "w") as f:
+            json.dump({"referencia": args.referencia, "predicoes": predicoes, "tile_size": args.tile_size,
+                       "global": resultado}, f, indent=2, ensure_ascii=False)
+        print(f"✅ Métricas globais salvas em: {args.saida_json}")
+    if args.saida_csv:
+        print(f"✅ Métricas por tile salvas em: {args.saida_csv}")
@@ -13,6 +13,8 @@ import rasterio
 from rasterio.transform import from_origin
 from glob import glob
 
+from mosaic import AcumuladorSobreposicao
+
 
 def crop_geotiff(input_tif, output_dir, tile_size=1024, overlap=0.2):
     os.makedirs(output_dir, exist_ok=True)
@@ -42,12 +44,95 @@ def crop_geotiff(input_tif, output_dir, tile_size=1024, overlap=0.2):
 
 import os
 import re
+import csv
 import cv2
 import numpy as np
 import rasterio
+import rasterio.shutil
 from rasterio.transform import from_origin
 
-def reconstruir_geotiff(tiles_dir, output_tif, tile_size=1024, overlap=0.2):
+
+def _caminho_temporario(output_path):
+    """GeoTIFF intermediário (tiled) ao lado da saída, usado antes da conversão para COG."""
+    return f"{os.path.splitext(output_path)[0]}_tmp.tif"
+
+
+def escrever_cog(temporario, output_path, mascara_1bit=False, reamostragem=Resampling.nearest, bloco=512):
+    """
+    Converte um GeoTIFF tiled em Cloud-Optimized GeoTIFF (COG) e remove o arquivo de origem.
+
+    As overviews (fatores 2, 4, 8...) são construídas pelo GDAL no próprio arquivo de origem,
+    bloco a bloco, e copiadas para o COG sem recálculo; os blocos de bloco x bloco pixels
+    ficam alinhados com as overviews, então leitores de regiões pequenas decodificam só
+    os blocos que precisam.
+
+    Args:
+        temporario (str): GeoTIFF de origem (tiled), removido ao final.
+        output_path (str): COG de saída.
+        mascara_1bit (bool): Grava a máscara com 1 bit por pixel (NBITS=1; valores 0/1).
+            Caso contrário usa DEFLATE com predictor horizontal.
+        reamostragem (Resampling): Reamostragem das overviews (nearest para máscaras,
+            average para imagens).
+        bloco (int): Tamanho dos blocos internos (px).
+    """
+    try:
+        with rasterio.open(temporario, "r+") as src:
+            fatores = []
+            while max(src.width, src.height) / (2 ** (len(fatores) + 1)) >= bloco:
+                fatores.append(2 ** (len(fatores) + 1))
+            if fatores:
+                src.build_overviews(fatores, reamostragem)
+
+        opcoes = {"COMPRESS": "DEFLATE", "BLOCKSIZE": bloco, "OVERVIEWS": "FORCE_USE_EXISTING"}
+        if mascara_1bit:
+            opcoes["NBITS"] = 1
+        else:
+            opcoes["PREDICTOR"] = 2
+
+        rasterio.shutil.copy(temporario, output_path, driver="COG", **opcoes)
+    finally:
+        os.remove(temporario)
+
+def ler_manifesto(manifest_path, tiles_dir):
+    """
+    Lê o manifest.csv gerado pelo crop_geotiff() do módulo 1-Tiling.
+    Retorna as coordenadas (x, y, caminho, largura_valida, altura_valida), o tamanho
+    total do mosaico e o transform da origem do raster.
+
+    O tamanho é o do raster de entrada (colunas largura_raster/altura_raster), mesmo que
+    tiles de borda tenham sido pulados no tiling; manifestos antigos, sem essas colunas,
+    usam a extensão coberta pelos tiles.
+    """
+    with open(manifest_path, newline="") as f:
+        registros = list(csv.DictReader(f))
+    if not registros:
+        raise ValueError(f"❌ Manifesto vazio: {manifest_path}")
+
+    coords = []
+    for r in registros:
+        path = os.path.join(tiles_dir, r["arquivo"])
+        if not os.path.exists(path):
+            print(f"⚠️ Tile do manifesto não encontrado: {r['arquivo']}, pulando...")
+            continue
+        coords.append((int(r["x"]), int(r["y"]), path, int(r["largura_valida"]), int(r["altura_valida"])))
+
+    if registros[0].get("largura_raster"):
+        total_w, total_h = int(registros[0]["largura_raster"]), int(registros[0]["altura_raster"])
+    else:
+        total_w = max(int(r["x"]) + int(r["largura_valida"]) for r in registros)
+        total_h = max(int(r["y"]) + int(r["altura_valida"]) for r in registros)
+
+    # Origem do raster = pixel (-x, -y) no sistema do tile
+    r = registros[0]
+    t = rasterio.Affine(*(float(r[c]) for c in ("a", "b", "c", "d", "e", "f")))
+    x0, y0 = t * (-int(r["x"]), -int(r["y"]))
+    transform = from_origin(x0, y0, t.a, -t.e)
+
+    return coords, total_w, total_h, transform
+
+
+def reconstruir_geotiff(tiles_dir, output_tif, tile_size=1024, overlap=0.2, janelado=False, manifesto=None,
+                        cog=False, mascara_1bit=False, mesclagem="cosseno"):
     """
     Reconstrói um único GeoTIFF a partir dos tiles segmentados,
     seguindo a mesma lógica de coordenadas usada na função crop_geotiff().
@@ -57,28 +142,52 @@ def reconstruir_geotiff(tiles_dir, output_tif, tile_size=1024, overlap=0.2):
         output_tif (str): Caminho de saída do mosaico final
         tile_size (int): Tamanho dos tiles originais (em pixels)
         overlap (float): Sobreposição usada no recorte original (ex: 0.2)
+        janelado (bool): Se True, cria o GeoTIFF de saída (tiled, comprimido) antes e
+            escreve cada tile na sua janela, sem alocar o mosaico inteiro em memória.
+        manifesto (str, opcional): manifest.csv gerado no tiling. Se informado, posições,
+            regiões válidas (sem padding) e georreferência vêm dele, sem listar/parsear nomes.
+        cog (bool): Grava um Cloud-Optimized GeoTIFF (blocos 512x512, overviews, DEFLATE).
+            O mosaico é montado no modo janelado em um arquivo intermediário.
+        mascara_1bit (bool): Com cog=True, grava a máscara com 1 bit por pixel (valores 0/1).
+        mesclagem (str): "cosseno" combina as máscaras sobrepostas por média ponderada (janela
+            cosseno, como na segmentação direta do ortomosaico) em uma faixa da altura de um tile,
+            sem alocar o mosaico inteiro; "nenhuma" sobrescreve na ordem dos tiles.
     """
-    # Lista de tiles
-    tile_files = [f for f in os.listdir(tiles_dir) if f.endswith((".tif", ".tiff"))]
-    if not tile_files:
-        raise ValueError("❌ Nenhum arquivo .tif encontrado no diretório informado.")
-
-    # Extrai as coordenadas (x, y) do nome do arquivo
-    coords = []
-    for f in tile_files:
-        match = re.search(r"tile_(\d+)_(\d+)", f)
-        if match:
-            x, y = map(int, match.groups())
-            coords.append((x, y, os.path.join(tiles_dir, f)))
-    if not coords:
-        raise ValueError("❌ Nenhum nome de arquivo no formato tile_X_Y.tif foi encontrado.")
-
-    # Determina a largura/altura total
-    stride = int(tile_size * (1 - overlap))
-    max_x = max(x for x, _, _ in coords)
-    max_y = max(y for _, y, _ in coords)
-    total_w = max_x + tile_size
-    total_h = max_y + tile_size
+    if mesclagem not in ("cosseno", "nenhuma"):
+        raise ValueError(f"❌ Mesclagem desconhecida: {mesclagem} (use 'cosseno' ou 'nenhuma').")
+
+    if cog:
+        temporario = _caminho_temporario(output_tif)
+        reconstruir_geotiff(tiles_dir, temporario, tile_size, overlap, janelado=True, manifesto=manifesto, mesclagem=mesclagem)
+        escrever_cog(temporario, output_tif, mascara_1bit=mascara_1bit)
+        print(f"☁️ COG salvo em: {output_tif}")
+        return
+
+    if manifesto:
+        coords, total_w, total_h, transform = ler_manifesto(manifesto, tiles_dir)
+        if not coords:
+            raise ValueError("❌ Nenhum tile do manifesto foi encontrado no diretório informado.")
+    else:
+        # Lista de tiles
+        tile_files = [f for f in os.listdir(tiles_dir) if f.endswith((".tif", ".tiff"))]
+        if not tile_files:
+            raise ValueError("❌ Nenhum arquivo .tif encontrado no diretório informado.")
+
+        # Extrai as coordenadas (x, y) do nome do arquivo
+        coords = []
+        for f in tile_files:
+            match = re.search(r"tile_(\d+)_(\d+)", f)
+            if match:
+                x, y = map(int, match.groups())
+                coords.append((x, y, os.path.join(tiles_dir, f), None, None))
+        if not coords:
+            raise ValueError("❌ Nenhum nome de arquivo no formato tile_X_Y.tif foi encontrado.")
+
+        # Determina a largura/altura total
+        max_x = max(c[0] for c in coords)
+        max_y = max(c[1] for c in coords)
+        total_w = max_x + tile_size
+        total_h = max_y + tile_size
 
     # Abre o primeiro tile para obter metadados
     with rasterio.open(coords[0][2]) as src:
@@ -87,11 +196,22 @@ def reconstruir_geotiff(tiles_dir, output_tif, tile_size=1024, overlap=0.2):
         count = src.count
         transform0 = src.transform
 
-    # Calcula o novo transform (assumindo origem no tile_0_0)
-    xres = transform0.a
-    yres = -transform0.e
-    x0, y0 = transform0.c, transform0.f
-    transform = from_origin(x0, y0, xres, yres)
+    if not manifesto:
+        # Calcula o novo transform (assumindo origem no tile_0_0)
+        xres = transform0.a
+        yres = -transform0.e
+        x0, y0 = transform0.c, transform0.f
+        transform = from_origin(x0, y0, xres, yres)
+
+    if mesclagem == "cosseno":
+        if count != 1:
+            raise ValueError("❌ A mesclagem cosseno combina máscaras de uma banda; use mesclagem='nenhuma'.")
+        _reconstruir_mesclado(coords, output_tif, profile, total_w, total_h, transform, tile_size, janelado)
+        return
+
+    if janelado:
+        _reconstruir_janelado(coords, output_tif, profile, total_w, total_h, transform)
+        return
 
     # Cria uma matriz vazia para o mosaico
     mosaic = np.zeros((count, total_h, total_w), dtype=dtype)
@@ -99,9 +219,9 @@ def reconstruir_geotiff(tiles_dir, output_tif, tile_size=1024, overlap=0.2):
     print(f"🧩 Reconstruindo mosaico de {total_w}x{total_h}px a partir de {len(coords)} tiles...")
 
     # Preenche o mosaico
-    for x, y, path in coords:
+    for x, y, path, wv, hv in coords:
         with rasterio.open(path) as src:
-            tile = src.read()
+            tile = src.read()[:, :hv, :wv]
             h, w = tile.shape[1], tile.shape[2]
             mosaic[:, y:y+h, x:x+w] = tile
 
@@ -120,6 +240,64 @@ def reconstruir_geotiff(tiles_dir, output_tif, tile_size=1024, overlap=0.2):
     print(f"✅ Mosaico reconstruído salvo em: {output_tif}")
 
 
+def _reconstruir_mesclado(coords, output_tif, profile, total_w, total_h, transform, tile_size, janelado):
+    """
+    Soma as máscaras (0/255 → 0/1) com o peso da janela cosseno e marca como vegetação os
+    pixels com média ponderada acima de 0.5: nas sobreposições prevalece o tile em que o
+    pixel está mais perto do centro, como em segment_orthomosaic.py. Os tiles entram em
+    ordem de varredura no AcumuladorSobreposicao, que mantém só uma faixa em memória.
+    """
+    profile.update({
+        "height": total_h,
+        "width": total_w,
+        "transform": transform,
+        "dtype": "uint8",
+        "compress": "lzw"
+    })
+    if janelado:
+        profile.update({"tiled": True, "blockxsize": 256, "blockysize": 256})
+
+    print(f"🧩 Reconstruindo mosaico de {total_w}x{total_h}px a partir de {len(coords)} tiles (mesclagem cosseno)...")
+
+    with rasterio.open(output_tif, "w", **profile) as dst:
+        acumulador = AcumuladorSobreposicao(dst, tile_size, threshold=0.5)
+        for x, y, path, wv, hv in sorted(coords, key=lambda c: (c[1], c[0])):
+            with rasterio.open(path) as src:
+                tile = src.read(1)[:hv, :wv]
+            acumulador.adicionar(Window(x, y, tile.shape[1], tile.shape[0]), (tile > 127).astype(np.float32))
+        acumulador.finalizar()
+
+    print(f"✅ Mosaico reconstruído salvo em: {output_tif}")
+
+
+def _reconstruir_janelado(coords, output_tif, profile, total_w, total_h, transform):
+    """
+    Escreve cada tile diretamente na sua janela de um GeoTIFF criado previamente.
+    O pico de memória fica limitado a um tile, independente do tamanho do mosaico.
+    """
+    profile.update({
+        "height": total_h,
+        "width": total_w,
+        "transform": transform,
+        "compress": "lzw",
+        "tiled": True,
+        "blockxsize": 256,
+        "blockysize": 256
+    })
+
+    print(f"🧩 Reconstruindo mosaico de {total_w}x{total_h}px a partir de {len(coords)} tiles (modo janelado)...")
+
+    # Ordem de varredura (linha a linha) para manter os blocos de saída em cache
+    with rasterio.open(output_tif, "w", **profile) as dst:
+        for x, y, path, wv, hv in sorted(coords, key=lambda c: (c[1], c[0])):
+            with rasterio.open(path) as src:
+                tile = src.read()[:, :hv, :wv]
+            h, w = tile.shape[1], tile.shape[2]
+            dst.write(tile, window=Window(x, y, w, h))
+
+    print(f"✅ Mosaico reconstruído salvo em: {output_tif}")
+
+
 def dividir_treino_teste_geotiff(input_tif, output_train, output_test, eixo="vertical"):
     """
     Divide um GeoTIFF em duas metades (treino e teste),
@@ -177,66 +355,131 @@ import numpy as np
 import cv2
 import rasterio
 import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-def sobrepor_mascara_verde(imagem_path, mascara_path, output_path, alpha=0.4):
+def _luts_verde(alpha):
+    """
+    Tabelas (256,) uint8 da mistura com o verde puro (0, 255, 0): uma para o canal verde e
+    outra para os demais. Calculadas com cv2.addWeighted, dão o mesmo resultado da mistura
+    pixel a pixel, com uma única consulta por pixel.
+    """
+    valores = np.arange(256, dtype=np.uint8).reshape(1, -1)
+    outros = cv2.addWeighted(valores, 1 - alpha, np.zeros_like(valores), alpha, 0).ravel()
+    verde = cv2.addWeighted(valores, 1 - alpha, np.full_like(valores, 255), alpha, 0).ravel()
+    return outros, verde
+
+
+def _indices_vizinho(inicio, n, escala, limite):
+    """Índices da máscara correspondentes a [inicio, inicio + n) na imagem (mesma regra do cv2.INTER_NEAREST)."""
+    return np.minimum(np.floor(np.arange(inicio, inicio + n) * escala).astype(np.int64), limite - 1)
+
+
+def limiar_mascara(mask_src):
+    """Valores acima do limiar são vegetação: 0 para máscaras de 1 bit (0/1), 127 para 0/255."""
+    return 0 if mask_src.tags(1, ns="IMAGE_STRUCTURE").get("NBITS") == "1" else 127
+
+
+def ler_na_grade(mask_src, window, largura, altura):
+    """
+    Lê a banda 1 de mask_src correspondente à janela `window` de uma grade largura x altura
+    (ex.: a da imagem). Se a máscara tiver outro tamanho, usa o vizinho mais próximo,
+    lendo só a região correspondente.
+    """
+    if (mask_src.width, mask_src.height) == (largura, altura):
+        return mask_src.read(1, window=window)
+
+    x, y, w, h = int(window.col_off), int(window.row_off), int(window.width), int(window.height)
+    cols = _indices_vizinho(x, w, mask_src.width / largura, mask_src.width)
+    rows = _indices_vizinho(y, h, mask_src.height / altura, mask_src.height)
+    regiao = mask_src.read(1, window=Window(cols[0], rows[0], cols[-1] - cols[0] + 1, rows[-1] - rows[0] + 1))
+    return regiao[np.ix_(rows - rows[0], cols - cols[0])]
+
+
+def _sobrepor_bloco(img_src, mask_src, window, luts, limiar):
+    """Lê um bloco alinhado da imagem e da máscara e devolve o bloco (C, h, w) uint8 com a sobreposição."""
+    bloco = img_src.read(window=window)
+    if bloco.dtype != np.uint8:
+        bloco = np.clip(bloco, 0, 255).astype(np.uint8)
+
+    selecao = ler_na_grade(mask_src, window, img_src.width, img_src.height) > limiar
+    for banda, lut in zip(bloco, luts):
+        np.copyto(banda, cv2.LUT(banda, lut), where=selecao)
+    return bloco
+
+
+def sobrepor_mascara_verde(imagem_path, mascara_path, output_path, alpha=0.4, cog=False, bloco=512, workers=1):
     """
     Sobrepõe uma máscara binária sobre a imagem original, colorindo em verde as áreas segmentadas.
-    Suporta imagens RGB e RGBA.
+    Suporta imagens RGB e RGBA, e máscaras 0/255 ou de 1 bit (0/1).
+    Com cog=True, a saída é um Cloud-Optimized GeoTIFF com overviews.
+
+    A imagem e a máscara são lidas em blocos alinhados de bloco x bloco pixels, misturadas
+    por consulta a tabela (sem camada verde nem cópias da imagem inteira) e cada bloco é
+    escrito na saída — o pico de memória fica em alguns blocos, independente do tamanho do
+    ortomosaico. Com workers > 1, os blocos são processados em threads (leitura/decodificação
+    do GDAL e cv2.LUT liberam o GIL), cada uma com os próprios handles dos rasters; a escrita
+    permanece na thread principal, na ordem dos blocos.
     """
-    # Lê a imagem original
-    with rasterio.open(imagem_path) as src:
-        img = src.read()
-        img = np.moveaxis(img, 0, -1)  # (C,H,W) -> (H,W,C)
-        profile = src.profile
+    outros, verde = _luts_verde(alpha)
 
-    # Lê a máscara e garante o mesmo tamanho
-    with rasterio.open(mascara_path) as src:
-        mask = src.read(1)
+    with rasterio.open(imagem_path) as img_src, rasterio.open(mascara_path) as mask_src:
+        limiar = limiar_mascara(mask_src)
 
-    if mask.shape[:2] != img.shape[:2]:
-        mask = cv2.resize(mask, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST)
+        # Banda 2 recebe o verde; com 4 canais (RGBA), o alfa é mantido
+        n_mistura = 3 if img_src.count == 4 else img_src.count
+        luts = [verde if i == 1 else outros for i in range(n_mistura)]
 
-    # Cria máscara binária
-    mask_bin = (mask > 127).astype(np.uint8)
+        profile = img_src.profile.copy()
+        profile.update({"count": img_src.count, "dtype": "uint8"})
+        if cog or profile["driver"] == "GTiff":
+            profile.update({"driver": "GTiff", "tiled": True, "blockxsize": bloco, "blockysize": bloco})
 
-    # Normaliza a imagem
-    if img.dtype != np.uint8:
-        img = np.clip(img, 0, 255).astype(np.uint8)
+        janelas = [
+            Window(x, y, min(bloco, img_src.width - x), min(bloco, img_src.height - y))
+            for y in range(0, img_src.height, bloco)
+            for x in range(0, img_src.width, bloco)
+        ]
 
-    # Se a imagem tiver 4 canais (RGBA), ignora o alfa para colorir
-    if img.shape[2] == 4:
-        rgb = img[:, :, :3].copy()
-        alpha_channel = img[:, :, 3]
-    else:
-        rgb = img.copy()
-        alpha_channel = None
-
-    # Cria camada verde
-    green_layer = np.zeros_like(rgb)
-    green_layer[:, :, 1] = 255
-
-    # Aplica a sobreposição verde
-    blended = rgb.copy()
-    blended[mask_bin == 1] = cv2.addWeighted(
-        rgb[mask_bin == 1], 1 - alpha,
-        green_layer[mask_bin == 1], alpha,
-        0
-    )
-
-    # Reanexa o canal alfa se existir
-    if alpha_channel is not None:
-        blended = np.dstack((blended, alpha_channel))
-
-    # Atualiza perfil e salva
-    blended_raster = np.moveaxis(blended, -1, 0)  # (H,W,C) -> (C,H,W)
-    profile.update({
-        "count": blended_raster.shape[0],
-        "dtype": 'uint8'
-    })
+        destino = _caminho_temporario(output_path) if cog else output_path
+        with rasterio.open(destino, "w", **profile) as dst:
+            if workers <= 1:
+                for window in janelas:
+                    dst.write(_sobrepor_bloco(img_src, mask_src, window, luts, limiar), window=window)
+            else:
+                _sobrepor_paralelo(imagem_path, mascara_path, dst, janelas, luts, limiar, workers)
 
-    with rasterio.open(output_path, "w", **profile) as dst:
-        dst.write(blended_raster)
+    if cog:
+        escrever_cog(destino, output_path, reamostragem=Resampling.average)
 
     print(f"✅ Máscara sobreposta salva em: {output_path}")
 
 
+def _sobrepor_paralelo(imagem_path, mascara_path, dst, janelas, luts, limiar, workers):
+    """Processa os blocos em threads e escreve na ordem, com no máximo 2 * workers blocos em memória."""
+    local = threading.local()
+    abertos = []
+    trava = threading.Lock()
+
+    def processar(window):
+        if not hasattr(local, "img_src"):
+            local.img_src, local.mask_src = rasterio.open(imagem_path), rasterio.open(mascara_path)
+            with trava:
+                abertos.extend((local.img_src, local.mask_src))
+        return _sobrepor_bloco(local.img_src, local.mask_src, window, luts, limiar)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pendentes = deque()
+            for window in janelas:
+                pendentes.append((window, pool.submit(processar, window)))
+                if len(pendentes) >= 2 * workers:
+                    w, futuro = pendentes.popleft()
+                    dst.write(futuro.result(), window=w)
+            while pendentes:
+                w, futuro = pendentes.popleft()
+                dst.write(futuro.result(), window=w)
+    finally:
+        for src in abertos:
+            src.close()
@@ -0,0 +1,343 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+import importlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from rasterio.transform import from_origin
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# ============================================================
+# Benchmark do pipeline (tiling, GLI, inferência, reconstrução)
+# Comentários
+# Gera um ortomosaico sintético e mede cada estágio e o pipeline de ponta a ponta,
+# reportando throughput (MP/s, tiles/s), latência p50/p95 e pico de memória (RSS)
+# em JSON, para comparar execuções entre commits.
+# Cada estágio roda em um processo novo: os módulos de cada pasta (1-Tiling/utils.py,
+# 2-Segmentation/utils.py, ...) não colidem entre si e o pico de RSS é o do estágio.
+# ============================================================
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ESTAGIOS = ("tiling", "gli", "inferencia", "reconstrucao", "ponta_a_ponta")
+
+# Pastas adicionadas ao sys.path de cada estágio (além da comum/, usada por todos)
+CAMINHOS = {
+    "tiling": ["1-Tiling"],
+    "gli": ["2-Segmentation"],
+    "inferencia": ["3-Neural_Network/src"],
+    "reconstrucao": ["4-Evaluation"],
+    "ponta_a_ponta": ["1-Tiling", "3-Neural_Network/src", "4-Evaluation"],
+}
+
+# Estágio que gera as entradas de cada estágio (tiles ou máscaras preditas)
+DEPENDENCIAS = {"gli": "tiling", "inferencia": "tiling", "reconstrucao": "inferencia"}
+
+
+def gerar_ortomosaico(path, largura, altura, seed=0, faixa=1024):
+    """
+    Gera um GeoTIFF RGB sintético (solo + linhas de plantio com ruído), escrito em
+    faixas de linhas para que ortomosaicos grandes não precisem caber em memória.
+    """
+    rng = np.random.default_rng(seed)
+    profile = {
+        "driver": "GTiff", "dtype": "uint8", "count": 3,
+        "width": largura, "height": altura,
+        "crs": "EPSG:32723", "transform": from_origin(500000, 7500000, 0.05, 0.05),
+        "tiled": True, "blockxsize": 256, "blockysize": 256, "compress": "lzw",
+    }
+
+    solo = np.array([120, 95, 70], dtype=np.float32)[:, None, None]
+    planta = np.array([60, 140, 50], dtype=np.float32)[:, None, None]
+    xs = np.arange(largura, dtype=np.float32)
+
+    with rasterio.open(path, "w", **profile) as dst:
+        for y in range(0, altura, faixa):
+            h = min(faixa, altura - y)
+            ys = np.arange(y, y + h, dtype=np.float32)[:, None]
+
+            # Linhas de plantio levemente onduladas, com falhas aleatórias
+            cobertura = np.sin(xs / 12.0 + np.sin(ys / 150.0) * 3) > 0.2
+            cobertura &= rng.random((h, largura)) > 0.1
+
+            bloco = np.where(cobertura[None], planta, solo)
+            bloco += rng.normal(0, 12, (3, h, largura))
+            dst.write(np.clip(bloco, 0, 255).astype(np.uint8), window=Window(0, y, largura, h))
+
+
+def _pico_rss_mb():
+    """Pico de RSS (MB) do processo e dos filhos já finalizados. None fora de sistemas Unix."""
+    if resource is None:
+        return None
+    pico = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def _cronometrar(funcao, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcao(*args, **kwargs)
+    return time.perf_counter() - inicio, resultado
+
+
+def _recriar(diretorio):
+    shutil.rmtree(diretorio, ignore_errors=True)
+    os.makedirs(diretorio)
+
+
+def _listar_tiles(tiles_dir):
+    return sorted(f for f in os.listdir(tiles_dir) if f.endswith(".tif"))
+
+
+def _carregar_modelo(cfg):
+    """Modelo treinado (--modelpath) ou U-Net com pesos aleatórios fixos (o custo é o mesmo)."""
+    import torch
+    from model import UNet
+    from backends import carregar_modelo
+
+    device = torch.device("cpu")
+    if cfg["modelpath"]:
+        return carregar_modelo(cfg["modelpath"], device), device
+
+    torch.manual_seed(0)
+    return UNet().to(device).eval(), device
+
+
+def _inferir_tiles(model, device, tiles_dir, masks_dir, threshold, latencias=None):
+    import cv2
+    from model_inference import predict_image
+
+    for nome in _listar_tiles(tiles_dir):
+        inicio = time.perf_counter()
+        mask = predict_image(model, device, os.path.join(tiles_dir, nome), threshold)
+        if latencias is not None:
+            latencias.append(time.perf_counter() - inicio)
+        cv2.imwrite(os.path.join(masks_dir, nome), mask)
+
+
+def _bench_tiling(cfg):
+    utils = importlib.import_module("utils")
+    tempos = []
+    for _ in range(cfg["repeticoes"]):
+        _recriar(cfg["tiles_dir"])
+        t, _ = _cronometrar(utils.crop_geotiff, cfg["ortomosaico"], cfg["tiles_dir"], cfg["tile_size"],
+                            cfg["overlap"], workers=cfg["workers"], completar_bordas=True)
+        tempos.append(t)
+
+    n_tiles = len(_listar_tiles(cfg["tiles_dir"]))
+    return {"tempos": tempos, "latencias": tempos, "unidade_latencia": "execucao",
+            "tiles": n_tiles, "megapixels": cfg["megapixels"]}
+
+
+def _bench_gli(cfg):
+    utils = importlib.import_module("utils")
+    pipeline = utils.GLIMaskPipeline(utils.GLICalculator(), utils.ThresholdMaskGenerator())
+    masks_dir = os.path.join(cfg["workdir"], "masks_gli")
+
+    tempos = []
+    for _ in range(cfg["repeticoes"]):
+        _recriar(masks_dir)
+        t, _ = _cronometrar(pipeline.run, cfg["tiles_dir"], masks_dir, workers=cfg["workers"])
+        tempos.append(t)
+
+    # Latência por tile: uma passada serial, tile a tile
+    latencias = []
+    nomes = _listar_tiles(cfg["tiles_dir"])
+    for nome in nomes:
+        t, _ = _cronometrar(pipeline.processar_arquivo, cfg["tiles_dir"], masks_dir, nome)
+        latencias.append(t)
+
+    return {"tempos": tempos, "latencias": latencias, "unidade_latencia": "tile",
+            "tiles": len(nomes), "megapixels": len(nomes) * cfg["tile_size"] ** 2 / 1e6}
+
+
+def _bench_inferencia(cfg):
+    model, device = _carregar_modelo(cfg)
+    nomes = _listar_tiles(cfg["tiles_dir"])
+
+    tempos, latencias = [], []
+    for _ in range(cfg["repeticoes"]):
+        _recriar(cfg["masks_dir"])
+        t, _ = _cronometrar(_inferir_tiles, model, device, cfg["tiles_dir"], cfg["masks_dir"],
+                            cfg["threshold"], latencias)
+        tempos.append(t)
+
+    return {"tempos": tempos, "latencias": latencias, "unidade_latencia": "tile",
+            "tiles": len(nomes), "megapixels": len(nomes) * cfg["tile_size"] ** 2 / 1e6}
+
+
+def _bench_reconstrucao(cfg):
+    tiling = importlib.import_module("tiling")
+    manifesto = os.path.join(cfg["tiles_dir"], "manifest.csv")
+    output_tif = os.path.join(cfg["workdir"], "reconstrucao.tif")
+
+    tempos = []
+    for _ in range(cfg["repeticoes"]):
+        t, _ = _cronometrar(tiling.reconstruir_geotiff, cfg["masks_dir"], output_tif, cfg["tile_size"],
+                            cfg["overlap"], janelado=cfg["janelado"], manifesto=manifesto)
+        tempos.append(t)
+
+    return {"tempos": tempos, "latencias": tempos, "unidade_latencia": "execucao",
+            "tiles": len(_listar_tiles(cfg["masks_dir"])), "megapixels": cfg["megapixels"]}
+
+
+def _bench_ponta_a_ponta(cfg):
+    """Ortomosaico → tiles → máscaras da U-Net → mosaico reconstruído."""
+    utils = importlib.import_module("utils")
+    tiling = importlib.import_module("tiling")
+    model, device = _carregar_modelo(cfg)
+
+    tiles_dir = os.path.join(cfg["workdir"], "e2e_tiles")
+    masks_dir = os.path.join(cfg["workdir"], "e2e_masks")
+    output_tif = os.path.join(cfg["workdir"], "e2e_mascara.tif")
+
+    def pipeline():
+        _recriar(tiles_dir)
+        _recriar(masks_dir)
+        utils.crop_geotiff(cfg["ortomosaico"], tiles_dir, cfg["tile_size"], cfg["overlap"],
+                           workers=cfg["workers"], completar_bordas=True)
+        _inferir_tiles(model, device, tiles_dir, masks_dir, cfg["threshold"])
+        tiling.reconstruir_geotiff(masks_dir, output_tif, cfg["tile_size"], cfg["overlap"],
+                                   janelado=cfg["janelado"], manifesto=os.path.join(tiles_dir, "manifest.csv"))
+
+    tempos = [_cronometrar(pipeline)[0] for _ in range(cfg["repeticoes"])]
+    return {"tempos": tempos, "latencias": tempos, "unidade_latencia": "execucao",
+            "tiles": len(_listar_tiles(tiles_dir)), "megapixels": cfg["megapixels"]}
+
+
+def _executar_estagio(estagio, cfg):
+    """Ponto de entrada do processo de cada estágio."""
+    for pasta in ("comum", *CAMINHOS[estagio]):
+        sys.path.insert(0, os.path.join(RAIZ, pasta))
+
+    bruto = globals()[f"_bench_{estagio}"](cfg)
+    return resumir(bruto, _pico_rss_mb())
+
+
+def resumir(bruto, pico_rss_mb):
+    """Converte tempos e latências brutos nas métricas reportadas."""
+    tempo_medio = float(np.mean(bruto["tempos"]))
+    latencias_ms = np.asarray(bruto["latencias"]) * 1000
+
+    return {
+        "execucoes": len(bruto["tempos"]),
+        "tempo_medio_s": tempo_medio,
+        "tiles": bruto["tiles"],
+        "megapixels": bruto["megapixels"],
+        "mp_por_s": bruto["megapixels"] / tempo_medio,
+        "tiles_por_s": bruto["tiles"] / tempo_medio,
+        "unidade_latencia": bruto["unidade_latencia"],
+        "latencia_p50_ms": float(np.percentile(latencias_ms, 50)),
+        "latencia_p95_ms": float(np.percentile(latencias_ms, 95)),
+        "pico_rss_mb": pico_rss_mb,
+    }
+
+
+def rodar_estagio(estagio, cfg):
+    """Executa um estágio em um processo novo (spawn) e devolve suas métricas."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_executar_estagio, estagio, cfg).result()
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    ortomosaico = os.path.join(args.workdir, f"ortomosaico_{args.largura}x{args.altura}.tif")
+    if not os.path.exists(ortomosaico):
+        print(f"🛰️ Gerando ortomosaico sintético {args.largura}x{args.altura}px...")
+        gerar_ortomosaico(ortomosaico, args.largura, args.altura, args.seed)
+
+    cfg = {
+        "workdir": args.workdir,
+        "ortomosaico": ortomosaico,
+        "megapixels": args.largura * args.altura / 1e6,
+        "tiles_dir": os.path.join(args.workdir, "tiles"),
+        "masks_dir": os.path.join(args.workdir, "masks_unet"),
+        "tile_size": args.tile_size,
+        "overlap": args.overlap,
+        "workers": args.workers,
+        "repeticoes": args.repeticoes,
+        "modelpath": args.modelpath,
+        "threshold": args.threshold,
+        "janelado": args.janelado,
+    }
+
+    estagios = [e for e in ESTAGIOS if e in args.estagios]
+    resultados = {}
+    for estagio in estagios:
+        # Gera as entradas (sem medir) quando o estágio do qual depende não foi selecionado
+        dependencia = DEPENDENCIAS.get(estagio)
+        if dependencia and dependencia not in resultados:
+            cadeia = [dependencia]
+            while DEPENDENCIAS.get(cadeia[-1]) and DEPENDENCIAS[cadeia[-1]] not in resultados:
+                cadeia.append(DEPENDENCIAS[cadeia[-1]])
+            for preparo in reversed(cadeia):
+                print(f"⚙️ Preparando entradas com o estágio {preparo}...")
+                rodar_estagio(preparo, dict(cfg, repeticoes=1))
+
+        print(f"⏱️ Medindo {estagio}...")
+        resultados[estagio] = rodar_estagio(estagio, cfg)
+        r = resultados[estagio]
+        print(f"📘 {estagio}: {r['mp_por_s']:.2f} MP/s | {r['tiles_por_s']:.2f} tiles/s | "
+              f"p50={r['latencia_p50_ms']:.1f}ms p95={r['latencia_p95_ms']:.1f}ms ({r['unidade_latencia']}) | "
+              f"RSS={r['pico_rss_mb'] or 0:.0f}MB")
+
+    relatorio = {
+        "commit": _commit_atual(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "ambiente": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {k: cfg[k] for k in ("tile_size", "overlap", "workers", "repeticoes", "modelpath",
+                                       "threshold", "janelado")} | {"largura": args.largura, "altura": args.altura},
+        "estagios": resultados,
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(relatorio, f, indent=2)
+    print(f"✅ Resultados salvos em: {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dos estágios do pipeline em um ortomosaico sintético")
+    parser.add_argument("--largura", type=int, default=2048, help="Largura do ortomosaico sintético (px)")
+    parser.add_argument("--altura", type=int, default=2048, help="Altura do ortomosaico sintético (px)")
+    parser.add_argument("--tile-size", type=int, default=512, help="Tamanho dos tiles (px)")
+    parser.add_argument("--overlap", type=float, default=0.2, help="Sobreposição entre tiles")
+    parser.add_argument("--workers", type=int, default=1, help="Processos usados no tiling e no GLI")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Execuções medidas de cada estágio")
+    parser.add_argument("--estagios", nargs="+", choices=ESTAGIOS, default=list(ESTAGIOS), help="Estágios a medir")
+    parser.add_argument("--modelpath", default=None, help="Modelo treinado (.pth). Sem ele, usa uma U-Net com pesos aleatórios")
+    parser.add_argument("--threshold", type=float, default=0.59, help="Limiar para binarização das máscaras")
+    parser.add_argument("--janelado", action="store_true", help="Reconstrói o mosaico no modo janelado")
+    parser.add_argument("--seed", type=int, default=0, help="Semente do ortomosaico sintético")
+    parser.add_argument("--workdir", default="bench_work", help="Diretório de trabalho (ortomosaico, tiles e máscaras)")
+    parser.add_argument("--output", default="benchmark.json", help="Arquivo JSON de resultados")
+
+    args = parser.parse_args()
+    benchmark(args)
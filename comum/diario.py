@@ -0,0 +1,155 @@
+import os
+import json
+import hashlib
+import threading
+
+
+# ============================================================
+# Diário de jobs retomáveis
+# Comentários
+# Cada tile concluído é registrado (id, impressão digital da entrada) em um arquivo
+# JSON lines cuja primeira linha guarda os parâmetros do job. Ao rodar de novo com
+# os mesmos parâmetros, os tiles já registrados (e cuja saída existe) são pulados;
+# com parâmetros diferentes o diário é descartado e o job começa do zero.
+# As saídas são gravadas em um arquivo temporário e renomeadas (escrita atômica),
+# então uma interrupção nunca deixa um arquivo parcial com o nome final.
+# O índice de conteúdo (IndiceConteudo) guarda o hash dos pixels de cada janela: quando
+# o ortomosaico é atualizado, só as janelas cujo conteúdo mudou precisam ser refeitas.
+# ============================================================
+
+NOME_DIARIO = ".diario.jsonl"
+NOME_INDICE = "indice_tiles.json"
+
+
+def impressao_digital(path):
+    """
+    Identificação barata do conteúdo de um arquivo (tamanho + data de modificação,
+    como no make/rsync), sem precisar ler o arquivo inteiro.
+    """
+    st = os.stat(path)
+    return hashlib.blake2b(f"{st.st_size}:{st.st_mtime_ns}".encode(), digest_size=8).hexdigest()
+
+
+def hash_conteudo(dados):
+    """Hash dos bytes de um array (ex.: os pixels de uma janela do ortomosaico)."""
+    return hashlib.blake2b(dados.tobytes(), digest_size=16).hexdigest()
+
+
+def escrever_atomico(path, escrever):
+    """Chama escrever(temporario) e renomeia o temporário para path."""
+    temporario = f"{path}.tmp"
+    try:
+        escrever(temporario)
+        os.replace(temporario, path)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+class Diario:
+    """Registro dos tiles concluídos de um job. Seguro entre threads."""
+
+    def __init__(self, path, parametros):
+        """
+        Args:
+            path (str): Arquivo do diário (JSON lines).
+            parametros (dict): Parâmetros do job (serializáveis em JSON). Um diário gravado
+                com parâmetros diferentes é descartado.
+        """
+        self.path = path
+        self.parametros = json.loads(json.dumps(parametros))  # tuplas → listas, como no arquivo
+        self.concluidos = {}  # tile -> impressão digital da entrada
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            self._carregar()
+
+        # Regrava o diário (cabeçalho + registros válidos): descarta uma última linha
+        # incompleta deixada por uma interrupção antes de voltar a acrescentar linhas
+        def escrever(temporario):
+            with open(temporario, "w") as f:
+                f.write(json.dumps({"parametros": self.parametros}) + "\n")
+                for tile, entrada in self.concluidos.items():
+                    f.write(json.dumps({"tile": tile, "entrada": entrada}) + "\n")
+
+        escrever_atomico(path, escrever)
+        self._arquivo = open(path, "a")
+
+    def _carregar(self):
+        with open(self.path) as f:
+            linhas = f.read().splitlines()
+
+        try:
+            cabecalho = json.loads(linhas[0]) if linhas else {}
+        except json.JSONDecodeError:
+            cabecalho = {}
+        if cabecalho.get("parametros") != self.parametros:
+            print(f"⚠️ Parâmetros diferentes dos registrados em {self.path} — o job começa do zero.")
+            return
+
+        for linha in linhas[1:]:
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                break  # linha incompleta: o job foi interrompido durante a escrita
+            self.concluidos[registro["tile"]] = registro["entrada"]
+
+    def concluido(self, tile, entrada, saida=None):
+        """True se o tile foi registrado com a mesma entrada e a saída (se informada) existe."""
+        return self.concluidos.get(tile) == entrada and (saida is None or os.path.exists(saida))
+
+    def registrar(self, tile, entrada):
+        """Registra um tile concluído. Chame depois que a saída foi gravada."""
+        with self._lock:
+            self._arquivo.write(json.dumps({"tile": tile, "entrada": entrada}) + "\n")
+            self._arquivo.flush()
+            self.concluidos[tile] = entrada
+
+    def fechar(self):
+        if self._arquivo:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+class IndiceConteudo:
+    """Hashes de conteúdo por janela gravados por uma execução anterior."""
+
+    def __init__(self, path, parametros):
+        """
+        Args:
+            path (str): Arquivo JSON do índice.
+            parametros (dict): Parâmetros que definem a grade e o resultado de cada janela.
+                Um índice gravado com parâmetros diferentes é ignorado.
+        """
+        self.path = path
+        self.parametros = json.loads(json.dumps(parametros))
+        self.anteriores = {}  # janela -> hash
+
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    dados = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                dados = {}
+            if dados.get("parametros") == self.parametros:
+                self.anteriores = dados.get("janelas", {})
+            else:
+                print(f"⚠️ Parâmetros diferentes dos registrados em {path} — todas as janelas serão refeitas.")
+
+    def inalterada(self, janela, hash_atual):
+        return self.anteriores.get(janela) == hash_atual
+
+    def salvar(self, hashes):
+        """Grava o índice (escrita atômica) com os hashes atuais de todas as janelas."""
+        def escrever(temporario):
+            with open(temporario, "w") as f:
+                json.dump({"parametros": self.parametros, "janelas": hashes}, f)
+
+        escrever_atomico(self.path, escrever)
@@ -0,0 +1,71 @@
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+
+# ============================================================
+# Grade de tiles
+# Comentários
+# Regra única de posicionamento dos tiles, usada pelo tiling em disco (1-Tiling),
+# pelo manifest.csv e pela segmentação direta do ortomosaico (3-Neural_Network):
+# todos precisam gerar exatamente as mesmas janelas para os mesmos parâmetros.
+# ============================================================
+
+def posicoes_grade(tamanho, tile_size, stride, completar_bordas):
+    """
+    Posições iniciais dos tiles ao longo de um eixo.
+    Com completar_bordas=True, acrescenta um tile extra (que ultrapassa o raster e
+    será preenchido com zeros) para cobrir a faixa final que não cabe em um tile inteiro.
+    """
+    posicoes = list(range(0, tamanho - tile_size + 1, stride))
+
+    if completar_bordas:
+        if not posicoes:
+            posicoes = [0]
+        elif posicoes[-1] + tile_size < tamanho:
+            posicoes.append(posicoes[-1] + stride)
+
+    return posicoes
+
+
+# ============================================================
+# Fração de pixels válidos de um tile
+# Comentários
+# Usada para não gravar (1-Tiling) ou não segmentar (3-Neural_Network) tiles quase
+# só de nodata: a máscara do dataset (nodata / banda alfa) é lida em resolução
+# reduzida e a parte do tile fora do raster (padding) conta como inválida.
+# ============================================================
+
+FRACAO_VALIDA_MINIMA = 0.01
+
+
+def mascara_valida(src, window, fator=8):
+    """
+    Máscara booleana dos pixels válidos da parte da janela dentro do raster, lida em
+    resolução reduzida por `fator`.
+
+    Returns:
+        (validos, recorte, area): a máscara, a janela limitada ao raster e a fração da
+        janela que ela ocupa. Janelas inteiramente fora do raster retornam (None, None, 0.0).
+    """
+    x, y = int(window.col_off), int(window.row_off)
+    w, h = min(int(window.width), src.width - x), min(int(window.height), src.height - y)
+    if w <= 0 or h <= 0:
+        return None, None, 0.0
+
+    recorte = Window(x, y, w, h)
+    forma = (max(1, h // fator), max(1, w // fator))
+    validos = src.dataset_mask(window=recorte, out_shape=forma, resampling=Resampling.nearest) > 0
+    return validos, recorte, w * h / (window.width * window.height)
+
+
+def fracao_valida(src, window, fator=8):
+    """Fração de pixels válidos da janela (padding conta como inválido)."""
+    validos, _, area = mascara_valida(src, window, fator)
+    return 0.0 if validos is None else float(validos.mean()) * area
+
+
+def adicionar_argumentos_vazios(parser, ajuda):
+    """Adiciona --pular-vazios (com o texto de ajuda do estágio) e --fracao-valida-minima a um ArgumentParser."""
+    parser.add_argument("--pular-vazios", action="store_true", help=ajuda)
+    parser.add_argument("--fracao-valida-minima", type=float, default=FRACAO_VALIDA_MINIMA,
+                        help=f"Fração mínima de pixels válidos (não nodata) do tile. Padrão = {FRACAO_VALIDA_MINIMA}.")
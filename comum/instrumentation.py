@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+# ============================================================
+# Instrumentação dos estágios do pipeline
+# Comentários
+# Cronômetros por etapa (leitura, decodificacao, gli, forward, limiar, codificacao,
+# escrita) e contadores (bytes lidos/escritos, tiles). Cada medição pode ser gravada
+# em um log JSON lines e, ao final, um resumo é gravado no log e, opcionalmente, em
+# um arquivo texto no formato do Prometheus (textfile collector do node_exporter).
+# ============================================================
+
+PREFIXO_PROMETHEUS = "segmentacao"
+
+
+class Metricas:
+    """Acumula tempos por etapa e contadores de um estágio. Seguro entre threads."""
+
+    def __init__(self, estagio, log_path=None, prometheus_path=None):
+        """
+        Args:
+            estagio (str): Nome do estágio (ex.: "tiling", "gli", "inferencia").
+            log_path (str, opcional): Arquivo JSON lines; cada medição vira uma linha.
+            prometheus_path (str, opcional): Arquivo texto (formato Prometheus) gravado em finalizar().
+        """
+        self.estagio = estagio
+        self.log_path = log_path
+        self.prometheus_path = prometheus_path
+        self.etapas = {}  # etapa -> [chamadas, total_s, max_s]
+        self.contadores = {}
+        self._lock = threading.Lock()
+        self._log = open(log_path, "a") if log_path else None
+
+    @contextmanager
+    def medir(self, etapa, **campos):
+        """Cronometra o bloco como uma chamada de `etapa`. Campos extras vão para o log."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._registrar(etapa, time.perf_counter() - inicio, campos)
+
+    def _registrar(self, etapa, duracao, campos):
+        with self._lock:
+            acumulado = self.etapas.setdefault(etapa, [0, 0.0, 0.0])
+            acumulado[0] += 1
+            acumulado[1] += duracao
+            acumulado[2] = max(acumulado[2], duracao)
+
+            if self._log:
+                linha = {"ts": time.time(), "estagio": self.estagio, "etapa": etapa, "duracao_s": duracao, **campos}
+                self._log.write(json.dumps(linha) + "\n")
+
+    def contar(self, nome, valor=1):
+        with self._lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + valor
+
+    def resumo(self):
+        """Totais por etapa e contadores acumulados até o momento."""
+        with self._lock:
+            etapas = {
+                etapa: {"chamadas": n, "total_s": total, "media_ms": total / n * 1000, "max_ms": maximo * 1000}
+                for etapa, (n, total, maximo) in self.etapas.items()
+            }
+            return {"estagio": self.estagio, "etapas": etapas, "contadores": dict(self.contadores)}
+
+    def mesclar(self, resumo):
+        """Soma o resumo de outra instância (ex.: de um processo do pool) a esta."""
+        with self._lock:
+            for etapa, r in resumo["etapas"].items():
+                acumulado = self.etapas.setdefault(etapa, [0, 0.0, 0.0])
+                acumulado[0] += r["chamadas"]
+                acumulado[1] += r["total_s"]
+                acumulado[2] = max(acumulado[2], r["max_ms"] / 1000)
+            for nome, valor in resumo["contadores"].items():
+                self.contadores[nome] = self.contadores.get(nome, 0) + valor
+
+    def finalizar(self):
+        """Grava o resumo no log e o arquivo Prometheus, e fecha o log."""
+        resumo = self.resumo()
+        if self._log:
+            self._log.write(json.dumps({"ts": time.time(), "tipo": "resumo", **resumo}) + "\n")
+            self._log.close()
+            self._log = None
+        if self.prometheus_path:
+            self.escrever_prometheus(self.prometheus_path, resumo)
+        return resumo
+
+    def escrever_prometheus(self, path, resumo=None):
+        """Grava as métricas no formato texto do Prometheus (escrita atômica: arquivo temporário + rename)."""
+        resumo = resumo or self.resumo()
+        rotulo = f'estagio="{self.estagio}"'
+        p = PREFIXO_PROMETHEUS
+
+        linhas = [
+            f"# HELP {p}_etapa_segundos_total Tempo acumulado em cada etapa.",
+            f"# TYPE {p}_etapa_segundos_total counter",
+        ]
+        linhas += [f'{p}_etapa_segundos_total{{{rotulo},etapa="{e}"}} {r["total_s"]:.6f}' for e, r in resumo["etapas"].items()]
+        linhas += [
+            f"# HELP {p}_etapa_chamadas_total Número de execuções de cada etapa.",
+            f"# TYPE {p}_etapa_chamadas_total counter",
+        ]
+        linhas += [f'{p}_etapa_chamadas_total{{{rotulo},etapa="{e}"}} {r["chamadas"]}' for e, r in resumo["etapas"].items()]
+        linhas += [
+            f"# HELP {p}_etapa_maximo_segundos Maior duração de uma execução de cada etapa.",
+            f"# TYPE {p}_etapa_maximo_segundos gauge",
+        ]
+        linhas += [f'{p}_etapa_maximo_segundos{{{rotulo},etapa="{e}"}} {r["max_ms"] / 1000:.6f}' for e, r in resumo["etapas"].items()]
+        for nome, valor in resumo["contadores"].items():
+            linhas += [f"# TYPE {p}_{nome}_total counter", f"{p}_{nome}_total{{{rotulo}}} {valor}"]
+
+        temporario = f"{path}.tmp"
+        with open(temporario, "w") as f:
+            f.write("\n".join(linhas) + "\n")
+        os.replace(temporario, path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.finalizar()
+
+    def __getstate__(self):
+        # Cópias enviadas a outros processos começam vazias e sem arquivos: os processos
+        # devolvem resumo() e o processo principal chama mesclar()
+        return {"estagio": self.estagio}
+
+    def __setstate__(self, estado):
+        self.__init__(estado["estagio"])
+
+
+def adicionar_argumentos(parser):
+    """Adiciona --metricas-log e --metricas-prometheus a um ArgumentParser."""
+    parser.add_argument("--metricas-log", default=None, help="Arquivo JSON lines com o tempo de cada etapa (leitura, decodificação, forward, escrita...)")
+    parser.add_argument("--metricas-prometheus", default=None, help="Arquivo texto no formato Prometheus com o resumo das métricas")
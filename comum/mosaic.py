@@ -0,0 +1,210 @@
+import numpy as np
+from rasterio.windows import Window
+
+from instrumentation import Metricas
+
+
+# ============================================================
+# Mesclagem de tiles sobrepostos
+# Comentários
+# Em vez de sobrescrever pixels na ordem em que os tiles chegam, as probabilidades
+# de cada tile são somadas com um peso (janela cosseno, maior no centro do tile) e
+# o limiar só é aplicado no final, o que elimina as costuras entre tiles.
+# Como os tiles chegam em ordem de varredura (linha a linha), basta manter uma
+# faixa horizontal com a altura de um tile: as linhas acima do tile atual já estão
+# completas e são binarizadas e escritas no GeoTIFF de saída.
+# Usado pela segmentação direta do ortomosaico (3-Neural_Network) e pela
+# reconstrução a partir dos tiles de máscara (4-Evaluation), para que as duas
+# ferramentas tratem as sobreposições do mesmo jeito.
+# ============================================================
+
+def janela_cosseno(tile_size, minimo=1e-3):
+    """
+    Pesos 2D (tile_size, tile_size) em float32: 1 no centro, decaindo em cosseno até as bordas.
+    O valor mínimo evita peso nulo nas bordas do mosaico, onde só há um tile.
+    """
+    t = (np.arange(tile_size, dtype=np.float32) + 0.5) / tile_size
+    w = 0.5 - 0.5 * np.cos(2 * np.pi * t)
+    return np.maximum(np.outer(w, w), minimo).astype(np.float32)
+
+
+class AcumuladorSobreposicao:
+    """Acumula probabilidades ponderadas por tile e escreve a máscara binarizada em faixas."""
+
+    def __init__(self, dst, tile_size, threshold=0.59, pesos=None, metricas=None):
+        """
+        Args:
+            dst (rasterio.DatasetWriter): GeoTIFF de saída (uma banda uint8).
+            tile_size (int): Tamanho (em pixels) dos tiles.
+            threshold (float): Limiar aplicado à média ponderada das probabilidades.
+            pesos (np.ndarray, opcional): Pesos (tile_size, tile_size). Padrão = janela_cosseno().
+            metricas (Metricas, opcional): Recebe os tempos das etapas "limiar" e "escrita".
+        """
+        self.dst = dst
+        self.width, self.height = dst.width, dst.height
+        self.threshold = threshold
+        self.metricas = metricas or Metricas("inferencia")
+        self.pesos = janela_cosseno(tile_size) if pesos is None else pesos.astype(np.float32)
+
+        self.altura = tile_size
+        self.topo = 0
+        self.soma = np.zeros((self.altura, self.width), dtype=np.float32)
+        self.peso = np.zeros((self.altura, self.width), dtype=np.float32)
+
+    def adicionar(self, window, prob):
+        """
+        Soma as probabilidades (h, w) de um tile na sua janela. Tiles devem chegar em ordem de linha.
+        O padding de tiles que ultrapassam o raster é descartado.
+        """
+        x, y = int(window.col_off), int(window.row_off)
+        h, w = min(prob.shape[0], self.height - y), min(prob.shape[1], self.width - x)
+        prob = prob[:h, :w]
+
+        if y < self.topo:
+            raise ValueError("❌ Os tiles precisam chegar em ordem crescente de linha (varredura).")
+        if h > self.altura:
+            raise ValueError(f"❌ Tile com altura {h} maior que a faixa do acumulador ({self.altura}).")
+
+        if y + h > self.topo + self.altura:
+            self._descarregar(y)
+
+        r = y - self.topo
+        pesos = self.pesos[:h, :w]
+        self.soma[r:r + h, x:x + w] += prob * pesos
+        self.peso[r:r + h, x:x + w] += pesos
+
+    def finalizar(self):
+        """Escreve as linhas restantes da faixa."""
+        self._descarregar(min(self.topo + self.altura, self.height))
+
+    def _descarregar(self, ate):
+        """Binariza e escreve as linhas [topo, ate), que não recebem mais contribuições."""
+        n = min(ate - self.topo, self.altura)
+        if n > 0:
+            with self.metricas.medir("limiar"):
+                media = self.soma[:n] / np.maximum(self.peso[:n], 1e-12)
+                mask = ((media > self.threshold) & (self.peso[:n] > 0)).astype(np.uint8) * 255
+            self._escrever(self.topo, mask)
+
+            # Desloca a faixa para baixo
+            self.soma[:-n] = self.soma[n:]
+            self.peso[:-n] = self.peso[n:]
+            self.soma[-n:] = 0
+            self.peso[-n:] = 0
+
+        self.topo = ate
+
+    def _escrever(self, y, mask):
+        n = min(mask.shape[0], self.height - y)
+        if n > 0:
+            with self.metricas.medir("escrita", linha=y):
+                self.dst.write(mask[:n], 1, window=Window(0, y, self.width, n))
+
+
+def intersecao(a, b):
+    """Interseção (x0, y0, x1, y1) de duas janelas, ou None se não se sobrepõem."""
+    x0, y0 = max(a.col_off, b.col_off), max(a.row_off, b.row_off)
+    x1 = min(a.col_off + a.width, b.col_off + b.width)
+    y1 = min(a.row_off + a.height, b.row_off + b.height)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return int(x0), int(y0), int(x1), int(y1)
+
+
+class RemendoMosaico:
+    """
+    Reescreve apenas algumas regiões de um mosaico existente. Cada região é recombinada
+    a partir de todos os tiles que a cobrem, com as mesmas operações do
+    AcumuladorSobreposicao (cosseno) ou da sobrescrita em ordem de varredura (nenhuma),
+    então o resultado é idêntico ao de segmentar o ortomosaico inteiro de novo.
+    """
+
+    def __init__(self, dst, regioes, tile_size, threshold=0.59, mesclagem="cosseno", pesos=None, metricas=None):
+        """
+        Args:
+            dst (rasterio.DatasetWriter): Mosaico existente, aberto em modo "r+".
+            regioes (list[Window]): Regiões a reescrever, limitadas ao raster.
+            tile_size (int): Tamanho (em pixels) dos tiles.
+            threshold (float): Limiar aplicado à média ponderada das probabilidades (cosseno).
+            mesclagem (str): "cosseno" (recebe probabilidades) ou "nenhuma" (recebe máscaras 0/255).
+            pesos (np.ndarray, opcional): Pesos (tile_size, tile_size). Padrão = janela_cosseno().
+            metricas (Metricas, opcional): Recebe os tempos das etapas "limiar" e "escrita".
+        """
+        self.dst = dst
+        self.regioes = regioes
+        self.threshold = threshold
+        self.mesclagem = mesclagem
+        self.metricas = metricas or Metricas("inferencia")
+        self.pesos = janela_cosseno(tile_size) if pesos is None else pesos.astype(np.float32)
+        self.pendentes = [0] * len(regioes)
+        self.buffers = {}
+        self.escritas = set()
+
+    def preparar(self, janelas):
+        """
+        Registra os tiles (em ordem de varredura) que serão adicionados e devolve apenas
+        os que cobrem alguma região. Regiões sem nenhum tile ficam com a máscara 0.
+        """
+        necessarias = []
+        for window in janelas:
+            cobertas = [i for i, regiao in enumerate(self.regioes) if intersecao(window, regiao)]
+            for i in cobertas:
+                self.pendentes[i] += 1
+            if cobertas:
+                necessarias.append(window)
+        return necessarias
+
+    def _buffer(self, i):
+        if i not in self.buffers:
+            h, w = int(self.regioes[i].height), int(self.regioes[i].width)
+            if self.mesclagem == "cosseno":
+                self.buffers[i] = (np.zeros((h, w), dtype=np.float32), np.zeros((h, w), dtype=np.float32))
+            else:
+                self.buffers[i] = np.zeros((h, w), dtype=np.uint8)
+        return self.buffers[i]
+
+    def adicionar(self, window, pred):
+        """Soma (cosseno) ou sobrescreve (nenhuma) o tile nas regiões que ele cobre. Tiles em ordem de varredura."""
+        for i, regiao in enumerate(self.regioes):
+            inter = intersecao(window, regiao)
+            if inter is None or i in self.escritas:
+                continue
+
+            x0, y0, x1, y1 = inter
+            tile = (slice(y0 - int(window.row_off), y1 - int(window.row_off)),
+                    slice(x0 - int(window.col_off), x1 - int(window.col_off)))
+            reg = (slice(y0 - int(regiao.row_off), y1 - int(regiao.row_off)),
+                   slice(x0 - int(regiao.col_off), x1 - int(regiao.col_off)))
+
+            if self.mesclagem == "cosseno":
+                soma, peso = self._buffer(i)
+                pesos = self.pesos[tile]
+                soma[reg] += pred[tile] * pesos
+                peso[reg] += pesos
+            else:
+                self._buffer(i)[reg] = pred[tile]
+
+            self.pendentes[i] -= 1
+            if self.pendentes[i] == 0:
+                self._escrever(i)
+
+    def finalizar(self):
+        """Escreve as regiões que ainda não foram escritas (inclusive as sem nenhum tile)."""
+        for i in range(len(self.regioes)):
+            if i not in self.escritas:
+                self._escrever(i)
+
+    def _escrever(self, i):
+        buffer = self._buffer(i)
+        if self.mesclagem == "cosseno":
+            soma, peso = buffer
+            with self.metricas.medir("limiar"):
+                media = soma / np.maximum(peso, 1e-12)
+                mask = ((media > self.threshold) & (peso > 0)).astype(np.uint8) * 255
+        else:
+            mask = buffer
+
+        with self.metricas.medir("escrita", linha=int(self.regioes[i].row_off)):
+            self.dst.write(mask, 1, window=self.regioes[i])
+        self.escritas.add(i)
+        del self.buffers[i]
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Mesmo esquema do benchmarks/: as pastas dos módulos testados entram no sys.path
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for pasta in ("comum", "3-Neural_Network/src", "4-Evaluation"):
+    sys.path.insert(0, os.path.join(RAIZ, pasta))
+
+
+class RasterMemoria:
+    """Substituto em memória de um rasterio.DatasetWriter de uma banda (write com window)."""
+
+    def __init__(self, altura, largura, valor=0):
+        self.height, self.width = altura, largura
+        self.dados = np.full((altura, largura), valor, dtype=np.uint8)
+
+    def write(self, arr, banda, window):
+        x, y = int(window.col_off), int(window.row_off)
+        h, w = int(window.height), int(window.width)
+        self.dados[y:y + h, x:x + w] = arr
+
+
+@pytest.fixture
+def raster_memoria():
+    return RasterMemoria
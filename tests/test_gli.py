@@ -0,0 +1,35 @@
+import importlib.util
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def segmentacao():
+    """utils.py do 2-Segmentation, carregado pelo caminho (o 1-Tiling também tem um utils.py)."""
+    spec = importlib.util.spec_from_file_location("segmentacao_utils", os.path.join(RAIZ, "2-Segmentation", "utils.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def gli_original(image):
+    """GLICalculator.process() da versão original, imagem a imagem em float64."""
+    R, G, B = image[:, :, 0].astype(float), image[:, :, 1].astype(float), image[:, :, 2].astype(float)
+    GLI = (2 * G - R - B) / (2 * G + R + B + 1e-6)
+    return cv2.normalize(GLI, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+
+
+def test_normalizacao_tile_reproduz_a_versao_original(segmentacao):
+    rng = np.random.default_rng(0)
+    lote = rng.integers(0, 256, (4, 256, 256, 3), dtype=np.uint8)
+    lote[1] = 0                      # tile todo preto (min == max)
+    lote[2, :128] = (60, 150, 50)    # metade com a mesma cor
+
+    resultado = segmentacao.GLICalculator("tile").process_batch(lote)
+    for tile, gli in zip(lote, resultado):
+        np.testing.assert_array_equal(gli, gli_original(tile))
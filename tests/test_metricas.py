@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import rasterio
+
+from metricas import MatrizConfusao, avaliar
+
+
+def contagens_referencia(referencia, predicao, validos=None):
+    """Contagens pixel a pixel, sem bincount: (vn, fp, fn, vp)."""
+    if validos is not None:
+        referencia, predicao = referencia[validos], predicao[validos]
+    return (int((~referencia & ~predicao).sum()), int((~referencia & predicao).sum()),
+            int((referencia & ~predicao).sum()), int((referencia & predicao).sum()))
+
+
+def test_matriz_igual_a_contagem_pixel_a_pixel():
+    rng = np.random.default_rng(0)
+    matriz, esperado = MatrizConfusao(), np.zeros(4, dtype=np.int64)
+    for forma in [(7, 11), (32, 32), (1, 5)]:  # janelas de tamanhos diferentes, acumuladas
+        referencia, predicao = rng.random(forma) > 0.4, rng.random(forma) > 0.6
+        validos = rng.random(forma) > 0.2
+        matriz.adicionar(referencia, predicao, validos)
+        esperado += contagens_referencia(referencia, predicao, validos)
+
+    np.testing.assert_array_equal(matriz.contagens, esperado)
+
+    vn, fp, fn, vp = esperado
+    m = matriz.metricas()
+    assert m["iou"] == pytest.approx(vp / (vp + fp + fn))
+    assert m["dice"] == pytest.approx(2 * vp / (2 * vp + fp + fn))
+    assert m["precisao"] == pytest.approx(vp / (vp + fp))
+    assert m["revocacao"] == pytest.approx(vp / (vp + fn))
+    assert m["acuracia"] == pytest.approx((vp + vn) / esperado.sum())
+
+
+def test_soma_de_matrizes_e_metricas_indefinidas():
+    vazia = MatrizConfusao()
+    vazia.adicionar(np.zeros((4, 4), dtype=bool), np.zeros((4, 4), dtype=bool))
+    m = vazia.metricas()
+    assert m["iou"] is None and m["dice"] is None and m["precisao"] is None and m["revocacao"] is None
+    assert m["acuracia"] == 1.0
+
+    total = MatrizConfusao([1, 2, 3, 4])
+    total += MatrizConfusao([10, 20, 30, 40])
+    np.testing.assert_array_equal(total.contagens, [11, 22, 33, 44])
+
+
+def escrever_mascara(path, mascara, **extra):
+    with rasterio.open(path, "w", driver="GTiff", width=mascara.shape[1], height=mascara.shape[0], count=1,
+                       dtype="uint8", **extra) as dst:
+        dst.write(mascara, 1)
+
+
+def test_avaliar_em_tiles_igual_ao_mosaico_inteiro(tmp_path):
+    rng = np.random.default_rng(1)
+    referencia = (rng.random((50, 70)) > 0.5).astype(np.uint8) * 255
+    referencia[:5, :5] = 9  # nodata: fora da contagem
+    unet = np.where(rng.random(referencia.shape) < 0.1, 255 - referencia, referencia).astype(np.uint8)
+    gli = (rng.random(referencia.shape) > 0.5).astype(np.uint8)  # máscara de 1 bit (0/1)
+
+    escrever_mascara(tmp_path / "ref.tif", referencia, nodata=9)
+    escrever_mascara(tmp_path / "unet.tif", unet)
+    escrever_mascara(tmp_path / "gli.tif", gli, nbits=1)
+
+    resultado = avaliar({"unet": str(tmp_path / "unet.tif"), "gli": str(tmp_path / "gli.tif")},
+                        str(tmp_path / "ref.tif"), tile_size=16)
+
+    validos = referencia != 9
+    ref, unet_b, gli_b = referencia > 127, unet > 127, gli > 0
+    for chave, (a, b) in {"unet": (ref, unet_b), "gli": (ref, gli_b), "unet_vs_gli": (unet_b, gli_b)}.items():
+        vn, fp, fn, vp = contagens_referencia(a, b, validos)
+        assert (resultado[chave]["vn"], resultado[chave]["fp"], resultado[chave]["fn"], resultado[chave]["vp"]) == (vn, fp, fn, vp)
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+from rasterio.windows import Window
+
+from mosaic import AcumuladorSobreposicao, RemendoMosaico, janela_cosseno
+from segment_orthomosaic import gerar_janelas
+
+
+def media_ponderada_referencia(janelas, probs, altura, largura, tile_size, threshold):
+    """Mosaico inteiro em memória: soma ponderada na ordem dos tiles e limiar no final."""
+    pesos = janela_cosseno(tile_size)
+    soma = np.zeros((altura, largura), dtype=np.float32)
+    peso = np.zeros((altura, largura), dtype=np.float32)
+    for window, prob in zip(janelas, probs):
+        x, y = int(window.col_off), int(window.row_off)
+        h, w = min(tile_size, altura - y), min(tile_size, largura - x)
+        soma[y:y + h, x:x + w] += prob[:h, :w] * pesos[:h, :w]
+        peso[y:y + h, x:x + w] += pesos[:h, :w]
+    media = soma / np.maximum(peso, 1e-12)
+    return ((media > threshold) & (peso > 0)).astype(np.uint8) * 255
+
+
+@pytest.mark.parametrize("altura,largura", [(40, 56), (37, 61)])
+def test_acumulador_igual_a_media_ponderada_no_mosaico_inteiro(raster_memoria, altura, largura):
+    tile_size = 16
+    janelas = list(gerar_janelas(largura, altura, tile_size, overlap=0.25))
+    rng = np.random.default_rng(0)
+    probs = [rng.random((tile_size, tile_size), dtype=np.float32) for _ in janelas]
+
+    dst = raster_memoria(altura, largura)
+    acumulador = AcumuladorSobreposicao(dst, tile_size, threshold=0.5)
+    for window, prob in zip(janelas, probs):
+        acumulador.adicionar(window, prob)
+    acumulador.finalizar()
+
+    esperado = media_ponderada_referencia(janelas, probs, altura, largura, tile_size, 0.5)
+    np.testing.assert_array_equal(dst.dados, esperado)
+
+
+def test_costura_no_meio_da_sobreposicao(raster_memoria):
+    # Dois tiles de 16 px sobrepostos em 8 colunas: prevalece o tile mais perto do centro
+    dst = raster_memoria(16, 24)
+    acumulador = AcumuladorSobreposicao(dst, 16, threshold=0.5)
+    acumulador.adicionar(Window(0, 0, 16, 16), np.ones((16, 16), dtype=np.float32))
+    acumulador.adicionar(Window(8, 0, 16, 16), np.zeros((16, 16), dtype=np.float32))
+    acumulador.finalizar()
+
+    linha = dst.dados[8]
+    assert (linha[:12] == 255).all()
+    assert (linha[12:] == 0).all()
+    # O padrão se repete em todas as linhas (pesos simétricos)
+    assert (dst.dados == linha).all()
+
+
+def test_acumulador_exige_ordem_de_varredura(raster_memoria):
+    acumulador = AcumuladorSobreposicao(raster_memoria(32, 32), 16)
+    acumulador.adicionar(Window(0, 16, 16, 16), np.zeros((16, 16), dtype=np.float32))
+    with pytest.raises(ValueError):
+        acumulador.adicionar(Window(0, 0, 16, 16), np.zeros((16, 16), dtype=np.float32))
+
+
+@pytest.mark.parametrize("mesclagem", ["cosseno", "nenhuma"])
+def test_remendo_igual_ao_mosaico_completo(raster_memoria, mesclagem):
+    altura, largura, tile_size = 40, 56, 16
+    janelas = list(gerar_janelas(largura, altura, tile_size, overlap=0.25))
+    rng = np.random.default_rng(1)
+    probs = [rng.random((tile_size, tile_size), dtype=np.float32) for _ in janelas]
+    if mesclagem == "nenhuma":
+        probs = [(p > 0.5).astype(np.uint8) * 255 for p in probs]
+
+    completo = raster_memoria(altura, largura)
+    if mesclagem == "cosseno":
+        acumulador = AcumuladorSobreposicao(completo, tile_size, threshold=0.5)
+        for window, prob in zip(janelas, probs):
+            acumulador.adicionar(window, prob)
+        acumulador.finalizar()
+    else:
+        for window, mask in zip(janelas, probs):
+            x, y = int(window.col_off), int(window.row_off)
+            h, w = min(tile_size, altura - y), min(tile_size, largura - x)
+            completo.dados[y:y + h, x:x + w] = mask[:h, :w]
+
+    # Regiões a reescrever: uma no interior e uma na borda do raster
+    regioes = [Window(12, 12, 12, 12), Window(48, 36, 8, 4)]
+    remendado = raster_memoria(altura, largura, valor=7)
+    remendo = RemendoMosaico(remendado, regioes, tile_size, threshold=0.5, mesclagem=mesclagem)
+    necessarias = {w.flatten() for w in remendo.preparar(janelas)}
+    for window, prob in zip(janelas, probs):
+        if window.flatten() in necessarias:
+            remendo.adicionar(window, prob)
+    remendo.finalizar()
+
+    for regiao in regioes:
+        x, y, w, h = int(regiao.col_off), int(regiao.row_off), int(regiao.width), int(regiao.height)
+        np.testing.assert_array_equal(remendado.dados[y:y + h, x:x + w], completo.dados[y:y + h, x:x + w])
+    # Fora das regiões o mosaico existente não é tocado
+    intocado = np.ones((altura, largura), dtype=bool)
+    for regiao in regioes:
+        intocado[int(regiao.row_off):int(regiao.row_off + regiao.height), int(regiao.col_off):int(regiao.col_off + regiao.width)] = False
+    assert (remendado.dados[intocado] == 7).all()
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import torch
+from rasterio.io import MemoryFile
+
+from inference_engine import BatchInferenceEngine
+from piramide import RefinamentoPiramide, probabilidade_engine, probabilidade_modelo
+from segment_orthomosaic import gerar_janelas
+
+
+class ModeloVerde(torch.nn.Module):
+    """Substituto confiante da U-Net: vegetação onde o verde domina; termina em sigmoide, como UNet.forward."""
+
+    def forward(self, x):
+        return torch.sigmoid((x[:, 1:2] - x[:, 0:1] - 0.2) * 50)
+
+
+@pytest.fixture
+def ortomosaico():
+    """Metade esquerda verde (vegetação), metade direita solo."""
+    altura, largura = 256, 384
+    img = np.empty((3, altura, largura), dtype=np.uint8)
+    img[:, :, :192] = np.array([60, 150, 50], dtype=np.uint8)[:, None, None]
+    img[:, :, 192:] = np.array([120, 90, 60], dtype=np.uint8)[:, None, None]
+    with MemoryFile() as mem:
+        with mem.open(driver="GTiff", width=largura, height=altura, count=3, dtype="uint8") as dst:
+            dst.write(img)
+        with mem.open() as src:
+            yield src
+
+
+def test_conversao_de_escala_ida_e_volta():
+    p = np.linspace(0, 1, 11)
+    np.testing.assert_allclose(probabilidade_modelo(probabilidade_engine(p)), p, atol=1e-6)
+
+
+def test_tiles_homogeneos_nao_sao_refinados(ortomosaico):
+    tile_size, threshold = 32, 0.59
+    engine = BatchInferenceEngine(ModeloVerde().eval(), torch.device("cpu"), batch_size=4, threshold=threshold)
+    piramide = RefinamentoPiramide(fator=4)  # margem e fração incerta padrão
+
+    mapa = piramide.mapa_grosso(engine, ortomosaico, tile_size)
+    janelas = list(gerar_janelas(ortomosaico.width, ortomosaico.height, tile_size, overlap=0.0))
+    decisoes = {(int(w.col_off), int(w.row_off)): piramide.decidir(mapa, w, threshold) for w in janelas}
+
+    refinados = {x for (x, _), (refinar, _) in decisoes.items() if refinar}
+    assert refinados, "os tiles na borda entre vegetação e solo precisam da U-Net"
+    assert len(refinados) < len(set(x for x, _ in decisoes)), "tiles homogêneos devem ser pulados"
+    # Só as colunas de tiles vizinhas à borda (x = 192) são refinadas
+    assert refinados <= {160, 192}
+
+    for (x, _), (refinar, valor) in decisoes.items():
+        if not refinar:
+            # O valor constante fica do lado certo do limiar, na escala do engine
+            assert (valor > threshold) == (x < 192)
@@ -0,0 +1,43 @@
+import numpy as np
+import rasterio
+
+from tiling import reconstruir_geotiff
+
+
+def escrever_tiles(pasta, mosaico, tile_size, stride, invertidos=()):
+    """Grava tile_X_Y.tif recortados do mosaico; os tiles em `invertidos` têm a máscara invertida."""
+    altura, largura = mosaico.shape
+    for y in range(0, altura - tile_size + 1, stride):
+        for x in range(0, largura - tile_size + 1, stride):
+            tile = mosaico[y:y + tile_size, x:x + tile_size]
+            if (x, y) in invertidos:
+                tile = 255 - tile
+            with rasterio.open(pasta / f"tile_{x}_{y}.tif", "w", driver="GTiff", width=tile_size, height=tile_size,
+                               count=1, dtype="uint8") as dst:
+                dst.write(tile, 1)
+
+
+def test_reconstrucao_mesclada_recupera_o_mosaico(tmp_path):
+    rng = np.random.default_rng(0)
+    mosaico = ((rng.random((5, 5)) > 0.5).repeat(8, 0).repeat(8, 1) * 255).astype(np.uint8)  # 40 x 40
+    escrever_tiles(tmp_path, mosaico, tile_size=16, stride=12)
+
+    for janelado in (False, True):
+        saida = tmp_path / f"mosaico_{janelado}.tif"
+        reconstruir_geotiff(str(tmp_path), str(saida), tile_size=16, overlap=0.25, janelado=janelado)
+        with rasterio.open(saida) as src:
+            np.testing.assert_array_equal(src.read(1), mosaico)
+
+
+def test_costura_no_meio_da_sobreposicao(tmp_path):
+    # Um tile discordante sobreposto aos vizinhos nas linhas/colunas 12–15: com a mesclagem
+    # cosseno a costura fica no meio da sobreposição (14), qualquer que seja a ordem dos arquivos
+    mosaico = np.zeros((28, 28), dtype=np.uint8)
+    escrever_tiles(tmp_path, mosaico, tile_size=16, stride=12, invertidos={(12, 12)})
+
+    reconstruir_geotiff(str(tmp_path), str(tmp_path / "mosaico.tif"), tile_size=16, overlap=0.25)
+    with rasterio.open(tmp_path / "mosaico.tif") as src:
+        resultado = src.read(1)
+
+    assert (resultado[14:, 14:] == 255).all()
+    assert resultado[:14].max() == 0 and resultado[:, :14].max() == 0
@@ -0,0 +1,59 @@
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from segment_orthomosaic import gerar_janelas
+from tiling import reconstruir_geotiff
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def utils_tiling():
+    """utils.py do 1-Tiling, carregado pelo caminho (o 2-Segmentation também tem um utils.py)."""
+    spec = importlib.util.spec_from_file_location("tiling_utils", os.path.join(RAIZ, "1-Tiling", "utils.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def escrever_raster(path, dados, **extra):
+    with rasterio.open(path, "w", driver="GTiff", width=dados.shape[2], height=dados.shape[1], count=dados.shape[0],
+                       dtype="uint8", **extra) as dst:
+        dst.write(dados)
+
+
+@pytest.mark.parametrize("completar_bordas", [False, True])
+def test_tiling_em_disco_e_streaming_usam_a_mesma_grade(utils_tiling, tmp_path, completar_bordas):
+    escrever_raster(tmp_path / "orto.tif", np.ones((3, 50, 70), dtype=np.uint8))
+    utils_tiling.crop_geotiff(str(tmp_path / "orto.tif"), str(tmp_path / "tiles"), tile_size=16, overlap=0.25,
+                        completar_bordas=completar_bordas)
+
+    em_disco = {f for f in os.listdir(tmp_path / "tiles") if f.endswith(".tif")}
+    streaming = {f"tile_{int(w.col_off)}_{int(w.row_off)}.tif"
+                 for w in gerar_janelas(70, 50, 16, 0.25, completar_bordas=completar_bordas)}
+    assert em_disco == streaming
+
+
+@pytest.mark.parametrize("janelado", [False, True])
+def test_reconstrucao_pelo_manifesto_mantem_a_extensao_com_tiles_pulados(utils_tiling, tmp_path, janelado):
+    # Terço direito sem dados: a coluna de tiles da borda direita é pulada e fica fora do manifesto
+    mascara = np.full((1, 60, 60), 255, dtype=np.uint8)
+    mascara[:, :, 40:] = 0
+    escrever_raster(tmp_path / "mascara.tif", mascara, nodata=0, crs="EPSG:31983",
+                    transform=from_origin(500000, 7000000, 0.5, 0.5))
+    utils_tiling.crop_geotiff(str(tmp_path / "mascara.tif"), str(tmp_path / "tiles"), tile_size=16, overlap=0.25,
+                              completar_bordas=True, fracao_valida_minima=0.01)
+    assert not (tmp_path / "tiles" / "tile_48_0.tif").exists()
+
+    saida = tmp_path / "mosaico.tif"
+    reconstruir_geotiff(str(tmp_path / "tiles"), str(saida), tile_size=16, overlap=0.25, janelado=janelado,
+                        manifesto=str(tmp_path / "tiles" / "manifest.csv"))
+    with rasterio.open(tmp_path / "mascara.tif") as entrada, rasterio.open(saida) as src:
+        assert (src.width, src.height) == (entrada.width, entrada.height)
+        assert src.transform == entrada.transform
+        np.testing.assert_array_equal(src.read(1), mascara[0])